@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the analysis BIOM table build
+
+Compares loading and merging the tables one by one against
+qiita_db.analysis_biom.build_tables, on synthetic tables. By default it
+uses 50 studies with 10,000 samples in total.
+
+Usage: python benchmarks/bench_analysis_biom.py [n_studies] [n_samples]
+"""
+from __future__ import division
+from sys import argv
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from biom import Table
+from biom.util import biom_open
+
+from qiita_db.analysis_biom import load_filtered_table, build_tables
+
+
+def make_tables(out_dir, n_studies, n_samples, n_obs=5000, density=0.02):
+    rand = np.random.RandomState(0)
+    obs_ids = ['OTU%d' % i for i in range(n_obs)]
+    specs = []
+    per_study = n_samples // n_studies
+    for s in range(n_studies):
+        # each study sees a random half of the OTUs
+        study_obs = sorted(rand.choice(n_obs, n_obs // 2, replace=False))
+        samp_ids = ['%d.S%d' % (s, i) for i in range(per_study)]
+        data = sparse_random(len(study_obs), per_study, density=density,
+                             random_state=rand, format='csr') * 100
+        table = Table(data.ceil(), [obs_ids[o] for o in study_obs], samp_ids)
+        fp = join(out_dir, '%d.biom' % s)
+        with biom_open(fp, 'w') as f:
+            table.to_hdf5(f, 'bench')
+        specs.append(('16S', fp, samp_ids, {'Study': 'study %d' % s}))
+    return specs
+
+
+def sequential(specs):
+    table = None
+    for _, fp, samples, md in specs:
+        new_table = load_filtered_table(fp, samples, md)
+        table = new_table if table is None else table.merge(new_table)
+    return table
+
+
+def main(n_studies=50, n_samples=10000):
+    out_dir = mkdtemp()
+    try:
+        specs = make_tables(out_dir, n_studies, n_samples)
+
+        start = time()
+        exp = sequential(specs)
+        seq_time = time() - start
+
+        start = time()
+        obs = build_tables(specs)['16S']
+        par_time = time() - start
+
+        assert obs.shape == exp.shape
+        print('tables: %d, table shape: %s' % (n_studies, obs.shape))
+        print('sequential merge: %.2fs' % seq_time)
+        print('build_tables:     %.2fs (%.1fx)'
+              % (par_time, seq_time / par_time))
+    finally:
+        rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:3]])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the checksums of the files of a submission
+
+Computes the CRC32 and the MD5 of a set of FASTQ files, reading each file
+line by line for the CRC32 and again for the MD5, as qiita_db and qiita_ware
+used to, and with the batched qiita_db.util.compute_checksums, which reads
+each file once in blocks, serially and with a pool of threads. By default
+there are 16 files of 100,000 reads each and up to 4 threads are used.
+
+Usage: python benchmarks/bench_checksums.py [n_files] [n_reads] [n_jobs]
+"""
+from __future__ import division
+from sys import argv
+from os.path import join, getsize
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+from binascii import crc32
+
+from skbio.util import safe_md5
+
+from qiita_db.util import compute_checksums
+from bench_demux import make_fastq
+
+
+def line_checksums(fp):
+    crc = 0
+    with open(fp, "Ub") as f:
+        for line in f:
+            crc = crc32(line, crc)
+    with open(fp) as f:
+        md5 = safe_md5(f).hexdigest()
+    return {'crc32': crc & 0xffffffff, 'md5': md5}
+
+
+def main(n_files=16, n_reads=100000, n_jobs=4):
+    folder = mkdtemp()
+    try:
+        fps = [join(folder, '%d.fastq' % i) for i in range(n_files)]
+        for fp in fps:
+            make_fastq(fp, n_reads, 1)
+        size = sum(getsize(fp) for fp in fps) / 1024 ** 2
+        print('files: %d, %.1f Mb' % (n_files, size))
+
+        start = time()
+        exp = [line_checksums(fp) for fp in fps]
+        secs = time() - start
+        print('%-16s %8.2fs %8.1f Mb/s' % ('line by line', secs, size / secs))
+
+        for n in range(1, n_jobs + 1):
+            start = time()
+            obs = compute_checksums(fps, ('crc32', 'md5'), n_jobs=n)
+            secs = time() - start
+            assert obs == exp
+            print('%-16s %8.2fs %8.1f Mb/s'
+                  % ('batched, %d jobs' % n, secs, size / secs))
+    finally:
+        rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
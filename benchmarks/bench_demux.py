@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the conversion of split libraries output to demux HDF5 files
+
+Compares the two pass, the single pass and the parallel modes of
+qiita_ware.demux.to_hdf5 on a synthetic FASTQ file, reporting the time, the
+throughput and the size of the resulting file. By default the file has
+1,000,000 reads spread over 96 samples, and up to 4 processes are used.
+
+Usage: python benchmarks/bench_demux.py [n_reads] [n_samples] [n_jobs]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from os.path import getsize
+from tempfile import mkstemp
+from time import time
+
+import numpy as np
+import h5py
+
+from qiita_ware.demux import to_hdf5
+
+
+def make_fastq(fp, n_reads, n_samples, length=150):
+    rand = np.random.RandomState(0)
+    samples = rand.randint(n_samples, size=n_reads)
+    lengths = length - rand.poisson(2, size=n_reads)
+    nucl = np.array(list('ACGT'))
+    with open(fp, 'w') as f:
+        for i, (samp, seq_len) in enumerate(zip(samples, lengths)):
+            seq = ''.join(nucl[rand.randint(4, size=seq_len)])
+            qual = ''.join(chr(q) for q in rand.randint(35, 74, size=seq_len))
+            f.write('@S%d_%d M00176:17:000000000-A0CNA:1:1:15487:1773 '
+                    'orig_bc=AAAAAAAAAAAA new_bc=AAAAAAAAAAAA bc_diffs=0\n'
+                    '%s\n+\n%s\n' % (samp, i, seq, qual))
+
+
+def measure(fastq_fp, n_reads, **kwargs):
+    """Converts fastq_fp, returns the time, reads/sec and file size (Mb)"""
+    fd, h5_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        start = time()
+        with h5py.File(h5_fp, 'w') as f:
+            to_hdf5(fastq_fp, f, **kwargs)
+        secs = time() - start
+        return secs, n_reads / secs, getsize(h5_fp) / 1024 ** 2
+    finally:
+        remove(h5_fp)
+
+
+def main(n_reads=1000000, n_samples=96, n_jobs=4):
+    fd, fastq_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    try:
+        make_fastq(fastq_fp, n_reads, n_samples)
+        print('reads: %d, samples: %d, fastq: %.1f Mb'
+              % (n_reads, n_samples, getsize(fastq_fp) / 1024 ** 2))
+        modes = [('two pass', {}), ('single pass', {'single_pass': True})]
+        modes.extend(('%d jobs' % n, {'n_jobs': n})
+                     for n in range(2, n_jobs + 1))
+        for name, kwargs in modes:
+            secs, rate, size = measure(fastq_fp, n_reads, **kwargs)
+            print('%-12s %8.2fs %10.0f reads/s %8.1f Mb'
+                  % (name, secs, rate, size))
+    finally:
+        remove(fastq_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
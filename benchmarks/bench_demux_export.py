@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the regeneration of FASTQ files from demux HDF5 files
+
+Writes a single sample demux file back to FASTQ formatting one record at a
+time with skbio, and a block at a time with qiita_ware.demux.write_ascii, both
+to a plain and to a gzip file. By default the sample has 1,000,000 reads of
+150 nucleotides.
+
+Usage: python benchmarks/bench_demux_export.py [n_reads]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from os.path import getsize
+from gzip import open as gzopen
+from tempfile import mkstemp
+from time import time
+
+import h5py
+from skbio.format.sequences import format_fastq_record
+
+from qiita_ware.demux import fetch, write_ascii
+from bench_demux_fetch import make_demux
+
+
+def per_record(demux, fh):
+    for samp, idx, seq, qual, bc_ori, bc_cor, bc_err in fetch(demux):
+        seq_id = "%s_%s orig_bc=%s new_bc=%s bc_diffs=%d" % \
+            (samp, idx, bc_ori, bc_cor, bc_err)
+        fh.write(format_fastq_record(seq_id, seq, qual))
+
+
+def block(demux, fh):
+    write_ascii(demux, fh)
+
+
+def measure(demux_fp, func, opener):
+    fd, out_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    try:
+        start = time()
+        with h5py.File(demux_fp, 'r') as demux:
+            with opener(out_fp, 'w') as fh:
+                func(demux, fh)
+        secs = time() - start
+        return secs, getsize(out_fp) / 1024 ** 2
+    finally:
+        remove(out_fp)
+
+
+def main(n_reads=1000000):
+    fd, demux_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        make_demux(demux_fp, n_reads)
+        print('reads: %d' % n_reads)
+        for name, func in [('per record', per_record), ('block', block)]:
+            for target, opener in [('plain', open), ('gzip', gzopen)]:
+                secs, size = measure(demux_fp, func, opener)
+                print('%-11s %-6s %8.2fs %10.0f reads/s %8.1f Mb/s'
+                      % (name, target, secs, n_reads / secs, size / secs))
+    finally:
+        remove(demux_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:2]])
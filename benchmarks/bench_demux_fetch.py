@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the random subsampling of demux HDF5 files
+
+Draws k reads from a single sample demux file with qiita_ware.demux.fetch,
+reading the selected rows one chunk at a time or with a coordinate list, and
+compares it with reading the whole sample. By default the sample has
+5,000,000 reads of 150 nucleotides and 1,000 reads are drawn.
+
+Usage: python benchmarks/bench_demux_fetch.py [n_reads] [k]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from tempfile import mkstemp
+from time import time
+
+import numpy as np
+import h5py
+
+from qiita_ware.demux import fetch, dset_paths, dset_kwargs
+
+
+def make_demux(fp, n_reads, length=150, block=100000):
+    rand = np.random.RandomState(0)
+    with h5py.File(fp, 'w') as f:
+        f.attrs['has-qual'] = True
+        grp = f.create_group('S1')
+        grp.attrs['n'] = n_reads
+        seqs = grp.create_dataset(dset_paths['sequence'], (n_reads, ),
+                                  dtype='|S%d' % length, **dset_kwargs)
+        quals = grp.create_dataset(dset_paths['qual'], (n_reads, length),
+                                   dtype=np.uint8, **dset_kwargs)
+        for path in ('barcode_original', 'barcode_corrected'):
+            grp.create_dataset(dset_paths[path], (n_reads, ), dtype='|S12',
+                               **dset_kwargs)
+        grp.create_dataset(dset_paths['barcode_error'], (n_reads, ),
+                           dtype=int, **dset_kwargs)
+        nucl = np.array(list('ACGT'))
+        for start in range(0, n_reads, block):
+            n = min(block, n_reads - start)
+            seqs[start:start + n] = nucl[
+                rand.randint(4, size=(n, length))].view('|S%d' % length)[:, 0]
+            quals[start:start + n] = rand.randint(2, 41, size=(n, length))
+
+
+def measure(fp, **kwargs):
+    start = time()
+    with h5py.File(fp, 'r') as f:
+        n = sum(1 for _ in fetch(f, **kwargs))
+    return time() - start, n
+
+
+def main(n_reads=5000000, k=1000):
+    fd, fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        make_demux(fp, n_reads)
+        print('reads: %d, k: %d' % (n_reads, k))
+        for name, kwargs in [('chunk planner', {'k': k}),
+                             ('coordinate list', {'k': k,
+                                                  'plan_reads': False}),
+                             ('whole sample', {})]:
+            secs, n = measure(fp, **kwargs)
+            print('%-16s %8.2fs %10d reads' % (name, secs, n))
+    finally:
+        remove(fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:3]])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the padded and the compact layouts of demux HDF5 files
+
+Converts split libraries FASTQ files with qiita_ware.demux.to_hdf5 to both
+layouts, and reports the size of the files and the time taken to read them
+back with qiita_ware.demux.to_ascii. Without arguments, synthetic runs of
+200,000 reads with different length distributions are used; otherwise the
+given split libraries output files are converted.
+
+Usage: python benchmarks/bench_demux_layout.py [seqs.fastq ...]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from os.path import getsize
+from tempfile import mkstemp
+from time import time
+
+import numpy as np
+import h5py
+
+from qiita_ware.demux import to_hdf5, to_ascii
+
+
+def make_fastq(fp, lengths, n_samples=96):
+    rand = np.random.RandomState(0)
+    samples = rand.randint(n_samples, size=lengths.size)
+    nucl = np.array(list('ACGT'))
+    with open(fp, 'w') as f:
+        for i, (samp, seq_len) in enumerate(zip(samples, lengths)):
+            seq = ''.join(nucl[rand.randint(4, size=seq_len)])
+            qual = ''.join(chr(q) for q in rand.randint(35, 74, size=seq_len))
+            f.write('@S%d_%d M00176:17:000000000-A0CNA:1:1:15487:1773 '
+                    'orig_bc=AAAAAAAAAAAA new_bc=AAAAAAAAAAAA bc_diffs=0\n'
+                    '%s\n+\n%s\n' % (samp, i, seq, qual))
+
+
+def synthetic_runs(n_reads=200000):
+    rand = np.random.RandomState(0)
+    # quality trimmed reads, most of them untouched
+    trimmed = np.full(n_reads, 150)
+    cut = rand.rand(n_reads) < 0.2
+    trimmed[cut] = rand.randint(75, 150, size=cut.sum())
+    # a few long reads widen the padded datasets of their samples
+    outliers = np.full(n_reads, 150)
+    outliers[rand.randint(n_reads, size=n_reads // 1000)] = 600
+    return [('fixed 150nt', np.full(n_reads, 150)),
+            ('trimmed 150nt', trimmed),
+            ('long outliers', outliers),
+            ('454-like', np.clip(rand.normal(400, 80, n_reads), 200,
+                                 800).astype(int))]
+
+
+def measure(fastq_fp, **kwargs):
+    """Converts fastq_fp, returns the file size (Mb) and read time"""
+    fd, h5_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        with h5py.File(h5_fp, 'w') as f:
+            to_hdf5(fastq_fp, f, **kwargs)
+        start = time()
+        with h5py.File(h5_fp, 'r') as f:
+            for _ in to_ascii(f):
+                pass
+        return getsize(h5_fp) / 1024 ** 2, time() - start
+    finally:
+        remove(h5_fp)
+
+
+def report(name, fastq_fp):
+    padded, padded_secs = measure(fastq_fp, single_pass=True)
+    compact, compact_secs = measure(fastq_fp, compact=True)
+    print('%-14s %8.1f Mb %8.1f Mb %6.2f %8.2fs %8.2fs'
+          % (name, padded, compact, compact / padded, padded_secs,
+             compact_secs))
+
+
+def main(paths):
+    print('%-14s %11s %11s %6s %9s %9s' % ('run', 'padded', 'compact',
+                                           'ratio', 'read', 'read'))
+    for fp in paths:
+        report(fp, fp)
+    if paths:
+        return
+
+    for name, lengths in synthetic_runs():
+        fd, fastq_fp = mkstemp(suffix='.fastq')
+        close(fd)
+        try:
+            make_fastq(fastq_fp, lengths)
+            report(name, fastq_fp)
+        finally:
+            remove(fastq_fp)
+
+
+if __name__ == '__main__':
+    main(argv[1:])
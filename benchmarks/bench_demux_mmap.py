@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the memory mapped reads of demux HDF5 files
+
+Writes a synthetic FASTQ file with the default, export and hot storage
+profiles, and reports the size of the file, the time to read all its blocks
+with qiita_ware.demux.fetch_blocks, the time to draw k reads per sample with
+qiita_ware.demux.fetch and the time to export it whole with
+qiita_ware.demux.write_ascii, reading the datasets through HDF5 or mapping
+them in memory. Only the datasets of the hot profile can be mapped. By
+default the file has 400,000 reads spread over 8 samples, and 100 reads are
+drawn per sample.
+
+Usage: python benchmarks/bench_demux_mmap.py [n_reads] [n_samples] [k]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove, devnull
+from os.path import getsize
+from tempfile import mkstemp
+from time import time
+
+import h5py
+
+from qiita_ware.demux import to_hdf5, write_ascii, fetch, fetch_blocks
+from bench_demux import make_fastq
+
+
+def timed(h5_fp, func, **kwargs):
+    start = time()
+    with h5py.File(h5_fp, 'r') as f:
+        func(f, **kwargs)
+    return time() - start
+
+
+def read_blocks(f, **kwargs):
+    for _ in fetch_blocks(f, **kwargs):
+        pass
+
+
+def sample_reads(f, **kwargs):
+    for _ in fetch(f, **kwargs):
+        pass
+
+
+def export(f, **kwargs):
+    with open(devnull, 'w') as out:
+        write_ascii(f, out, **kwargs)
+
+
+def main(n_reads=400000, n_samples=8, k=100):
+    fd, fastq_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    fd, h5_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        make_fastq(fastq_fp, n_reads, n_samples)
+        print('reads: %d, samples: %d, k: %d' % (n_reads, n_samples, k))
+        print('%-8s %-5s %9s %9s %9s %9s' % ('profile', 'mmap', 'size',
+                                             'read', 'sampling', 'export'))
+        for profile in ('default', 'export', 'hot'):
+            with h5py.File(h5_fp, 'w') as f:
+                to_hdf5(fastq_fp, f, profile=profile)
+            size = getsize(h5_fp) / 1024 ** 2
+            for mmap in (False, True):
+                read = timed(h5_fp, read_blocks, mmap=mmap)
+                sampling = timed(h5_fp, sample_reads, k=k, mmap=mmap)
+                exported = timed(h5_fp, export, mmap=mmap)
+                print('%-8s %-5s %6.1f Mb %8.2fs %8.2fs %8.2fs'
+                      % (profile, mmap, size, read, sampling, exported))
+    finally:
+        remove(fastq_fp)
+        remove(h5_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the storage profiles of demux HDF5 files
+
+Writes a synthetic FASTQ file with each of qiita_ware.demux.dset_profiles and
+reports the time to write the file, its size, the time to export it whole
+with qiita_ware.demux.write_ascii and the time to draw k reads per sample
+with qiita_ware.demux.fetch. By default the file has 400,000 reads spread
+over 8 samples, and 100 reads are drawn per sample.
+
+Usage: python benchmarks/bench_demux_profiles.py [n_reads] [n_samples] [k]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove, devnull
+from os.path import getsize
+from tempfile import mkstemp
+from time import time
+
+import h5py
+
+from qiita_ware.demux import to_hdf5, write_ascii, fetch, dset_profiles
+from bench_demux import make_fastq
+
+
+def measure(fastq_fp, k, profile):
+    """Returns the write time, size (Mb), export and sampling times"""
+    fd, h5_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        start = time()
+        with h5py.File(h5_fp, 'w') as f:
+            to_hdf5(fastq_fp, f, single_pass=True, profile=profile)
+        write = time() - start
+
+        start = time()
+        with h5py.File(h5_fp, 'r') as f, open(devnull, 'w') as out:
+            write_ascii(f, out)
+        export = time() - start
+
+        start = time()
+        with h5py.File(h5_fp, 'r') as f:
+            for _ in fetch(f, k=k):
+                pass
+        sampling = time() - start
+
+        return write, getsize(h5_fp) / 1024 ** 2, export, sampling
+    finally:
+        remove(h5_fp)
+
+
+def main(n_reads=400000, n_samples=8, k=100):
+    fd, fastq_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    try:
+        make_fastq(fastq_fp, n_reads, n_samples)
+        print('reads: %d, samples: %d, k: %d' % (n_reads, n_samples, k))
+        print('%-9s %9s %9s %9s %9s' % ('profile', 'write', 'size',
+                                        'export', 'sampling'))
+        for profile in sorted(dset_profiles):
+            write, size, export, sampling = measure(fastq_fp, k, profile)
+            print('%-9s %8.2fs %6.1f Mb %8.2fs %8.2fs'
+                  % (profile, write, size, export, sampling))
+    finally:
+        remove(fastq_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
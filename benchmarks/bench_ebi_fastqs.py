@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the per sample FASTQ files written for EBI submissions
+
+Writes the gzipped FASTQ file of each sample of a synthetic demux file with
+qiita_ware.commands._write_sample_fastqs, with 1 up to n_jobs processes. By
+default the file has 400,000 reads spread over 200 samples, and up to 4
+processes are used.
+
+Usage: python benchmarks/bench_ebi_fastqs.py [n_reads] [n_samples] [n_jobs]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from shutil import rmtree
+from tempfile import mkstemp, mkdtemp
+from time import time
+
+import h5py
+
+from qiita_ware.demux import to_hdf5
+from qiita_ware.commands import _write_sample_fastqs
+from bench_demux import make_fastq
+
+
+def main(n_reads=400000, n_samples=200, n_jobs=4):
+    fd, fastq_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    fd, demux_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        make_fastq(fastq_fp, n_reads, n_samples)
+        with h5py.File(demux_fp, 'w') as f:
+            to_hdf5(fastq_fp, f)
+            samples = list(f)
+        print('reads: %d, samples: %d' % (n_reads, n_samples))
+        for n in range(1, n_jobs + 1):
+            out_dir = mkdtemp()
+            try:
+                start = time()
+                _write_sample_fastqs(demux_fp, samples, out_dir, n)
+                secs = time() - start
+            finally:
+                rmtree(out_dir)
+            print('%d jobs %8.2fs %10.0f reads/s' % (n, secs, n_reads / secs))
+    finally:
+        remove(fastq_fp)
+        remove(demux_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the writing of the EBI sample, experiment and run XML files
+
+Compares the streaming writer of qiita_ware.ebi.EBISubmission with building
+the whole tree and serializing it through minidom, reporting the time and the
+peak memory of each. Each mode runs in its own process, so the peak memory of
+one does not hide the other. By default the submission has 20,000 samples.
+
+Usage: python benchmarks/bench_ebi_xml.py [n_samples]
+"""
+from __future__ import division
+from sys import argv
+from os import close, remove
+from tempfile import mkstemp
+from time import time
+from resource import getrusage, RUSAGE_SELF
+from multiprocessing import Process, Queue
+from xml.dom import minidom
+from xml.etree import ElementTree as ET
+
+from qiita_ware.ebi import EBISubmission
+
+
+def make_submission(n_samples):
+    submission = EBISubmission('001', 'Study Title', 'Study Abstract',
+                               investigation_type='Other',
+                               new_investigation_type='metagenome')
+    for i in range(n_samples):
+        name = 'S%d' % i
+        submission.add_sample(name, taxon_id='9606',
+                              description='Sample %d' % i, ph='7.%d' % i,
+                              country='GAZ:United States of America')
+        submission.add_sample_prep(name, 'ILLUMINA', 'fastq', __file__,
+                                   'experiment description',
+                                   'library protocol', primer='GTGCCAGCMGCCG',
+                                   barcode='AAAAAAAAAAAA')
+    submission.ebi_dir = 'ebi_dir'
+    return submission
+
+
+def write_minidom(submission, fp):
+    for gen in (submission.generate_sample_xml,
+                submission.generate_experiment_xml,
+                submission.generate_run_xml):
+        xml = minidom.parseString(ET.tostring(gen()))
+        with open(fp, 'w') as f:
+            f.write(xml.toxml(encoding='UTF-8'))
+
+
+def write_streaming(submission, fp):
+    for write in (submission.write_sample_xml,
+                  submission.write_experiment_xml,
+                  submission.write_run_xml):
+        write(fp)
+
+
+def measure(queue, n_samples, write):
+    submission = make_submission(n_samples)
+    fd, fp = mkstemp(suffix='.xml')
+    close(fd)
+    try:
+        before = getrusage(RUSAGE_SELF).ru_maxrss
+        start = time()
+        write(submission, fp)
+        secs = time() - start
+        queue.put((secs, (getrusage(RUSAGE_SELF).ru_maxrss - before) / 1024))
+    finally:
+        remove(fp)
+
+
+def main(n_samples=20000):
+    print('samples: %d' % n_samples)
+    for name, write in [('minidom', write_minidom),
+                        ('streaming', write_streaming)]:
+        queue = Queue()
+        proc = Process(target=measure, args=(queue, n_samples, write))
+        proc.start()
+        secs, mem = queue.get()
+        proc.join()
+        print('%-10s %8.2fs %8.1f Mb peak increase' % (name, secs, mem))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:2]])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the rarefaction of the analysis BIOM tables
+
+Compares biom.Table.subsample against qiita_db.analysis_biom.rarefy_table
+on a synthetic table, reporting the time and the peak memory used by each.
+By default the table has 100,000 samples.
+
+Usage: python benchmarks/bench_rarefaction.py [n_samples] [depth]
+"""
+from __future__ import division
+from sys import argv
+from time import time
+from resource import getrusage, RUSAGE_SELF
+from multiprocessing import Process, Queue
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from biom import Table
+
+from qiita_db.analysis_biom import rarefy_table
+
+
+def make_table(n_samples, n_obs=5000, density=0.01):
+    rand = np.random.RandomState(0)
+    data = sparse_random(n_obs, n_samples, density=density,
+                         random_state=rand, format='csr') * 100
+    return Table(data.ceil(), ['OTU%d' % i for i in range(n_obs)],
+                 ['S%d' % i for i in range(n_samples)])
+
+
+def _run(func, queue):
+    start_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    start = time()
+    func()
+    queue.put((time() - start, getrusage(RUSAGE_SELF).ru_maxrss - start_rss))
+
+
+def measure(func):
+    """Runs func in a new process, returns its time and peak memory (Kb)"""
+    queue = Queue()
+    p = Process(target=_run, args=(func, queue))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+
+def main(n_samples=100000, depth=1000):
+    table = make_table(n_samples)
+    print('table shape: %s, depth: %d' % (table.shape, depth))
+    for name, func in [
+            ('Table.subsample', lambda: table.subsample(depth)),
+            ('rarefy_table', lambda: rarefy_table(table, depth, 42))]:
+        secs, mem = measure(func)
+        print('%-16s %8.2fs %10.1f Mb' % (name, secs, mem / 1024))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:3]])
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+"""Benchmarks the per sample subsampling of sequences
+
+Compares qiita_ware.util.per_sample_sequences with the heap based subsampling
+it replaced, on an in memory stream of records, and reports the time it takes
+on a demux file. By default there are 2,000,000 reads spread over 96 samples,
+and 100 reads are kept per sample.
+
+Usage: python benchmarks/bench_subsample.py [n_reads] [n_samples] [max_seqs]
+"""
+from __future__ import division
+from sys import argv, maxint
+from os import close, remove
+from collections import defaultdict
+from heapq import heappush, heappop
+from tempfile import mkstemp
+from time import time
+
+import numpy as np
+import h5py
+
+from qiita_ware.util import per_sample_sequences
+from qiita_ware.demux import to_hdf5
+from bench_demux import make_fastq
+
+
+def heap_per_sample_sequences(iter_, max_seqs):
+    random_values = np.random.randint(0, maxint, 100000)
+    random_idx = 0
+    result = defaultdict(list)
+    for record in iter_:
+        sequence_id = record['SequenceID']
+        heap = result[sequence_id.rsplit('_', 1)[0]]
+        random_value = random_values[random_idx]
+        random_idx += 1
+        if random_idx >= 100000:
+            random_values = np.random.randint(0, maxint, 100000)
+            random_idx = 0
+        heappush(heap, (random_value, sequence_id, record['Sequence']))
+        if len(heap) > max_seqs:
+            heappop(heap)
+    return [(sid, seq) for kept in result.values() for _, sid, seq in kept]
+
+
+def records(n_reads, n_samples):
+    samples = np.random.RandomState(0).randint(n_samples, size=n_reads)
+    record = {}
+    for i, samp in enumerate(samples):
+        # skbio reuses the record too
+        record['SequenceID'] = 'S%d_%d' % (samp, i)
+        record['Sequence'] = 'ACGT'
+        yield record
+
+
+def measure(func, *args):
+    start = time()
+    n = sum(1 for _ in func(*args))
+    return time() - start, n
+
+
+def main(n_reads=2000000, n_samples=96, max_seqs=100):
+    print('reads: %d, samples: %d, max_seqs: %d'
+          % (n_reads, n_samples, max_seqs))
+    base, _ = measure(records, n_reads, n_samples)
+    print('%-10s %8.2fs' % ('stream', base))
+    for name, func in [('heap', heap_per_sample_sequences),
+                       ('reservoir', per_sample_sequences)]:
+        secs, n = measure(func, records(n_reads, n_samples), max_seqs)
+        print('%-10s %8.2fs %8d kept' % (name, secs, n))
+
+    fd, fastq_fp = mkstemp(suffix='.fastq')
+    close(fd)
+    fd, demux_fp = mkstemp(suffix='.demux')
+    close(fd)
+    try:
+        make_fastq(fastq_fp, n_reads // 10, n_samples)
+        with h5py.File(demux_fp, 'w') as f:
+            to_hdf5(fastq_fp, f, single_pass=True)
+        with h5py.File(demux_fp, 'r') as f:
+            secs, n = measure(per_sample_sequences, f, max_seqs)
+        print('%-10s %8.2fs %8d kept (%d reads)'
+              % ('demux', secs, n, n_reads // 10))
+    finally:
+        remove(fastq_fp)
+        remove(demux_fp)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in argv[1:4]])
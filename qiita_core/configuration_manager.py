@@ -37,6 +37,13 @@ class ConfigurationManager(object):
         Path to the working directory
     max_upload_size : int
         Max upload size
+    max_biom_cache_size : int
+        Max size of the filtered BIOM tables cache, in Mb. Default: 1024
+    demux_n_jobs : int
+        Number of processes used to build the demultiplexed HDF5 files.
+        Default: 1
+    demux_profile : str
+        Storage profile of the demultiplexed HDF5 files. Default: default
     valid_upload_extension : str
         The extensions that are valid to upload, comma separated
     user : str
@@ -93,6 +100,9 @@ class ConfigurationManager(object):
     ebi_organization_prefix : str
         This string (with an underscore) will be prefixed to your EBI
         submission and study aliases
+    ebi_n_jobs : int
+        The number of processes writing the per sample FASTQ files of an EBI
+        submission. Default: 1
     redis_host : str
         The host/ip for redis
     redis_port : int
@@ -158,6 +168,16 @@ class ConfigurationManager(object):
             raise ValueError("The WORKING_DIR (%s) folder doesn't exist" %
                              self.working_dir)
         self.max_upload_size = config.getint('main', 'MAX_UPLOAD_SIZE')
+        self.max_biom_cache_size = 1024
+        if config.has_option('main', 'MAX_BIOM_CACHE_SIZE'):
+            self.max_biom_cache_size = config.getint('main',
+                                                     'MAX_BIOM_CACHE_SIZE')
+        self.demux_n_jobs = 1
+        if config.has_option('main', 'DEMUX_N_JOBS'):
+            self.demux_n_jobs = config.getint('main', 'DEMUX_N_JOBS')
+        self.demux_profile = 'default'
+        if config.has_option('main', 'DEMUX_PROFILE'):
+            self.demux_profile = config.get('main', 'DEMUX_PROFILE')
         self.require_approval = config.getboolean('main', 'REQUIRE_APPROVAL')
 
         self.valid_upload_extension = [ve.strip() for ve in config.get(
@@ -209,6 +229,7 @@ class ConfigurationManager(object):
     def _get_ebi(self, config):
         sec_get = partial(config.get, 'ebi')
         sec_getbool = partial(config.getboolean, 'ebi')
+        sec_getint = partial(config.getint, 'ebi')
 
         self.ebi_access_key = sec_get('EBI_ACCESS_KEY')
         self.ebi_seq_xfer_user = sec_get('EBI_SEQ_XFER_USER')
@@ -218,6 +239,9 @@ class ConfigurationManager(object):
         self.ebi_skip_curl_cert = sec_getbool('EBI_SKIP_CURL_CERT')
         self.ebi_center_name = sec_get('EBI_CENTER_NAME')
         self.ebi_organization_prefix = sec_get('EBI_ORGANIZATION_PREFIX')
+        self.ebi_n_jobs = 1
+        if config.has_option('ebi', 'EBI_N_JOBS'):
+            self.ebi_n_jobs = sec_getint('EBI_N_JOBS')
 
     def _get_ipython(self, config):
         self.ipython_contexts = config.get('ipython', 'context').split(',')
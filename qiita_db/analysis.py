@@ -18,20 +18,27 @@ Classes
 # -----------------------------------------------------------------------------
 from __future__ import division
 from collections import defaultdict
-from os.path import join
+from os import remove
+from os.path import join, exists
+from random import randint
+from json import loads, dumps
 
 from future.utils import viewitems
 from biom import load_table
-from biom.util import biom_open
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
+from qiita_core.qiita_settings import qiita_config
 from .sql_connection import SQLConnectionHandler
 from .base import QiitaStatusObject
-from .data import ProcessedData, RawData
+from .data import ProcessedData
 from .study import Study
+from .analysis_biom import (build_tables, write_tables, patch_table,
+                            FilteredTableCache)
 from .exceptions import QiitaDBStatusError  # QiitaDBNotImplementedError
-from .util import (convert_to_id, get_work_base_dir,
-                   get_mountpoint, get_table_cols, insert_filepaths)
+from .exceptions import QiitaDBUnknownIDError
+from .util import (convert_to_id, get_work_base_dir, compute_checksum,
+                   get_mountpoint, insert_filepaths, get_table_cols,
+                   get_cached_table_cols)
 
 
 class Analysis(QiitaStatusObject):
@@ -51,6 +58,7 @@ class Analysis(QiitaStatusObject):
     shared_with
     jobs
     pmid
+    rarefaction_seed
     parent
     children
 
@@ -440,6 +448,20 @@ class Analysis(QiitaStatusObject):
                "analysis_id = %s".format(self._table))
         conn_handler.execute(sql, (pmid, self._id))
 
+    @property
+    def rarefaction_seed(self):
+        """Returns the seed used to rarefy the analysis BIOM tables
+
+        Returns
+        -------
+        int or None
+            The seed, or None if the tables have not been rarefied
+        """
+        conn_handler = SQLConnectionHandler()
+        sql = ("SELECT rarefaction_seed FROM qiita.{0} WHERE "
+               "analysis_id = %s".format(self._table))
+        return conn_handler.execute_fetchone(sql, (self._id, ))[0]
+
     # @property
     # def parent(self):
     #     """Returns the id of the parent analysis this was forked from"""
@@ -568,7 +590,7 @@ class Analysis(QiitaStatusObject):
 
         conn_handler.executemany(sql, remove)
 
-    def build_files(self, rarefaction_depth=None):
+    def build_files(self, rarefaction_depth=None, rarefaction_seed=None):
         """Builds biom and mapping files needed for analysis
 
         Parameters
@@ -576,6 +598,10 @@ class Analysis(QiitaStatusObject):
         rarefaction_depth : int, optional
             Defaults to ``None``. If ``None``, do not rarefy. Otherwise, rarefy
             all samples to this number of observations
+        rarefaction_seed : int, optional
+            Defaults to ``None``. The seed used to rarefy the tables. If
+            ``None``, a random seed is used. The seed is stored in the
+            analysis, so the tables can be rebuilt
 
         Raises
         ------
@@ -598,7 +624,7 @@ class Analysis(QiitaStatusObject):
         conn_handler = SQLConnectionHandler()
         samples = self._get_samples(conn_handler=conn_handler)
         self._build_mapping_file(samples, conn_handler=conn_handler)
-        self._build_biom_tables(samples, rarefaction_depth,
+        self._build_biom_tables(samples, rarefaction_depth, rarefaction_seed,
                                 conn_handler=conn_handler)
 
     def _get_samples(self, conn_handler=None):
@@ -611,108 +637,203 @@ class Analysis(QiitaStatusObject):
         return dict(conn_handler.execute_fetchall(sql, [self._id]))
 
     def _build_biom_tables(self, samples, rarefaction_depth,
-                           conn_handler=None):
-        """Build tables and add them to the analysis"""
-        # filter and combine all study BIOM tables needed for each data type
-        new_tables = {dt: None for dt in self.data_types}
-        base_fp = get_work_base_dir()
-        for pid, samps in viewitems(samples):
+                           rarefaction_seed=None, conn_handler=None):
+        """Build tables and add them to the analysis
+
+        A manifest with the samples of each processed data used to build
+        each table is kept with the tables. Tables whose samples didn't change
+        since they were built are not rebuilt, and if the rarefaction didn't
+        change either, the previous tables are patched instead of building
+        them from scratch
+        """
+        conn_handler = conn_handler if conn_handler is not None \
+            else SQLConnectionHandler()
+        _, analysis_fp = get_mountpoint(self._table)[0]
+        manifest_fp = join(analysis_fp,
+                           "%d_analysis_manifest.json" % self._id)
+        manifest = {}
+        if exists(manifest_fp):
+            with open(manifest_fp) as f:
+                manifest = loads(f.read())
+
+        # previous tables can only be reused if they have been rarefied in
+        # the same way. If no seed is given, the previous one is kept, and
+        # tables that are not rarefied have no seed
+        if rarefaction_depth is None:
+            rarefaction_seed = None
+        elif rarefaction_seed is None:
+            if manifest.get('rarefaction_depth') == rarefaction_depth:
+                rarefaction_seed = manifest['rarefaction_seed']
+            else:
+                rarefaction_seed = randint(0, 2 ** 32 - 1)
+        old_tables = {}
+        if manifest and (manifest['rarefaction_depth'] == rarefaction_depth and
+                         manifest['rarefaction_seed'] == rarefaction_seed):
+            old_tables = manifest['tables']
+
+        # record the rarefaction seed so the tables can be reproduced, or
+        # clear it if the tables are not rarefied
+        conn_handler.execute(
+            "UPDATE qiita.{0} SET rarefaction_seed = %s WHERE "
+            "analysis_id = %s".format(self._table),
+            (rarefaction_seed, self._id))
+
+        base_fp = get_work_base_dir(conn_handler)
+        # filtered tables are cached so analyses that use the same samples
+        # of a processed data don't need to load and filter it again
+        cache = FilteredTableCache(
+            join(base_fp, 'biom_cache'),
+            qiita_config.max_biom_cache_size * 1024 * 1024)
+        sql = "SELECT checksum FROM qiita.filepath WHERE filepath_id = %s"
+        proc_data_info = {}
+        new_tables = defaultdict(dict)
+        new_sources = defaultdict(dict)
+        for pid, samps in sorted(viewitems(samples)):
             # one biom table attached to each processed data object
             proc_data = ProcessedData(pid)
-            proc_data_fp = proc_data.get_filepaths()[0][1]
-            table_fp = join(base_fp, proc_data_fp)
-            table = load_table(table_fp)
-            # HACKY WORKAROUND FOR DEMO. Issue # 246
-            # make sure samples not in biom table are not filtered for
-            table_samps = set(table.ids())
-            filter_samps = table_samps.intersection(samps)
+            proc_data_fpid, proc_data_fp, _ = proc_data.get_filepaths()[0]
+            checksum = conn_handler.execute_fetchone(sql, [proc_data_fpid])[0]
             # add the metadata column for study the samples come from
             study_meta = {'Study': Study(proc_data.study).title,
                           'Processed_id': proc_data.id}
-            samples_meta = {sid: study_meta for sid in filter_samps}
-            # filter for just the wanted samples and merge into new table
-            # this if/else setup avoids needing a blank table to start merges
-            table.filter(filter_samps, axis='sample', inplace=True)
-            table.add_metadata(samples_meta, axis='sample')
             data_type = proc_data.data_type()
-            if new_tables[data_type] is None:
-                new_tables[data_type] = table
-            else:
-                new_tables[data_type] = new_tables[data_type].merge(table)
-
-        # add the new tables to the analysis
-        conn_handler = conn_handler if conn_handler is not None \
-            else SQLConnectionHandler()
-        _, base_fp = get_mountpoint(self._table)[0]
-        for dt, biom_table in viewitems(new_tables):
-            # rarefy, if specified
-            if rarefaction_depth is not None:
-                biom_table = biom_table.subsample(rarefaction_depth)
-            # write out the file
-            biom_fp = join(base_fp, "%d_analysis_%s.biom" % (self._id, dt))
-            with biom_open(biom_fp, 'w') as f:
-                biom_table.to_hdf5(f, "Analysis %s Datatype %s" %
-                                   (self._id, dt))
-            self._add_file("%d_analysis_%s.biom" % (self._id, dt),
-                           "biom", data_type=dt, conn_handler=conn_handler)
+            proc_data_info[pid] = (data_type, join(base_fp, proc_data_fp),
+                                   study_meta, checksum)
+            new_tables[data_type][str(pid)] = sorted(samps)
+            new_sources[data_type][str(pid)] = checksum
+
+        # find out which tables have to be built from scratch and which can
+        # be patched. Tables are rebuilt if they changed since they were
+        # written or if the BIOM table of any of their processed data changed
+        fps = {dt: "%d_analysis_%s.biom" % (self._id, dt)
+               for dt in new_tables}
+        table_specs = []
+        added_specs = []
+        patches = {}
+        for dt, dt_samples in viewitems(new_tables):
+            old = old_tables.get(dt)
+            fp = join(analysis_fp, fps[dt])
+            if (old is None or not exists(fp) or
+                    str(compute_checksum(fp)) != old['checksum'] or
+                    any(old['sources'].get(pid, checksum) != checksum
+                        for pid, checksum in viewitems(new_sources[dt]))):
+                for pid, samps in viewitems(dt_samples):
+                    _, pd_fp, md, checksum = proc_data_info[int(pid)]
+                    table_specs.append((dt, pd_fp, samps, md,
+                                        cache.key(pid, checksum, samps)))
+                continue
+            old_samples = old['samples']
+            if old_samples == dt_samples:
+                continue
+            removed = set()
+            for pid, samps in viewitems(old_samples):
+                removed.update(set(samps).difference(
+                    dt_samples.get(pid, [])))
+            for pid, samps in viewitems(dt_samples):
+                samps = set(samps).difference(old_samples.get(pid, []))
+                if samps:
+                    _, pd_fp, md, _ = proc_data_info[int(pid)]
+                    added_specs.append((dt, pd_fp, samps, md, None))
+            patches[dt] = removed
+
+        # the tables are loaded and filtered in parallel and then each data
+        # type is merged at once, instead of merging the tables one by one
+        built_tables = build_tables(table_specs, cache=cache)
+        to_write = [(dt, t, rarefaction_depth, rarefaction_seed)
+                    for dt, t in viewitems(built_tables)]
+        added_tables = build_tables(added_specs)
+        for dt, removed in viewitems(patches):
+            biom_table = patch_table(
+                load_table(join(analysis_fp, fps[dt])), removed,
+                added_tables.get(dt), rarefaction_depth, rarefaction_seed)
+            # the patched tables have been rarefied already
+            to_write.append((dt, biom_table, None, None))
+
+        # rarefy, if specified, and write the new tables, one data type per
+        # process, and add them to the analysis
+        write_tables([(t, join(analysis_fp, fps[dt]), depth, seed,
+                       "Analysis %s Datatype %s" % (self._id, dt))
+                      for dt, t, depth, seed in to_write])
+        for dt, _, _, _ in to_write:
+            self._add_file(fps[dt], "biom", data_type=dt,
+                           conn_handler=conn_handler)
+
+        # tables of data types no longer in the analysis are removed, along
+        # with their files
+        sql = ("SELECT filepath_id, filepath FROM qiita.analysis_filepath "
+               "JOIN qiita.filepath USING (filepath_id) WHERE analysis_id = "
+               "%s AND data_type_id = %s AND filepath_type_id = %s")
+        biom_type_id = convert_to_id("biom", "filepath_type", conn_handler)
+        for dt in set(self.biom_tables or []).difference(new_tables):
+            for fpid, fp in conn_handler.execute_fetchall(sql, (
+                    self._id, convert_to_id(dt, "data_type", conn_handler),
+                    biom_type_id)):
+                conn_handler.execute(
+                    "DELETE FROM qiita.analysis_filepath WHERE "
+                    "analysis_id = %s AND filepath_id = %s", (self._id, fpid))
+                conn_handler.execute(
+                    "DELETE FROM qiita.filepath WHERE filepath_id = %s",
+                    (fpid,))
+                if exists(join(analysis_fp, fp)):
+                    remove(join(analysis_fp, fp))
+
+        with open(manifest_fp, 'w') as f:
+            f.write(dumps({
+                'rarefaction_depth': rarefaction_depth,
+                'rarefaction_seed': rarefaction_seed,
+                'tables': {dt: {'samples': dt_samples,
+                                'sources': new_sources[dt],
+                                'checksum': str(compute_checksum(
+                                    join(analysis_fp, fps[dt])))}
+                           for dt, dt_samples in viewitems(new_tables)}}))
 
     def _build_mapping_file(self, samples, conn_handler=None):
         """Builds the combined mapping file for all samples
            Code modified slightly from qiime.util.MetadataMap.__add__"""
         conn_handler = conn_handler if conn_handler is not None \
             else SQLConnectionHandler()
-        # We will keep track of all unique sample_ids and metadata headers
-        # we have seen as we go, as well as studies already seen
+        # We will keep track of all unique sample_ids we have seen, so we
+        # can raise an error on duplicates before writing anything
         all_sample_ids = set()
-        all_headers = set(get_table_cols("required_sample_info", conn_handler))
-        all_studies = set()
-
-        merged_data = defaultdict(lambda: defaultdict(lambda: None))
-        for pid, samples in viewitems(samples):
-            if any([all_sample_ids.intersection(samples),
-                   len(set(samples)) != len(samples)]):
+        for pid, samps in viewitems(samples):
+            if any([all_sample_ids.intersection(samps),
+                   len(set(samps)) != len(samps)]):
                 # duplicate samples so raise error
                 raise ValueError("Duplicate sample ids found: %s" %
-                                 str(all_sample_ids.intersection(samples)))
-            all_sample_ids.update(samples)
-            study_id = ProcessedData(pid).study
-
-            # create a convenience study object
-            s = Study(study_id)
-
-            # get the ids to retrieve the data from the sample and prep tables
-            sample_template_id = s.sample_template
-            # you can have multiple different prep templates but we are only
-            # using the one for 16S i. e. the last one ... sorry ;l
-            # see issue https://github.com/biocore/qiita/issues/465
-            prep_template_id = RawData(s.raw_data()[0]).prep_templates[-1]
-
-            if study_id in all_studies:
-                # samples already added by other processed data file
-                # with the study_id
-                continue
-            all_studies.add(study_id)
-            # add headers to set of all headers found
-            all_headers.update(get_table_cols("sample_%d" % sample_template_id,
-                               conn_handler))
+                                 str(all_sample_ids.intersection(samps)))
+            all_sample_ids.update(samps)
+
+        # get the ids to retrieve the data from the sample and prep tables of
+        # all the studies at once. The sample template id is the study id.
+        # You can have multiple different prep templates but we are only
+        # using the last one of the first raw data ... sorry ;l
+        # see issue https://github.com/biocore/qiita/issues/465
+        sql = ("SELECT spd.processed_data_id, spd.study_id, ("
+               "SELECT max(pt.prep_template_id) FROM qiita.prep_template pt "
+               "WHERE pt.raw_data_id = (SELECT min(srd.raw_data_id) FROM "
+               "qiita.study_raw_data srd WHERE srd.study_id = spd.study_id))"
+               " FROM qiita.study_processed_data spd "
+               "WHERE spd.processed_data_id = ANY(%s)")
+        study_samples = defaultdict(list)
+        prep_templates = {}
+        missing = set(samples)
+        for pid, study_id, prep_template_id in conn_handler.execute_fetchall(
+                sql, [list(samples)]):
+            study_samples[study_id].extend(samples[pid])
+            prep_templates[study_id] = prep_template_id
+            missing.discard(pid)
+        if missing:
+            raise QiitaDBUnknownIDError(missing.pop(), "processed_data")
+
+        # add headers of all the tables involved. The columns of the sample
+        # and prep tables change as their templates are updated
+        all_headers = set(get_cached_table_cols("required_sample_info",
+                                                conn_handler))
+        for study_id, prep_template_id in viewitems(prep_templates):
+            all_headers.update(get_table_cols("sample_%d" % study_id,
+                                              conn_handler))
             all_headers.update(get_table_cols("prep_%d" % prep_template_id,
-                               conn_handler))
-            # NEED TO ADD COMMON PREP INFO Issue #247
-            sql = ("SELECT rs.*, p.*, ss.* "
-                   "FROM qiita.required_sample_info rs JOIN qiita.sample_{0} "
-                   "ss USING(sample_id) JOIN qiita.prep_{1} p USING(sample_id)"
-                   " WHERE rs.sample_id IN {2} AND rs.study_id = {3}".format(
-                       sample_template_id, prep_template_id,
-                       "(%s)" % ",".join("'%s'" % s for s in samples),
-                       study_id))
-            metadata = conn_handler.execute_fetchall(sql)
-            # add all the metadata to merged_data
-            for data in metadata:
-                sample_id = data['sample_id']
-                for header, value in viewitems(data):
-                    if header in {'sample_id'}:
-                        continue
-                    merged_data[sample_id][header] = str(value)
+                                              conn_handler))
 
         # prep headers, making sure they follow mapping file format rules
         all_headers = list(all_headers - {'linkerprimersequence',
@@ -720,19 +841,29 @@ class Analysis(QiitaStatusObject):
         all_headers.sort()
         all_headers = ['BarcodeSequence', 'LinkerPrimerSequence'] + all_headers
         all_headers.append('Description')
+        l_headers = [header.lower() for header in all_headers]
 
-        # write mapping file out
+        # write mapping file out, one study at a time, so we never hold the
+        # metadata of all the samples in memory
         _, base_fp = get_mountpoint(self._table)[0]
         mapping_fp = join(base_fp, "%d_analysis_mapping.txt" % self._id)
+        # NEED TO ADD COMMON PREP INFO Issue #247
+        sql = ("SELECT rs.*, p.*, ss.* "
+               "FROM qiita.required_sample_info rs JOIN qiita.sample_{0} "
+               "ss USING(sample_id) JOIN qiita.prep_{1} p USING(sample_id) "
+               "WHERE rs.sample_id = ANY(%s) AND rs.study_id = %s "
+               "ORDER BY rs.sample_id")
         with open(mapping_fp, 'w') as f:
             f.write("#SampleID\t%s\n" % '\t'.join(all_headers))
-            for sample, metadata in viewitems(merged_data):
-                data = [sample]
-                for header in all_headers:
-                    l_head = header.lower()
-                    data.append(metadata[l_head] if
-                                metadata[l_head] is not None else "no_data")
-                f.write("%s\n" % "\t".join(data))
+            for study_id in sorted(study_samples):
+                metadata = conn_handler.execute_fetchall(
+                    sql.format(study_id, prep_templates[study_id]),
+                    [study_samples[study_id], study_id])
+                for data in metadata:
+                    data = dict(data)
+                    f.write("%s\t%s\n" % (data['sample_id'], "\t".join(
+                        str(data[h]) if h in data else "no_data"
+                        for h in l_headers)))
 
         self._add_file("%d_analysis_mapping.txt" % self._id,
                        "plain_text", conn_handler=conn_handler)
@@ -751,8 +882,21 @@ class Analysis(QiitaStatusObject):
         conn_handler = conn_handler if conn_handler is not None \
             else SQLConnectionHandler()
 
-        filetype_id = convert_to_id(filetype, 'filepath_type', conn_handler)
         _, mp = get_mountpoint('analysis', conn_handler)[0]
+        # if the file has been rebuilt, it is already attached to the
+        # analysis, so only its checksum needs to be updated
+        sql = ("SELECT f.filepath_id FROM qiita.filepath f JOIN "
+               "qiita.analysis_filepath af ON f.filepath_id = af.filepath_id "
+               "WHERE af.analysis_id = %s AND f.filepath = %s")
+        fpid = conn_handler.execute_fetchone(sql, (self._id, filename))
+        if fpid:
+            conn_handler.execute(
+                "UPDATE qiita.filepath SET checksum = %s WHERE "
+                "filepath_id = %s",
+                (str(compute_checksum(join(mp, filename))), fpid[0]))
+            return
+
+        filetype_id = convert_to_id(filetype, 'filepath_type', conn_handler)
         fpid = insert_filepaths([
             (join(mp, filename), filetype_id)], -1, 'analysis', 'filepath',
             conn_handler, move_files=False)[0]
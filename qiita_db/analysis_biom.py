@@ -0,0 +1,520 @@
+r"""
+Analysis BIOM util functions (:mod: `qiita_db.analysis_biom`)
+=============================================================
+
+..currentmodule:: qiita_db.analysis_biom
+
+This module provides the functions used to build the BIOM tables of an
+analysis out of the BIOM tables of its processed data. None of these
+functions access the database, so they can be safely run in worker processes.
+
+Methods
+-------
+
+..autosummary::
+    :toctree: generated/
+
+    load_filtered_table
+    merge_tables
+    build_tables
+    rarefy_table
+    patch_table
+    write_tables
+
+Classes
+-------
+
+..autosummary::
+    :toctree: generated/
+
+    FilteredTableCache
+"""
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+from __future__ import division
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+from os import listdir, makedirs, remove, rename, stat, utime, getpid
+from os.path import join, isdir
+from hashlib import sha1
+from zlib import crc32
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from future.utils import viewitems
+from biom import load_table, Table
+from biom.util import biom_open
+
+
+class FilteredTableCache(object):
+    """Cache of filtered BIOM tables stored in a directory
+
+    Each filtered table is stored in its own file, named after a key that
+    identifies the processed data, the contents of its BIOM table and the
+    samples kept, so a table is never reused once its contents change. When
+    the cache grows over its maximum size, the least recently used tables
+    are removed.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory where the tables are stored. It is created if it
+        doesn't exist
+    max_size : int
+        The maximum size of the cache, in bytes
+    """
+    _suffix = '.biom'
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not isdir(cache_dir):
+            try:
+                makedirs(cache_dir)
+            except OSError:
+                # Another process created it in the meantime
+                if not isdir(cache_dir):
+                    raise
+
+    @staticmethod
+    def key(processed_data_id, checksum, samples):
+        """Returns the cache key of a filtered table
+
+        Parameters
+        ----------
+        processed_data_id : int
+            The processed data the table belongs to
+        checksum : str
+            The checksum of the processed data BIOM table
+        samples : iterable of str
+            The samples kept in the filtered table
+
+        Returns
+        -------
+        str
+            The cache key
+        """
+        samples_hash = sha1('\n'.join(sorted(set(samples)))).hexdigest()
+        return sha1('%s:%s:%s' % (processed_data_id, checksum,
+                                  samples_hash)).hexdigest()
+
+    def _fp(self, key):
+        return join(self.cache_dir, key + self._suffix)
+
+    def get(self, key):
+        """Returns the table stored under key, or None if it's not cached
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+
+        Returns
+        -------
+        biom.Table or None
+        """
+        fp = self._fp(key)
+        try:
+            table = load_table(fp)
+            # Mark the table as recently used
+            utime(fp, None)
+        except (IOError, OSError):
+            # Not cached, or evicted by another process while loading it
+            return None
+        return table
+
+    def put(self, key, table):
+        """Stores the table under key
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+        table : biom.Table
+            The table to store
+        """
+        fp = self._fp(key)
+        # Write to a temporary file and rename it, so no other process can
+        # read a partially written table
+        tmp_fp = '%s.%d.tmp' % (fp, getpid())
+        with biom_open(tmp_fp, 'w') as f:
+            table.to_hdf5(f, "Qiita")
+        rename(tmp_fp, fp)
+
+    def evict(self):
+        """Removes the least recently used tables until the cache fits
+        in its maximum size"""
+        entries = []
+        for fn in listdir(self.cache_dir):
+            if not fn.endswith(self._suffix):
+                continue
+            fp = join(self.cache_dir, fn)
+            try:
+                st = stat(fp)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fp))
+
+        size = sum(e[1] for e in entries)
+        for _, fsize, fp in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                remove(fp)
+            except OSError:
+                pass
+            size -= fsize
+
+
+def load_filtered_table(table_fp, samples, sample_metadata, cache=None,
+                        cache_key=None):
+    """Loads a BIOM table keeping only the given samples
+
+    Parameters
+    ----------
+    table_fp : str
+        The path to the BIOM table
+    samples : iterable of str
+        The samples to keep. Samples not present in the table are ignored
+    sample_metadata : dict
+        The metadata to add to each of the kept samples
+    cache : FilteredTableCache, optional
+        If given, the filtered table is looked up in and stored to this cache
+    cache_key : str, optional
+        The key of the filtered table in `cache`
+
+    Returns
+    -------
+    biom.Table
+        The filtered table
+    """
+    table = None
+    if cache is not None:
+        table = cache.get(cache_key)
+
+    if table is None:
+        table = load_table(table_fp)
+        # make sure samples not in biom table are not filtered for, Issue 246
+        filter_samps = set(table.ids()).intersection(samples)
+        table.filter(filter_samps, axis='sample', inplace=True)
+        if cache is not None and filter_samps:
+            cache.put(cache_key, table)
+
+    table.add_metadata({sid: sample_metadata for sid in table.ids()},
+                       axis='sample')
+    return table
+
+
+def _table_parts(table):
+    """Splits a table in its matrix, ids and metadata
+
+    The metadata is converted to plain dicts, as biom uses defaultdicts with
+    lambdas that can't be pickled to send the table between processes
+    """
+    def plain(md):
+        if md is None:
+            return None
+        return [dict(m) if m is not None else None for m in md]
+
+    return (table.matrix_data, table.ids(axis='observation'), table.ids(),
+            plain(table.metadata(axis='observation')),
+            plain(table.metadata()))
+
+
+def _load_filtered_table(args):
+    """Worker for Pool.map, returns the parts of the filtered table"""
+    return _table_parts(load_filtered_table(*args))
+
+
+def _merge_ids(ids, md, all_ids, all_md, index):
+    """Adds the ids of a table to the merged ids and returns their positions
+
+    The metadata of the first table in which an id has metadata is kept, as
+    ``biom.Table.merge`` does with its default ``prefer_self``
+    """
+    positions = np.empty(len(ids), dtype=int)
+    for i, id_ in enumerate(ids):
+        pos = index.get(id_)
+        if pos is None:
+            pos = index[id_] = len(all_ids)
+            all_ids.append(id_)
+            all_md.append(None)
+        if all_md[pos] is None and md is not None:
+            all_md[pos] = md[i]
+        positions[i] = pos
+    return positions
+
+
+def merge_tables(tables):
+    """Merges several BIOM tables in a single pass
+
+    Parameters
+    ----------
+    tables : list of biom.Table
+        The tables to merge
+
+    Returns
+    -------
+    biom.Table
+        The union of all the tables. Values of samples and observations
+        present in more than one table are summed
+
+    Notes
+    -----
+    The result is the same as merging the tables one by one with
+    ``biom.Table.merge``, but the data of each table is only copied once
+    """
+    return _merge_parts([_table_parts(t) for t in tables])
+
+
+def _merge_parts(tables_parts):
+    """Merges tables given as (matrix, obs ids, sample ids, obs md, sample md)
+    """
+    obs_ids, obs_md, obs_index = [], [], {}
+    samp_ids, samp_md, samp_index = [], [], {}
+    rows, cols, data = [], [], []
+    for matrix, t_obs_ids, t_samp_ids, t_obs_md, t_samp_md in tables_parts:
+        obs_pos = _merge_ids(t_obs_ids, t_obs_md, obs_ids, obs_md, obs_index)
+        samp_pos = _merge_ids(t_samp_ids, t_samp_md, samp_ids, samp_md,
+                              samp_index)
+        matrix = matrix.tocoo()
+        rows.append(obs_pos[matrix.row])
+        cols.append(samp_pos[matrix.col])
+        data.append(matrix.data.astype(float))
+
+    # coo_matrix sums the values of any duplicated position
+    matrix = coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(obs_ids), len(samp_ids))).tocsr()
+    if all(md is None for md in obs_md):
+        obs_md = None
+    if all(md is None for md in samp_md):
+        samp_md = None
+    return Table(matrix, obs_ids, samp_ids, obs_md, samp_md)
+
+
+def build_tables(table_specs, n_jobs=None, cache=None):
+    """Loads, filters and merges the BIOM tables of each data type
+
+    Parameters
+    ----------
+    table_specs : list of (str, str, list of str, dict, str) tuples
+        The data type, BIOM table path, samples to keep, metadata to add
+        to those samples and cache key, of each of the tables to merge
+    n_jobs : int, optional
+        Number of processes used to load the tables. Defaults to the number
+        of CPUs. If 1, the tables are loaded in the current process
+    cache : FilteredTableCache, optional
+        If given, the filtered tables are looked up in and stored to this
+        cache, which is trimmed to its maximum size once all are loaded
+
+    Returns
+    -------
+    dict of {str: biom.Table}
+        The merged table of each data type. The tables are merged in the
+        order they are given
+    """
+    if n_jobs is None:
+        n_jobs = cpu_count()
+    n_jobs = min(n_jobs, len(table_specs))
+
+    args = [(fp, samples, md, cache, key)
+            for _, fp, samples, md, key in table_specs]
+    if n_jobs > 1:
+        pool = Pool(processes=n_jobs)
+        try:
+            tables_parts = pool.map(_load_filtered_table, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tables_parts = [_load_filtered_table(a) for a in args]
+
+    if cache is not None:
+        cache.evict()
+
+    dt_tables = defaultdict(list)
+    for (data_type, _, _, _, _), parts in zip(table_specs, tables_parts):
+        dt_tables[data_type].append(parts)
+
+    return {dt: _merge_parts(dt_t) for dt, dt_t in viewitems(dt_tables)}
+
+
+def _rarefy_counts(rand, counts, depth):
+    """Subsample depth of the observations of a sample without replacement
+
+    Parameters
+    ----------
+    rand : np.random.RandomState
+        The random number generator
+    counts : np.array of int
+        The number of observations of each OTU in the sample
+    depth : int
+        The number of observations to keep, not over the total of `counts`
+
+    Returns
+    -------
+    np.array of int
+        The number of observations kept of each OTU
+
+    Notes
+    -----
+    The number kept of each OTU is drawn from the hypergeometric distribution
+    of picking the remaining observations to keep among the remaining ones in
+    the sample, which gives the same distribution as picking them one by one
+    but in O(len(counts)) instead of O(total)
+    """
+    picked = np.zeros(counts.size, dtype=int)
+    remaining = int(counts.sum())
+    for i, count in enumerate(counts.tolist()):
+        if depth == 0:
+            break
+        count = int(count)
+        if count > 0:
+            picked[i] = rand.hypergeometric(count, remaining - count, depth)
+            depth -= picked[i]
+        remaining -= count
+    return picked
+
+
+def rarefy_table(table, depth, seed):
+    """Rarefies a table to the given number of observations per sample
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to rarefy
+    depth : int
+        The number of observations to keep in each sample
+    seed : int
+        The seed of the random number generator
+
+    Returns
+    -------
+    biom.Table
+        The rarefied table. Samples with less than `depth` observations and
+        observations not present in any of the remaining samples are removed
+
+    Notes
+    -----
+    Each sample is subsampled without replacement, as
+    ``biom.Table.subsample`` does, but working directly on the columns of the
+    sparse matrix, see `_rarefy_counts`. The random number generator is
+    seeded with `seed` and the sample id for each sample, so the result of a
+    sample doesn't depend on the other samples in the table
+    """
+    rand = np.random.RandomState()
+    # the values of each sample are contiguous in a CSC matrix, so they are
+    # rarefied in place
+    matrix = table.matrix_data.tocsc(copy=True)
+    data = matrix.data
+    for sid, start, end in zip(table.ids(), matrix.indptr[:-1],
+                               matrix.indptr[1:]):
+        rand.seed([seed, crc32(sid) & 0xffffffff])
+        if data[start:end].sum() < depth:
+            data[start:end] = 0
+            continue
+        data[start:end] = _rarefy_counts(rand, data[start:end], depth)
+    matrix.eliminate_zeros()
+
+    keep_samples = np.diff(matrix.indptr) > 0
+    keep_obs = np.bincount(matrix.indices, minlength=matrix.shape[0]) > 0
+    if not keep_samples.all():
+        matrix = matrix[:, keep_samples]
+    if not keep_obs.all():
+        matrix = matrix[keep_obs]
+
+    def subset(md, keep):
+        return None if md is None else [m for m, k in zip(md, keep) if k]
+
+    return Table(matrix, table.ids(axis='observation')[keep_obs],
+                 table.ids()[keep_samples],
+                 subset(table.metadata(axis='observation'), keep_obs),
+                 subset(table.metadata(), keep_samples))
+
+
+def patch_table(table, removed_samples, added_table=None, depth=None,
+                seed=None):
+    """Removes and adds samples to a table
+
+    Parameters
+    ----------
+    table : biom.Table
+        The table to patch
+    removed_samples : set of str
+        The samples to remove from `table`
+    added_table : biom.Table, optional
+        The table with the samples to add to `table`
+    depth : int, optional
+        The depth `table` was rarefied to, if it was rarefied
+    seed : int, optional
+        The seed `table` was rarefied with, if it was rarefied
+
+    Returns
+    -------
+    biom.Table
+        The patched table
+
+    Notes
+    -----
+    If the table was rarefied, the added samples are rarefied with the same
+    depth and seed, which gives the same result as rarefying the whole table,
+    as each sample is rarefied on its own. Observations without counts in
+    any of the samples of the patched table are dropped
+    """
+    table = table.filter(removed_samples, invert=True, inplace=False)
+    if added_table is not None:
+        if depth is not None:
+            added_table = rarefy_table(added_table, depth, seed)
+        table = merge_tables([table, added_table])
+    table.filter(lambda v, i, md: v.sum() > 0, axis='observation')
+    return table
+
+
+def _write_table(args):
+    """Worker for Pool.map, rarefies a table and writes it to a file"""
+    parts, fp, depth, seed, generated_by = args
+    table = Table(*parts)
+    if depth is not None:
+        table = rarefy_table(table, depth, seed)
+    else:
+        # rarefied tables don't keep the empty observations either
+        table.filter(lambda v, i, md: v.sum() > 0, axis='observation')
+    with biom_open(fp, 'w') as f:
+        table.to_hdf5(f, generated_by)
+
+
+def write_tables(tables, n_jobs=None):
+    """Rarefies and writes several BIOM tables in parallel
+
+    Parameters
+    ----------
+    tables : list of (biom.Table, str, int, int, str) tuples
+        The table, path to write it to, rarefaction depth, rarefaction seed
+        and program that generated it, of each table. If the depth is None,
+        the table is not rarefied. Observations without counts are dropped
+    n_jobs : int, optional
+        Number of processes used. Defaults to the number of CPUs. If 1, the
+        tables are written by the current process
+    """
+    if n_jobs is None:
+        n_jobs = cpu_count()
+    n_jobs = min(n_jobs, len(tables))
+
+    args = [(_table_parts(table), fp, depth, seed, generated_by)
+            for table, fp, depth, seed, generated_by in tables]
+    if n_jobs > 1:
+        pool = Pool(processes=n_jobs)
+        try:
+            pool.map(_write_table, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for a in args:
+            _write_table(a)
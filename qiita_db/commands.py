@@ -17,7 +17,7 @@ from shutil import move
 
 from .study import Study, StudyPerson
 from .user import User
-from .util import (get_filetypes, get_filepath_types, compute_checksum,
+from .util import (get_filetypes, get_filepath_types, compute_checksums,
                    convert_to_id)
 from .data import RawData, PreprocessedData, ProcessedData
 from .metadata_template import (SampleTemplate, PrepTemplate,
@@ -351,6 +351,11 @@ def update_preprocessed_data_from_cmd(sl_out_dir, study_id, ppd_id=None):
             "The directory %s does not contain the following required files: "
             "%s" % (sl_out_dir, ', '.join(missing_files)))
 
+    # The summary of the demux file is optional
+    summary_fp = path_builder('demux_summary.json')
+    if exists(summary_fp):
+        new_fps['preprocessed_demux_summary'] = summary_fp
+
     # Get the preprocessed data to be updated
     study = Study(study_id)
     ppds = study.preprocessed_data()
@@ -376,16 +381,21 @@ def update_preprocessed_data_from_cmd(sl_out_dir, study_id, ppd_id=None):
     fps_to_modify = []
     keys = ['preprocessed_fasta', 'preprocessed_fastq', 'preprocessed_demux',
             'log']
+    if 'preprocessed_demux_summary' in new_fps:
+        keys.append('preprocessed_demux_summary')
 
     for key in keys:
         if key in fps:
             db_id, db_fp = fps[key][0]
-            fp_checksum = compute_checksum(new_fps[key])
-            fps_to_modify.append((db_id, db_fp, new_fps[key], fp_checksum))
+            fps_to_modify.append((db_id, db_fp, new_fps[key]))
         else:
             fps_to_add.append(
                 (new_fps[key], convert_to_id(key, 'filepath_type')))
 
+    checksums = compute_checksums([new_fp for _, _, new_fp in fps_to_modify])
+    fps_to_modify = [fp + (checksum['crc32'], )
+                     for fp, checksum in zip(fps_to_modify, checksums)]
+
     # Insert the new files in the database, if any
     if fps_to_add:
         ppd.add_filepaths(fps_to_add)
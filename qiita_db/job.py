@@ -26,6 +26,7 @@ Classes
 # -----------------------------------------------------------------------------
 from __future__ import division
 from json import loads
+from hashlib import sha1
 from os.path import join, relpath
 from os import remove
 from glob import glob
@@ -52,6 +53,7 @@ class Job(QiitaStatusObject):
     options
     results
     error
+    cpu_time
 
     Methods
     -------
@@ -83,7 +85,7 @@ class Job(QiitaStatusObject):
 
     @classmethod
     def exists(cls, datatype, command, options, analysis,
-               return_existing=False):
+               return_existing=False, rarefaction=None):
         """Checks if the given job already exists
 
         Parameters
@@ -99,6 +101,9 @@ class Job(QiitaStatusObject):
         return_existing : bool, optional
             If True, function will return the instatiated Job object for the
             matching job. Default False
+        rarefaction : tuple of (int, int), optional
+            The rarefaction depth and seed of the tables the job will run on.
+            Default None, the tables are not rarefied
 
         Returns
         -------
@@ -109,42 +114,76 @@ class Job(QiitaStatusObject):
             None if none exists
         """
         conn_handler = SQLConnectionHandler()
-        # check passed arguments and grab analyses for matching jobs
+        fingerprint = cls._job_info(datatype, command, options, analysis.id,
+                                    conn_handler, rarefaction)[3]
+        job_id = cls._find(fingerprint, conn_handler)
+        exists = job_id is not None
+
+        if return_existing:
+            return exists, (cls(job_id) if exists else None)
+        return exists
+
+    @staticmethod
+    def fingerprint(datatype_id, command_id, opts_json, samples,
+                    rarefaction=None):
+        """Returns the fingerprint identifying a job
+
+        Parameters
+        ----------
+        datatype_id : int
+            The id of the datatype the job is operating on
+        command_id : int
+            The id of the command run on the data
+        opts_json : str
+            The options of the command, as returned by params_dict_to_json
+        samples : dict of {int: list of str}
+            The samples the job is operating on, keyed by processed data id
+        rarefaction : tuple of (int, int), optional
+            The rarefaction depth and seed of the tables the job is operating
+            on. Default None, the tables are not rarefied
+
+        Returns
+        -------
+        str
+            The fingerprint of the job
+
+        Notes
+        -----
+        Two jobs with the same fingerprint run the same command with the same
+        options on the same samples, so they produce the same results
+        """
+        samples = sorted([pid, sorted(samps)]
+                         for pid, samps in samples.items())
+        info = [datatype_id, command_id, opts_json, samples]
+        if rarefaction is not None:
+            info.append(list(rarefaction))
+        return sha1(params_dict_to_json(info)).hexdigest()
+
+    @classmethod
+    def _find(cls, fingerprint, conn_handler):
+        """Returns the id of the job with the given fingerprint or None"""
+        sql = "SELECT job_id FROM qiita.{0} WHERE fingerprint = %s".format(
+            cls._table)
+        job_id = conn_handler.execute_fetchone(sql, (fingerprint, ))
+        return job_id[0] if job_id else None
+
+    @classmethod
+    def _job_info(cls, datatype, command, options, analysis_id,
+                  conn_handler, rarefaction=None):
+        """Returns the datatype id, command id, options JSON and fingerprint
+        of a job attached to the given analysis"""
         datatype_id = convert_to_id(datatype, "data_type", conn_handler)
         sql = "SELECT command_id FROM qiita.command WHERE name = %s"
         command_id = conn_handler.execute_fetchone(sql, (command, ))[0]
-        opts_json = params_dict_to_json(options)
-        sql = ("SELECT DISTINCT aj.analysis_id, aj.job_id FROM "
-               "qiita.analysis_job aj JOIN qiita.{0} j ON aj.job_id = j.job_id"
-               " WHERE j.data_type_id = %s AND j.command_id = %s "
-               "AND j.options = %s".format(cls._table))
-        analyses = conn_handler.execute_fetchall(
-            sql, (datatype_id, command_id, opts_json))
-        if not analyses and return_existing:
-            # stop looking since we have no possible matches
-            return False, None
-        elif not analyses:
-            return False
-
         # build the samples dict as list of samples keyed to their proc_data_id
         sql = ("SELECT processed_data_id, array_agg(sample_id ORDER BY "
                "sample_id) FROM qiita.analysis_sample WHERE analysis_id = %s "
                "GROUP BY processed_data_id")
-        samples = dict(conn_handler.execute_fetchall(sql, [analysis.id]))
-        # check passed analyses' samples dict against all found analyses
-        matched_job = None
-        for aid, jid in analyses:
-            # build the samples dict for a found analysis
-            comp_samples = dict(conn_handler.execute_fetchall(sql, [aid]))
-            # compare samples and stop checking if a match is found
-            matched_samples = True if samples == comp_samples else False
-            if matched_samples:
-                matched_job = jid
-                break
-
-        if return_existing:
-            return matched_samples, (cls(matched_job) if matched_job else None)
-        return matched_samples
+        samples = dict(conn_handler.execute_fetchall(sql, [analysis_id]))
+        opts_json = params_dict_to_json(options)
+        return (datatype_id, command_id, opts_json,
+                cls.fingerprint(datatype_id, command_id, opts_json, samples,
+                                rarefaction))
 
     @classmethod
     def delete(cls, jobid):
@@ -196,7 +235,7 @@ class Job(QiitaStatusObject):
 
     @classmethod
     def create(cls, datatype, command, options, analysis,
-               return_existing=False):
+               return_existing=False, rarefaction=None):
         """Creates a new job on the database
 
         Parameters
@@ -210,6 +249,9 @@ class Job(QiitaStatusObject):
         return_existing : bool, optional
             If True, returns an instantiated Job object pointing to an already
             existing job with the given parameters. Default False
+        rarefaction : tuple of (int, int), optional
+            The rarefaction depth and seed of the tables the job will run on.
+            Default None, the tables are not rarefied
 
         Returns
         -------
@@ -224,31 +266,27 @@ class Job(QiitaStatusObject):
         """
         analysis_sql = ("INSERT INTO qiita.analysis_job (analysis_id, job_id) "
                         "VALUES (%s, %s)")
-        exists, job = cls.exists(datatype, command, options, analysis,
-                                 return_existing=True)
         conn_handler = SQLConnectionHandler()
-        if exists:
+        datatype_id, command_id, opts_json, fingerprint = cls._job_info(
+            datatype, command, options, analysis.id, conn_handler,
+            rarefaction)
+        job_id = cls._find(fingerprint, conn_handler)
+        if job_id is not None:
             if return_existing:
                 # add job to analysis
-                conn_handler.execute(analysis_sql, (analysis.id, job.id))
-                return job
+                conn_handler.execute(analysis_sql, (analysis.id, job_id))
+                return cls(job_id)
             else:
                 raise QiitaDBDuplicateError(
                     "Job", "datatype: %s, command: %s, options: %s, "
                     "analysis: %s" % (datatype, command, options, analysis.id))
 
-        # Get the datatype and command ids from the strings
-        datatype_id = convert_to_id(datatype, "data_type", conn_handler)
-        sql = "SELECT command_id FROM qiita.command WHERE name = %s"
-        command_id = conn_handler.execute_fetchone(sql, (command, ))[0]
-        opts_json = params_dict_to_json(options)
-
         # Create the job and return it
         sql = ("INSERT INTO qiita.{0} (data_type_id, job_status_id, "
-               "command_id, options) VALUES "
-               "(%s, %s, %s, %s) RETURNING job_id").format(cls._table)
-        job_id = conn_handler.execute_fetchone(sql, (datatype_id, 1,
-                                               command_id, opts_json))[0]
+               "command_id, options, fingerprint) VALUES "
+               "(%s, %s, %s, %s, %s) RETURNING job_id").format(cls._table)
+        job_id = conn_handler.execute_fetchone(
+            sql, (datatype_id, 1, command_id, opts_json, fingerprint))[0]
 
         # add job to analysis
         conn_handler.execute(analysis_sql, (analysis.id, job_id))
@@ -361,6 +399,49 @@ class Job(QiitaStatusObject):
                 result_fps.append(fp[0])
         return result_fps
 
+    @property
+    def cpu_time(self):
+        """CPU time spent running the job
+
+        Returns
+        -------
+        float or None
+            CPU time in seconds, or None if the job has not been run
+        """
+        sql = ("SELECT cpu_time FROM qiita.{0} "
+               "WHERE job_id = %s".format(self._table))
+        conn_handler = SQLConnectionHandler()
+        return conn_handler.execute_fetchone(sql, (self._id, ))[0]
+
+    @cpu_time.setter
+    def cpu_time(self, value):
+        """Sets the CPU time spent running the job
+
+        Parameters
+        ----------
+        value : float
+            CPU time in seconds
+        """
+        conn_handler = SQLConnectionHandler()
+        self._lock_job(conn_handler)
+        sql = ("UPDATE qiita.{0} SET cpu_time = %s "
+               "WHERE job_id = %s".format(self._table))
+        conn_handler.execute(sql, (value, self._id))
+
+    @property
+    def analyses(self):
+        """The analyses the job is attached to
+
+        Returns
+        -------
+        list of int
+            The analysis ids, sorted
+        """
+        sql = ("SELECT analysis_id FROM qiita.analysis_job "
+               "WHERE job_id = %s ORDER BY analysis_id")
+        conn_handler = SQLConnectionHandler()
+        return [a[0] for a in conn_handler.execute_fetchall(sql, (self._id, ))]
+
     @property
     def error(self):
         """String with an error message, if the job failed
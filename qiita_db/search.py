@@ -70,10 +70,9 @@ from collections import defaultdict
 import pandas as pd
 from future.utils import viewitems
 
-from qiita_db.util import scrub_data, convert_type, get_table_cols
+from qiita_db.util import scrub_data, convert_type, LazyTableColumns
 from qiita_db.sql_connection import SQLConnectionHandler
 from qiita_db.study import Study
-from qiita_db.data import ProcessedData
 from qiita_db.exceptions import QiitaDBIncompatibleDatatypeError
 
 
@@ -117,9 +116,9 @@ class SearchNot(UnaryOperation):
 
 class SearchTerm(object):
     # column names from required_sample_info table
-    required_cols = set(get_table_cols("required_sample_info"))
+    required_cols = LazyTableColumns("required_sample_info")
     # column names from study table
-    study_cols = set(get_table_cols("study"))
+    study_cols = LazyTableColumns("study")
 
     def __init__(self, tokens):
         self.term = tokens[0]
@@ -168,9 +167,9 @@ class QiitaStudySearch(object):
     """QiitaStudySearch object to parse and run searches on studies."""
 
     # column names from required_sample_info table
-    required_cols = set(get_table_cols("required_sample_info"))
+    required_cols = LazyTableColumns("required_sample_info")
     # column names from study table
-    study_cols = set(get_table_cols("study"))
+    study_cols = LazyTableColumns("study")
 
     def __call__(self, searchstr, user):
         """Runs a Study query and returns matching studies and samples
@@ -376,12 +375,10 @@ class QiitaStudySearch(object):
             sample_id, column headers are the metadata categories searched
             over
         """
-        if datatypes is not None:
-            # convert to set for easy lookups
-            datatypes = set(datatypes)
         study_proc_ids = {}
-        proc_data_samples = {}
+        proc_data_samples = defaultdict(list)
         samples_meta = {}
+        study_sample_ids = {}
         headers = {c: val for c, val in enumerate(self.meta_headers)}
         for study_id, study_meta in viewitems(self.results):
             # add metadata to dataframe and dict
@@ -390,18 +387,39 @@ class QiitaStudySearch(object):
                 {s[0]: s[1:] for s in study_meta}, orient='index')
             samples_meta[study_id].rename(columns=headers, inplace=True)
             # set up study-based data needed
-            study = Study(study_id)
-            study_sample_ids = {s[0] for s in study_meta}
+            study_sample_ids[study_id] = {s[0] for s in study_meta}
             study_proc_ids[study_id] = defaultdict(list)
-            for proc_data_id in study.processed_data():
-                proc_data = ProcessedData(proc_data_id)
-                datatype = proc_data.data_type()
-                # skip processed data if it doesn't fit the given datatypes
-                if datatypes is not None and datatype not in datatypes:
-                    continue
-                filter_samps = proc_data.samples.intersection(study_sample_ids)
-                if filter_samps:
-                    proc_data_samples[proc_data_id] = sorted(filter_samps)
-                    study_proc_ids[study_id][datatype].append(proc_data_id)
 
+        # get the samples of all processed data for all the found studies in
+        # a single query, so we don't need to instantiate every Study and
+        # ProcessedData object and query each of their prep tables
+        sql = """SELECT spd.study_id, spd.processed_data_id, dt.data_type,
+                    cpi.sample_id
+                 FROM qiita.study_processed_data spd
+                    JOIN qiita.processed_data pd USING (processed_data_id)
+                    JOIN qiita.data_type dt USING (data_type_id)
+                    JOIN qiita.preprocessed_processed_data ppd
+                        USING (processed_data_id)
+                    JOIN qiita.prep_template_preprocessed_data ptp
+                        USING (preprocessed_data_id)
+                    JOIN qiita.common_prep_info cpi USING (prep_template_id)
+                 WHERE spd.study_id = ANY(%s){0}
+                 ORDER BY spd.study_id, spd.processed_data_id"""
+        sql_args = [list(study_proc_ids)]
+        if datatypes is not None:
+            sql = sql.format(" AND dt.data_type = ANY(%s)")
+            sql_args.append(list(datatypes))
+        else:
+            sql = sql.format("")
+        conn_handler = SQLConnectionHandler()
+        for study_id, proc_data_id, datatype, sample_id in \
+                conn_handler.execute_fetchall(sql, sql_args):
+            if sample_id not in study_sample_ids[study_id]:
+                continue
+            if proc_data_id not in proc_data_samples:
+                study_proc_ids[study_id][datatype].append(proc_data_id)
+            proc_data_samples[proc_data_id].append(sample_id)
+
+        proc_data_samples = {pid: sorted(samples)
+                             for pid, samples in viewitems(proc_data_samples)}
         return study_proc_ids, proc_data_samples, samples_meta
@@ -98,14 +98,15 @@ object while creating the study.
 from __future__ import division
 from future.utils import viewitems
 from copy import deepcopy
-from itertools import chain
 import warnings
+import re
 
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
 from .base import QiitaObject
 from .exceptions import (QiitaDBStatusError, QiitaDBColumnError, QiitaDBError)
 from .util import (check_required_columns, check_table_cols, convert_to_id,
-                   get_environmental_packages, get_table_cols, infer_status)
+                   get_environmental_packages, infer_status,
+                   LazyTableColumns)
 from .sql_connection import SQLConnectionHandler
 from .util import exists_table
 
@@ -147,10 +148,8 @@ class Study(QiitaObject):
     # The following columns are considered not part of the study info
     _non_info = frozenset(["email", "study_title"])
     # The following tables are considered part of info
-    _info_cols = frozenset(chain(
-        get_table_cols('study'), get_table_cols('study_status'),
-        get_table_cols('timeseries_type'), get_table_cols('portal_type'),
-        get_table_cols('study_pmid')))
+    _info_cols = LazyTableColumns('study', 'study_status', 'timeseries_type',
+                                  'portal_type', 'study_pmid')
 
     def _lock_non_sandbox(self, conn_handler):
         """Raises QiitaDBStatusError if study is non-sandboxed"""
@@ -207,7 +206,8 @@ class Study(QiitaObject):
         return studies
 
     @classmethod
-    def get_info(cls, study_ids=None, info_cols=None):
+    def get_info(cls, study_ids=None, info_cols=None, order_by=None,
+                 limit=None, offset=None, search=None):
         """Returns study data for a set of study_ids
 
         Parameters
@@ -216,12 +216,37 @@ class Study(QiitaObject):
             Studies to get information for. Defauls to all studies
         info_cols: list of str, optional
             Information columns to retrieve. Defaults to all study data
+        order_by : list of (str, str) tuples, optional
+            Columns to sort the studies by, as (column, direction) pairs
+            where direction is 'asc' or 'desc'. The column can be any info
+            column or 'status'. Defaults to no ordering
+        limit : int, optional
+            Maximum number of studies to return. Defaults to all studies
+        offset : int, optional
+            Number of studies to skip before starting to return them.
+            Defaults to 0
+        search : str, optional
+            Only return the studies with this text, case insensitive, in their
+            id, title, abstract, PubMed ids or principal investigator name.
+            Defaults to all studies
 
         Returns
         -------
         list of DictCursor
             Table-like structure of metadata, one study per row. Can be
             accessed as a list of dictionaries, keyed on column name.
+
+        Raises
+        ------
+        QiitaDBColumnError
+            If a column in order_by is not an info column nor 'status'
+        IncompetentQiitaDeveloperError
+            If a direction in order_by is not 'asc' or 'desc'
+
+        Notes
+        -----
+        When ordering or paging, study_id is always used as the last sort key
+        so the pages are stable between calls
         """
         if info_cols is None:
             info_cols = cls._info_cols
@@ -237,13 +262,68 @@ class Study(QiitaObject):
             JOIN qiita.portal_type USING (portal_type_id)
             LEFT JOIN (SELECT study_id, array_agg(pmid ORDER BY pmid) as
             pmid FROM qiita.study_pmid GROUP BY study_id) sp USING (study_id)
-            )""".format(search_cols)
+            {1})"""
+        status_sql = ""
+        sort_cols = []
+        for col, direction in (order_by or []):
+            if direction not in ('asc', 'desc'):
+                raise IncompetentQiitaDeveloperError(
+                    "Sort direction must be 'asc' or 'desc', not %s"
+                    % direction)
+            if col == 'status':
+                # The status of the study is inferred from its processed data,
+                # following the same priority used by infer_status
+                status_sql = """LEFT JOIN (SELECT spd.study_id, CASE
+                    WHEN bool_or(pds.processed_data_status = 'public')
+                        THEN 'public'
+                    WHEN bool_or(pds.processed_data_status = 'private')
+                        THEN 'private'
+                    WHEN bool_or(
+                        pds.processed_data_status = 'awaiting_approval')
+                        THEN 'awaiting_approval'
+                    ELSE 'sandbox' END AS study_status
+                    FROM qiita.study_processed_data spd
+                    JOIN qiita.processed_data USING (processed_data_id)
+                    JOIN qiita.processed_data_status pds
+                        USING (processed_data_status_id)
+                    GROUP BY spd.study_id) ss USING (study_id)"""
+                col = "COALESCE(study_status, 'sandbox')"
+            elif col not in cls._info_cols:
+                raise QiitaDBColumnError("Can't sort by non-info column %s"
+                                         % col)
+            sort_cols.append("%s %s" % (col, direction))
+
+        sql = sql.format(search_cols, status_sql)
+        sql_args = []
+        where = []
         if study_ids is not None:
-            sql = "{0} WHERE study_id in ({1})".format(
-                sql, ','.join(str(s) for s in study_ids))
+            where.append("study_id in ({0})".format(
+                ','.join(str(s) for s in study_ids)))
+        if search:
+            # Escape the LIKE wildcards so the text is matched literally
+            pattern = "%%%s%%" % re.sub(r'([\\%_])', r'\\\1', search)
+            where.append(
+                "(CAST(study_id AS varchar) ILIKE %s OR study_title ILIKE %s "
+                "OR study_abstract ILIKE %s "
+                "OR array_to_string(pmid, ',') ILIKE %s "
+                "OR principal_investigator_id IN (SELECT study_person_id "
+                "FROM qiita.study_person WHERE name ILIKE %s))")
+            sql_args.extend([pattern] * 5)
+        if where:
+            sql = "{0} WHERE {1}".format(sql, ' AND '.join(where))
+
+        if sort_cols or limit is not None or offset is not None:
+            sort_cols.append('study_id')
+            sql = "{0} ORDER BY {1}".format(sql, ', '.join(sort_cols))
+        if limit is not None:
+            sql = "{0} LIMIT %s".format(sql)
+            sql_args.append(limit)
+        if offset is not None:
+            sql = "{0} OFFSET %s".format(sql)
+            sql_args.append(offset)
 
         conn_handler = SQLConnectionHandler()
-        return conn_handler.execute_fetchall(sql)
+        return conn_handler.execute_fetchall(sql, sql_args)
 
     @classmethod
     def exists(cls, study_title):
@@ -0,0 +1,4 @@
+-- October 19, 2026
+-- Store the seed used to rarefy the analysis BIOM tables, so they can be
+-- reproduced
+ALTER TABLE qiita.analysis ADD rarefaction_seed bigint;
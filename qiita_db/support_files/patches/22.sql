@@ -0,0 +1,6 @@
+-- October 19, 2026
+-- Add a fingerprint to the jobs, identifying the command, options and samples
+-- they run on, so duplicated jobs can be found with an index lookup. It is
+-- filled for the existing jobs by the python patch
+ALTER TABLE qiita.job ADD fingerprint varchar;
+CREATE UNIQUE INDEX idx_job_fingerprint ON qiita.job ( fingerprint );
@@ -0,0 +1,4 @@
+-- October 19, 2026
+-- Store the CPU time spent running each job, so the time saved when the
+-- results of a completed job are reused by another analysis can be measured
+ALTER TABLE qiita.job ADD cpu_time float8;
@@ -0,0 +1,4 @@
+-- October 19, 2026
+-- Adding a new filepath_type = preprocessed_demux_summary, the JSON summary
+-- written along the demultiplexed HDF5 file
+INSERT INTO qiita.filepath_type (filepath_type) VALUES ('preprocessed_demux_summary');
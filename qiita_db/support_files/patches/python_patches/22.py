@@ -0,0 +1,59 @@
+# October 19, 2026
+# Computes the fingerprint of the existing jobs, using the samples of the
+# first analysis they are attached to. Jobs duplicating an older one are left
+# without fingerprint, as the fingerprint is unique.
+#
+# New jobs are fingerprinted on the options given by the user, so the
+# options added when the analysis files are built (the input tables, the
+# mapping file and the output options) are removed before hashing. The
+# rarefaction of the tables is only known for analyses with a manifest, the
+# jobs of other analyses are left without fingerprint, as they can't be
+# told apart from jobs on tables rarefied differently.
+
+from json import loads
+from os.path import join, exists
+
+from qiita_db.job import Job
+from qiita_db.util import get_mountpoint, params_dict_to_json
+from qiita_db.sql_connection import SQLConnectionHandler
+
+conn_handler = SQLConnectionHandler()
+
+_, analysis_fp = get_mountpoint('analysis', conn_handler=conn_handler)[0]
+
+jobs = conn_handler.execute_fetchall(
+    'SELECT j.job_id, j.data_type_id, j.command_id, j.options, c.output, '
+    'min(aj.analysis_id) FROM qiita.job j JOIN qiita.analysis_job aj '
+    'ON j.job_id = aj.job_id JOIN qiita.command c '
+    'ON j.command_id = c.command_id '
+    'GROUP BY j.job_id, c.output ORDER BY j.job_id')
+
+seen = set()
+for job_id, data_type_id, command_id, options, output, analysis_id in jobs:
+    manifest_fp = join(analysis_fp, "%d_analysis_manifest.json" % analysis_id)
+    if not exists(manifest_fp):
+        continue
+    with open(manifest_fp) as f:
+        manifest = loads(f.read())
+    rarefaction = None
+    if manifest['rarefaction_depth'] is not None:
+        rarefaction = (manifest['rarefaction_depth'],
+                       manifest['rarefaction_seed'])
+
+    options = loads(options) if options else {}
+    for opt in ['--otu_table_fp', '--mapping_fp'] + list(loads(output)):
+        options.pop(opt, None)
+
+    samples = dict(conn_handler.execute_fetchall(
+        'SELECT processed_data_id, array_agg(sample_id ORDER BY sample_id) '
+        'FROM qiita.analysis_sample WHERE analysis_id = %s '
+        'GROUP BY processed_data_id', [analysis_id]))
+    fingerprint = Job.fingerprint(data_type_id, command_id,
+                                  params_dict_to_json(options), samples,
+                                  rarefaction)
+    if fingerprint in seen:
+        continue
+    seen.add(fingerprint)
+    conn_handler.execute(
+        'UPDATE qiita.job SET fingerprint = %s WHERE job_id = %s',
+        [fingerprint, job_id])
@@ -345,7 +345,7 @@ INSERT INTO qiita.filepath (filepath, filepath_type_id, checksum, checksum_algor
 ('2_test_folder', 8, '852952723', 1, 2);
 
 -- Insert jobs
-INSERT INTO qiita.job (data_type_id, job_status_id, command_id, options) VALUES (2, 1, 1, '{"--otu_table_fp":1}'), (2, 3, 2, '{"--mapping_fp":1,"--otu_table_fp":1}'), (2, 1, 2, '{"--mapping_fp":1,"--otu_table_fp":1}');
+INSERT INTO qiita.job (data_type_id, job_status_id, command_id, options, fingerprint) VALUES (2, 1, 1, '{"--otu_table_fp":1}', '181216d8dcba5a766131c501434cfe2254f5a9d0'), (2, 3, 2, '{"--mapping_fp":1,"--otu_table_fp":1}', '47d9bfcad5b17d6f2a2e920642fe78be7a79bf09'), (2, 1, 2, '{"--mapping_fp":1,"--otu_table_fp":1}', '9a35e8bfb0fe9ab31074a4b095d03c0d6678c6a6');
 
 -- Insert Analysis
 INSERT INTO qiita.analysis (email, name, description, analysis_status_id, pmid) VALUES ('test@foo.bar', 'SomeAnalysis', 'A test analysis', 1, '121112'), ('test@foo.bar', 'SomeSecondAnalysis', 'Another test analysis', 1, '22221112');
@@ -1,8 +1,9 @@
 from unittest import TestCase, main
-from os import remove
+from os import remove, stat, utime
 from os.path import exists, join
 from datetime import datetime
 from shutil import move
+from json import loads
 
 from biom import load_table
 import pandas as pd
@@ -11,7 +12,7 @@ from qiita_core.util import qiita_test_checker
 from qiita_db.analysis import Analysis, Collection
 from qiita_db.job import Job
 from qiita_db.user import User
-from qiita_db.exceptions import QiitaDBStatusError
+from qiita_db.exceptions import QiitaDBStatusError, QiitaDBUnknownIDError
 from qiita_db.util import get_mountpoint
 from qiita_db.study import Study, StudyPerson
 from qiita_db.data import ProcessedData
@@ -32,12 +33,15 @@ class TestAnalysis(TestCase):
         _, self.fp = get_mountpoint("analysis")[0]
         self.biom_fp = join(self.fp, "1_analysis_18S.biom")
         self.map_fp = join(self.fp, "1_analysis_mapping.txt")
+        self.manifest_fp = join(self.fp, "1_analysis_manifest.json")
 
     def tearDown(self):
         with open(self.biom_fp, 'w') as f:
                 f.write("")
         with open(self.map_fp, 'w') as f:
                 f.write("")
+        if exists(self.manifest_fp):
+            remove(self.manifest_fp)
 
         fp = join(get_mountpoint('analysis')[0][1], 'testfile.txt')
         if exists(fp):
@@ -364,13 +368,13 @@ class TestAnalysis(TestCase):
             mapdata = f.readlines()
         # check some columns for correctness
         obs = [line.split('\t')[0] for line in mapdata]
-        exp = ['#SampleID', '1.SKB8.640193', '1.SKD8.640184',
-               '1.SKB7.640196']
+        exp = ['#SampleID', '1.SKB7.640196', '1.SKB8.640193',
+               '1.SKD8.640184']
         self.assertEqual(obs, exp)
 
         obs = [line.split('\t')[1] for line in mapdata]
-        exp = ['BarcodeSequence', 'AGCGCTCACATC', 'TGAGTGGTCTGT',
-               'CGGCCTAAGTTC']
+        exp = ['BarcodeSequence', 'CGGCCTAAGTTC', 'AGCGCTCACATC',
+               'TGAGTGGTCTGT']
         self.assertEqual(obs, exp)
 
         obs = [line.split('\t')[2] for line in mapdata]
@@ -379,18 +383,24 @@ class TestAnalysis(TestCase):
         self.assertEqual(obs, exp)
 
         obs = [line.split('\t')[19] for line in mapdata]
-        exp = ['host_subject_id', '1001:M7', '1001:D9',
-               '1001:M8']
+        exp = ['host_subject_id', '1001:M8', '1001:M7',
+               '1001:D9']
         self.assertEqual(obs, exp)
 
         obs = [line.split('\t')[47] for line in mapdata]
-        exp = ['tot_org_carb', '5.0', '4.32', '5.0']
+        exp = ['tot_org_carb', '5.0', '5.0', '4.32']
         self.assertEqual(obs, exp)
 
         obs = [line.split('\t')[-1] for line in mapdata]
         exp = ['Description\n'] + ['Cannabis Soil Microbiome\n'] * 3
         self.assertEqual(obs, exp)
 
+    def test_build_mapping_file_unknown_processed_data(self):
+        samples = {1: ['1.SKB8.640193'], 100: ['1.SKD8.640184']}
+        with self.assertRaises(QiitaDBUnknownIDError):
+            self.analysis._build_mapping_file(samples,
+                                              conn_handler=self.conn_handler)
+
     def test_build_mapping_file_duplicate_samples(self):
         samples = {1: ['1.SKB8.640193', '1.SKB8.640193', '1.SKD8.640184']}
         with self.assertRaises(ValueError):
@@ -416,6 +426,118 @@ class TestAnalysis(TestCase):
                'Processed_id': 1}
         self.assertEqual(obs, exp)
 
+    def test_build_biom_tables_rarefaction_seed(self):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']}
+        self.analysis._build_biom_tables(samples, 100, 42,
+                                         conn_handler=self.conn_handler)
+        self.assertEqual(self.analysis.rarefaction_seed, 42)
+        exp = load_table(self.biom_fp)
+        self.assertTrue((exp.sum(axis='sample') == 100).all())
+
+        # the same seed gives the same tables
+        remove(self.biom_fp)
+        self.analysis._build_biom_tables(samples, 100, 42,
+                                         conn_handler=self.conn_handler)
+        obs = load_table(self.biom_fp)
+        self.assertEqual(obs, exp)
+
+    def test_build_biom_tables_no_rarefaction_clears_seed(self):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']}
+        self.analysis._build_biom_tables(samples, 100, 42,
+                                         conn_handler=self.conn_handler)
+        self.assertEqual(self.analysis.rarefaction_seed, 42)
+
+        # the tables are not rarefied anymore, so they have no seed
+        self.analysis._build_biom_tables(samples, None, 42,
+                                         conn_handler=self.conn_handler)
+        self.assertIsNone(self.analysis.rarefaction_seed)
+        with open(self.manifest_fp) as f:
+            manifest = loads(f.read())
+        self.assertIsNone(manifest['rarefaction_depth'])
+        self.assertIsNone(manifest['rarefaction_seed'])
+
+    def test_build_biom_tables_removed_data_type(self):
+        fpid = self.conn_handler.execute_fetchone(
+            "SELECT filepath_id FROM qiita.filepath WHERE filepath = %s",
+            ["1_analysis_18S.biom"])[0]
+        # none of the samples of the analysis are 18S anymore
+        self.analysis._build_biom_tables({}, None,
+                                         conn_handler=self.conn_handler)
+        self.assertIsNone(self.analysis.biom_tables)
+        self.assertFalse(exists(self.biom_fp))
+        obs = self.conn_handler.execute_fetchall(
+            "SELECT * FROM qiita.filepath WHERE filepath_id = %s", [fpid])
+        self.assertEqual(obs, [])
+
+    def test_build_biom_tables_random_seed(self):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']}
+        self.analysis._build_biom_tables(samples, 100,
+                                         conn_handler=self.conn_handler)
+        self.assertIsNotNone(self.analysis.rarefaction_seed)
+
+    def _assert_same_samples(self, obs, exp):
+        self.assertEqual(set(obs.ids()), set(exp.ids()))
+        obs_ids = set(obs.ids(axis='observation'))
+        for sid in exp.ids():
+            exp_data = {oid: v for oid, v in zip(
+                exp.ids(axis='observation'), exp.data(sid)) if v > 0}
+            obs_data = {oid: v for oid, v in zip(
+                obs.ids(axis='observation'), obs.data(sid)) if v > 0}
+            self.assertEqual(obs_data, exp_data)
+            self.assertEqual(obs.metadata(sid), exp.metadata(sid))
+        self.assertEqual(obs_ids, set(exp.ids(axis='observation')))
+
+    def _test_build_biom_tables_incremental(self, depth):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']}
+        self.analysis._build_biom_tables(samples, depth, 42,
+                                         conn_handler=self.conn_handler)
+        with open(self.manifest_fp) as f:
+            manifest = loads(f.read())
+        self.assertEqual(manifest['rarefaction_depth'], depth)
+        self.assertEqual(manifest['tables']['18S']['samples'],
+                         {'1': sorted(samples[1])})
+
+        # the table is patched, removing and adding samples
+        samples = {1: ['1.SKB8.640193', '1.SKM4.640180', '1.SKM9.640192']}
+        self.analysis._build_biom_tables(samples, depth,
+                                         conn_handler=self.conn_handler)
+        obs = load_table(self.biom_fp)
+        self.assertEqual(self.analysis.biom_tables, {'18S': self.biom_fp})
+        self.assertEqual(self.analysis.rarefaction_seed,
+                         42 if depth else None)
+
+        # and it is the same as building it from scratch
+        remove(self.manifest_fp)
+        self.analysis._build_biom_tables(samples, depth, 42,
+                                         conn_handler=self.conn_handler)
+        exp = load_table(self.biom_fp)
+        self._assert_same_samples(obs, exp)
+
+    def test_build_biom_tables_incremental(self):
+        self._test_build_biom_tables_incremental(None)
+
+    def test_build_biom_tables_incremental_rarefied(self):
+        self._test_build_biom_tables_incremental(100)
+
+    def test_build_biom_tables_unchanged(self):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196']}
+        self.analysis._build_biom_tables(samples, None,
+                                         conn_handler=self.conn_handler)
+        utime(self.biom_fp, (1000, 1000))
+        self.analysis._build_biom_tables(samples, None,
+                                         conn_handler=self.conn_handler)
+        self.assertEqual(stat(self.biom_fp).st_mtime, 1000)
+
+        # a different rarefaction rebuilds the table
+        self.analysis._build_biom_tables(samples, 100,
+                                         conn_handler=self.conn_handler)
+        self.assertNotEqual(stat(self.biom_fp).st_mtime, 1000)
+        table = load_table(self.biom_fp)
+        self.assertTrue((table.sum(axis='sample') == 100).all())
+
+    def test_retrieve_rarefaction_seed_none(self):
+        self.assertIsNone(self.analysis.rarefaction_seed)
+
     def test_build_files(self):
         self.analysis.build_files()
 
@@ -449,6 +571,19 @@ class TestAnalysis(TestCase):
         exp = [[1, 19, 2]]
         self.assertEqual(obs, exp)
 
+        # adding a rebuilt file updates its checksum
+        with open(fp, 'w') as f:
+            f.write('new testfile!')
+        self.analysis._add_file('testfile.txt', 'plain_text', '18S')
+        obs = self.conn_handler.execute_fetchall(
+            'SELECT * FROM qiita.filepath WHERE filepath_id >= 19')
+        exp = [[19, 'testfile.txt', 9, '4006736175', 1, 1]]
+        self.assertEqual(obs, exp)
+        obs = self.conn_handler.execute_fetchall(
+            'SELECT * FROM qiita.analysis_filepath WHERE filepath_id >= 19')
+        exp = [[1, 19, 2]]
+        self.assertEqual(obs, exp)
+
 
 @qiita_test_checker()
 class TestCollection(TestCase):
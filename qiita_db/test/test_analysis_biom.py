@@ -0,0 +1,272 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+from unittest import TestCase, main
+from os import utime, listdir
+from os.path import join, exists
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+import numpy.testing as npt
+from biom import Table, load_table
+
+from qiita_db.util import get_mountpoint
+from qiita_db.analysis_biom import (load_filtered_table, merge_tables,
+                                    build_tables, rarefy_table, patch_table,
+                                    write_tables, FilteredTableCache,
+                                    _rarefy_counts)
+
+
+class AnalysisBiomTests(TestCase):
+    def setUp(self):
+        _, base_fp = get_mountpoint('processed_data')[0]
+        self.fp1 = join(base_fp,
+                        '1_study_1001_closed_reference_otu_table.biom')
+        self.fp2 = join(base_fp,
+                        '2_study_1001_closed_reference_otu_table.biom')
+        self.samples = ['1.SKB8.640193', '1.SKD8.640184', '1.SKB7.640196',
+                        '1.not_in_table']
+        self.md = {'Study': 'Some study', 'Processed_id': 1}
+        self.cache_dir = mkdtemp()
+        self._clean_up_dirs = [self.cache_dir]
+
+    def tearDown(self):
+        for d in self._clean_up_dirs:
+            if exists(d):
+                rmtree(d)
+
+    def _assert_tables_equal(self, obs, exp):
+        self.assertEqual(list(obs.ids()), list(exp.ids()))
+        self.assertEqual(list(obs.ids(axis='observation')),
+                         list(exp.ids(axis='observation')))
+        npt.assert_equal(obs.matrix_data.toarray(),
+                         exp.matrix_data.toarray())
+        self.assertEqual(obs.metadata(), exp.metadata())
+
+    def test_load_filtered_table(self):
+        obs = load_filtered_table(self.fp1, self.samples, self.md)
+        self.assertEqual(set(obs.ids()), set(self.samples[:3]))
+        for sid in obs.ids():
+            self.assertEqual(obs.metadata(sid), self.md)
+
+    def test_merge_tables(self):
+        t1 = Table(np.array([[2, 0], [6, 1]]), ['O1', 'O2'], ['S1', 'S2'],
+                   sample_metadata=[{'a': 1}, {'a': 2}])
+        t2 = Table(np.array([[4, 5], [0, 3], [10, 10]]), ['O1', 'O2', 'O3'],
+                   ['S1', 'S3'], sample_metadata=[{'a': 3}, {'a': 4}])
+        t3 = Table(np.array([[1]]), ['O4'], ['S4'])
+
+        obs = merge_tables([t1, t2, t3])
+        self._assert_tables_equal(obs, t1.merge(t2).merge(t3))
+        exp = np.array([[6, 0, 5, 0], [6, 1, 3, 0], [10, 0, 10, 0],
+                        [0, 0, 0, 1]])
+        npt.assert_equal(obs.matrix_data.toarray(), exp)
+
+    def test_merge_tables_single(self):
+        table = load_table(self.fp1)
+        self._assert_tables_equal(merge_tables([table]), table)
+
+    def test_build_tables(self):
+        md2 = {'Study': 'Some study', 'Processed_id': 2}
+        samples2 = ['2.SKB8.640193', '2.SKD8.640184', '2.SKB7.640196']
+        specs = [('18S', self.fp1, self.samples[:2], self.md, 'a'),
+                 ('16S', self.fp2, samples2, md2, 'b'),
+                 ('18S', self.fp2, samples2[1:], md2, 'c')]
+        exp_18S = load_filtered_table(*specs[0][1:4]).merge(
+            load_filtered_table(*specs[2][1:4]))
+        exp_16S = load_filtered_table(*specs[1][1:4])
+
+        for n_jobs in (1, 2):
+            obs = build_tables(specs, n_jobs=n_jobs)
+            self.assertEqual(set(obs), {'18S', '16S'})
+            self._assert_tables_equal(obs['18S'], exp_18S)
+            self._assert_tables_equal(obs['16S'], exp_16S)
+
+        # cached tables give the same results
+        cache = FilteredTableCache(self.cache_dir, 10 ** 9)
+        for _ in range(2):
+            obs = build_tables(specs, n_jobs=2, cache=cache)
+            self.assertEqual(sorted(listdir(self.cache_dir)),
+                             ['a.biom', 'b.biom', 'c.biom'])
+            self._assert_tables_equal(obs['18S'], exp_18S)
+            self._assert_tables_equal(obs['16S'], exp_16S)
+
+    def test_cache_key(self):
+        key = FilteredTableCache.key(1, '852952723', ['b', 'a'])
+        self.assertEqual(key, FilteredTableCache.key(1, '852952723',
+                                                     ['a', 'b', 'a']))
+        self.assertNotEqual(key, FilteredTableCache.key(2, '852952723',
+                                                        ['a', 'b']))
+        self.assertNotEqual(key, FilteredTableCache.key(1, '1', ['a', 'b']))
+        self.assertNotEqual(key, FilteredTableCache.key(1, '852952723',
+                                                        ['a']))
+
+    def test_cache_dir_created(self):
+        cache_dir = join(self.cache_dir, 'new', 'dir')
+        FilteredTableCache(cache_dir, 10)
+        self.assertTrue(exists(cache_dir))
+
+    def test_cache_get_put(self):
+        cache = FilteredTableCache(self.cache_dir, 10 ** 9)
+        self.assertIsNone(cache.get('key'))
+        table = load_filtered_table(self.fp1, self.samples, self.md)
+        cache.put('key', table)
+        obs = cache.get('key')
+        self.assertEqual(set(obs.ids()), set(table.ids()))
+        npt.assert_equal(obs.matrix_data.toarray(),
+                         table.matrix_data.toarray())
+
+    def test_load_filtered_table_cache(self):
+        cache = FilteredTableCache(self.cache_dir, 10 ** 9)
+        exp = load_filtered_table(self.fp1, self.samples, self.md)
+        obs = load_filtered_table(self.fp1, self.samples, self.md, cache,
+                                  'key')
+        self._assert_tables_equal(obs, exp)
+        # the cached table is stored without the sample metadata, so it can
+        # be reused with different metadata
+        self.assertIsNone(cache.get('key').metadata())
+        md = {'Study': 'Other title', 'Processed_id': 1}
+        obs = load_filtered_table('/does/not/exist', self.samples, md, cache,
+                                  'key')
+        self.assertEqual(obs.metadata(obs.ids()[0]), md)
+
+        # tables without samples are not cached
+        load_filtered_table(self.fp1, ['not.in.table'], self.md, cache,
+                            'empty')
+        self.assertIsNone(cache.get('empty'))
+
+    def test_cache_evict(self):
+        cache = FilteredTableCache(self.cache_dir, 10 ** 9)
+        table = load_filtered_table(self.fp1, self.samples, self.md)
+        for i, key in enumerate(['old', 'new', 'used']):
+            cache.put(key, table)
+            fp = join(self.cache_dir, key + '.biom')
+            utime(fp, (1000 * (i + 1), 1000 * (i + 1)))
+        # using a table makes it the most recently used
+        cache.get('old')
+        size = len(open(fp, 'rb').read())
+
+        cache.evict()
+        self.assertEqual(len(listdir(self.cache_dir)), 3)
+
+        cache.max_size = 2 * size
+        cache.evict()
+        self.assertEqual(sorted(listdir(self.cache_dir)),
+                         ['old.biom', 'used.biom'])
+
+        cache.max_size = 0
+        cache.evict()
+        self.assertEqual(listdir(self.cache_dir), [])
+
+    def test_rarefy_table(self):
+        table = Table(np.array([[0, 2, 3, 0], [1, 0, 2, 0], [4, 0, 0, 0]]),
+                      ['O1', 'O2', 'O3'], ['S1', 'S2', 'S3', 'S4'],
+                      [{'tax': 'a'}, {'tax': 'b'}, {'tax': 'c'}],
+                      [{'a': 1}, {'a': 2}, {'a': 3}, {'a': 4}])
+        obs = rarefy_table(table, 5, 3)
+        # samples with less than 5 observations and observations not found
+        # in the remaining samples are removed
+        self.assertEqual(list(obs.ids()), ['S1', 'S3'])
+        self.assertEqual(list(obs.ids(axis='observation')), ['O1', 'O2',
+                                                             'O3'])
+        npt.assert_equal(obs.matrix_data.toarray(),
+                         np.array([[0, 3], [1, 2], [4, 0]]))
+        self.assertEqual(obs.metadata(), ({'a': 1}, {'a': 3}))
+        self.assertEqual(obs.metadata(axis='observation'),
+                         ({'tax': 'a'}, {'tax': 'b'}, {'tax': 'c'}))
+
+        obs = rarefy_table(table, 1, 3)
+        self.assertEqual(list(obs.ids()), ['S1', 'S2', 'S3'])
+        npt.assert_equal(obs.sum(axis='sample'), [1, 1, 1])
+
+    def test_rarefy_counts(self):
+        rand = np.random.RandomState(0)
+        counts = np.array([5, 0, 20, 75])
+        picked = np.array([_rarefy_counts(rand, counts, 10)
+                           for _ in range(2000)])
+        npt.assert_equal(picked.sum(axis=1), 10)
+        self.assertTrue((picked <= counts).all())
+        # each observation is as likely to be kept as any other
+        npt.assert_allclose(picked.mean(axis=0), [0.5, 0, 2, 7.5], atol=0.1)
+
+        npt.assert_equal(_rarefy_counts(rand, counts, 100), counts)
+        npt.assert_equal(_rarefy_counts(rand, counts, 0), [0, 0, 0, 0])
+        # the time doesn't depend on the number of observations
+        deep = np.array([10 ** 12, 3 * 10 ** 12])
+        self.assertEqual(_rarefy_counts(rand, deep, 1000).sum(), 1000)
+
+    def test_rarefy_table_seed(self):
+        table = load_table(self.fp1)
+        obs = rarefy_table(table, 100, 42)
+        npt.assert_equal(obs.sum(axis='sample'), [100] * 7)
+        self.assertEqual(obs, rarefy_table(table, 100, 42))
+        self.assertNotEqual(obs, rarefy_table(table, 100, 43))
+        # values are never over the original ones
+        orig = table.filter(obs.ids(), inplace=False).filter(
+            obs.ids(axis='observation'), axis='observation', inplace=False)
+        self.assertTrue((orig.matrix_data - obs.matrix_data).min() >= 0)
+
+    def test_rarefy_table_independent_samples(self):
+        table = load_table(self.fp1)
+        subset = ['1.SKB8.640193', '1.SKD8.640184']
+        exp = rarefy_table(table, 100, 42).filter(subset, inplace=False)
+        exp.filter(lambda v, i, md: v.sum() > 0, axis='observation')
+        obs = rarefy_table(table.filter(subset, inplace=False), 100, 42)
+        self.assertEqual(obs, exp)
+
+    def test_patch_table(self):
+        table = Table(np.array([[0, 2, 3], [1, 0, 2], [4, 0, 0]]),
+                      ['O1', 'O2', 'O3'], ['S1', 'S2', 'S3'])
+        added = Table(np.array([[1, 7]]), ['O4'], ['S4', 'S5'])
+        obs = patch_table(table, {'S1', 'S3'}, added)
+        self.assertEqual(list(obs.ids()), ['S2', 'S4', 'S5'])
+        # O2 and O3 are only found in the removed samples
+        self.assertEqual(list(obs.ids(axis='observation')), ['O1', 'O4'])
+        npt.assert_equal(obs.matrix_data.toarray(),
+                         np.array([[2, 0, 0], [0, 1, 7]]))
+
+        obs = patch_table(table, {'S1'})
+        self.assertEqual(list(obs.ids()), ['S2', 'S3'])
+        self.assertEqual(list(obs.ids(axis='observation')), ['O1', 'O2'])
+
+    def test_patch_table_rarefied(self):
+        table = load_table(self.fp1)
+        exp = rarefy_table(table, 100, 42)
+        old = rarefy_table(table.filter(['1.SKB8.640193', '1.SKD8.640184'],
+                                        inplace=False), 100, 42)
+        added = table.filter(['1.SKB7.640196', '1.SKM3.640197',
+                              '1.SKM9.640192', '1.SKM4.640180',
+                              '1.SKD2.640178'], inplace=False)
+        obs = patch_table(old, {'1.SKD8.640184'}, added, 100, 42)
+        exp.filter(['1.SKD8.640184'], invert=True)
+        exp.filter(lambda v, i, md: v.sum() > 0, axis='observation')
+        self.assertEqual(set(obs.ids()), set(exp.ids()))
+        self.assertEqual(set(obs.ids(axis='observation')),
+                         set(exp.ids(axis='observation')))
+        for sid in exp.ids():
+            self.assertEqual(
+                dict(zip(obs.ids(axis='observation'), obs.data(sid))),
+                dict(zip(exp.ids(axis='observation'), exp.data(sid))))
+
+    def test_write_tables(self):
+        table = load_filtered_table(self.fp1, self.samples, self.md)
+        fp1 = join(self.cache_dir, 'table1.biom')
+        fp2 = join(self.cache_dir, 'table2.biom')
+        for n_jobs in (1, 2):
+            write_tables([(table, fp1, None, None, 'test'),
+                          (table, fp2, 10, 42, 'test')], n_jobs=n_jobs)
+            # the observations of the samples not in the table are dropped
+            self.assertEqual(load_table(fp1), table.filter(
+                lambda v, i, md: v.sum() > 0, axis='observation',
+                inplace=False))
+            self.assertEqual(load_table(fp2), rarefy_table(table, 10, 42))
+
+
+if __name__ == '__main__':
+    main()
@@ -566,6 +566,10 @@ class TestUpdatePreprocessedDataFromCmd(TestCase):
             (next_fp_id,
              join(self.db_ppd_dir, "%s_split_library_log.txt" % exp_ppd.id),
              'log'))
+        exp_fps.append(
+            (next_fp_id + 1,
+             join(self.db_ppd_dir, "%s_demux_summary.json" % exp_ppd.id),
+             'preprocessed_demux_summary'))
 
         ppd = update_preprocessed_data_from_cmd(self.test_slo, 1)
 
@@ -615,7 +619,8 @@ class TestUpdatePreprocessedDataFromCmd(TestCase):
         suffix_types = [("seqs.fna", "preprocessed_fasta"),
                         ("seqs.fastq", "preprocessed_fastq"),
                         ("seqs.demux", "preprocessed_demux"),
-                        ("split_library_log.txt", "log")]
+                        ("split_library_log.txt", "log"),
+                        ("demux_summary.json", "preprocessed_demux_summary")]
         for id_, vals in enumerate(suffix_types, start=next_fp_id):
             suffix, fp_type = vals
             exp_fps.append(
@@ -97,6 +97,50 @@ class JobTest(TestCase):
         self.assertFalse(exists)
         self.assertEqual(jid, None)
 
+    def test_exists_other_samples(self):
+        """tests that a job run on other samples does not match"""
+        self.conn_handler.execute(
+            "DELETE FROM qiita.analysis_sample WHERE analysis_id = 1 AND "
+            "sample_id = '1.SKM4.640180'")
+        self.assertFalse(Job.exists("18S", "Beta Diversity",
+                                    {"--otu_table_fp": 1,
+                                     "--mapping_fp": 1}, Analysis(1)))
+        # the job of analysis 2 was run on the same samples
+        self.conn_handler.execute(
+            "DELETE FROM qiita.analysis_sample WHERE analysis_id = 1")
+        self.conn_handler.execute(
+            "INSERT INTO qiita.analysis_sample "
+            "(analysis_id, processed_data_id, sample_id) VALUES "
+            "(1, 1,'1.SKB8.640193'), (1, 1,'1.SKD8.640184'), "
+            "(1, 1,'1.SKB7.640196'), (1, 1,'1.SKM3.640197')")
+        exists, job = Job.exists("18S", "Beta Diversity",
+                                 {"--otu_table_fp": 1, "--mapping_fp": 1},
+                                 Analysis(1), return_existing=True)
+        self.assertTrue(exists)
+        self.assertEqual(job, Job(3))
+
+    def test_fingerprint(self):
+        samples = {1: ['1.SKB8.640193', '1.SKD8.640184'], 2: ['2.SKB8.640193']}
+        obs = Job.fingerprint(2, 1, '{"--otu_table_fp":1}', samples)
+        # the order of the processed data and samples does not matter
+        self.assertEqual(obs, Job.fingerprint(
+            2, 1, '{"--otu_table_fp":1}',
+            {2: ['2.SKB8.640193'], 1: ['1.SKD8.640184', '1.SKB8.640193']}))
+        self.assertNotEqual(obs, Job.fingerprint(
+            2, 2, '{"--otu_table_fp":1}', samples))
+        self.assertNotEqual(obs, Job.fingerprint(
+            2, 1, '{"--otu_table_fp":2}', samples))
+        self.assertNotEqual(obs, Job.fingerprint(
+            2, 1, '{"--otu_table_fp":1}', {1: ['1.SKB8.640193']}))
+        # tables rarefied with another depth or seed give other results
+        rare = Job.fingerprint(2, 1, '{"--otu_table_fp":1}', samples,
+                               (100, 5))
+        self.assertNotEqual(obs, rare)
+        self.assertNotEqual(rare, Job.fingerprint(
+            2, 1, '{"--otu_table_fp":1}', samples, (100, 6)))
+        self.assertNotEqual(rare, Job.fingerprint(
+            2, 1, '{"--otu_table_fp":1}', samples, (200, 5)))
+
     def test_get_commands(self):
         exp = [
             Command('Summarize Taxa', 'summarize_taxa_through_plots.py',
@@ -186,7 +230,8 @@ class JobTest(TestCase):
         # make sure job inserted correctly
         obs = self.conn_handler.execute_fetchall("SELECT * FROM qiita.job "
                                                  "WHERE job_id = 4")
-        exp = [[4, 2, 1, 3, '{"opt1":4}', None]]
+        exp = [[4, 2, 1, 3, '{"opt1":4}', None,
+                '028f61b76288f6568ad9b927ba0cd9990d154208', None]]
         self.assertEqual(obs, exp)
         # make sure job added to analysis correctly
         obs = self.conn_handler.execute_fetchall("SELECT * FROM "
@@ -201,7 +246,8 @@ class JobTest(TestCase):
         # make sure job inserted correctly
         obs = self.conn_handler.execute_fetchall("SELECT * FROM qiita.job "
                                                  "WHERE job_id = 5")
-        exp = [[5, 1, 1, 2, '{"opt1":4}', None]]
+        exp = [[5, 1, 1, 2, '{"opt1":4}', None,
+                '8d9954777ea79667f0bb1e50d0b6cd22e37e9a4e', None]]
         self.assertEqual(obs, exp)
         # make sure job added to analysis correctly
         obs = self.conn_handler.execute_fetchall("SELECT * FROM "
@@ -210,6 +256,19 @@ class JobTest(TestCase):
         exp = [[1, 5]]
         self.assertEqual(obs, exp)
 
+    def test_create_rarefied(self):
+        """Makes sure a job on rarefied tables doesn't match the others"""
+        new = Job.create("18S", "Beta Diversity",
+                         {"--otu_table_fp": 1, "--mapping_fp": 1},
+                         Analysis(1), rarefaction=(100, 5))
+        self.assertEqual(new.id, 4)
+        self.assertTrue(Job.exists("18S", "Beta Diversity",
+                                   {"--otu_table_fp": 1, "--mapping_fp": 1},
+                                   Analysis(1), rarefaction=(100, 5)))
+        self.assertFalse(Job.exists("18S", "Beta Diversity",
+                                    {"--otu_table_fp": 1, "--mapping_fp": 1},
+                                    Analysis(1), rarefaction=(100, 6)))
+
     def test_create_exists(self):
         """Makes sure creation doesn't duplicate a job"""
         with self.assertRaises(QiitaDBDuplicateError):
@@ -279,6 +338,23 @@ class JobTest(TestCase):
         self.assertEqual(error.msg, 'TESTERROR')
         self.assertTrue(before < error.time < after)
 
+    def test_cpu_time(self):
+        self.assertEqual(self.job.cpu_time, None)
+        self.job.cpu_time = 12.5
+        self.assertEqual(self.job.cpu_time, 12.5)
+
+    def test_analyses(self):
+        self.assertEqual(self.job.analyses, [1])
+        self.conn_handler.execute(
+            "INSERT INTO qiita.analysis_job (analysis_id, job_id) "
+            "VALUES (2, 1)")
+        self.assertEqual(self.job.analyses, [1, 2])
+
+    def test_set_cpu_time_completed(self):
+        self.job.status = "completed"
+        with self.assertRaises(QiitaDBStatusError):
+            self.job.cpu_time = 12.5
+
     def test_retrieve_error_blank(self):
         self.assertEqual(self.job.error, None)
 
@@ -197,6 +197,19 @@ class SearchTest(TestCase):
         self.assertEqual(meta.keys(), [1])
         assert_frame_equal(meta[1], exp_meta)
 
+    def test_filter_by_processed_data_datatypes(self):
+        search = QiitaStudySearch()
+        results, meta_cols = search('study_id = 1', User('test@foo.bar'))
+        spid, pds, meta = search.filter_by_processed_data(['16S'])
+        self.assertEqual(spid, {1: {}})
+        self.assertEqual(pds, {})
+        self.assertEqual(meta.keys(), [1])
+
+        spid, pds, meta = search.filter_by_processed_data(['18S', '16S'])
+        self.assertEqual(spid, {1: {'18S': [1]}})
+        self.assertEqual(pds.keys(), [1])
+        self.assertEqual(len(pds[1]), 27)
+
 
 if __name__ == "__main__":
     main()
@@ -252,6 +252,55 @@ class TestStudy(TestCase):
                [False, None, 'QIIME portal', False, 'test_study_1', 'None']]
         self.assertEqual(obs, exp)
 
+    def test_get_info_order_by_and_page(self):
+        info = {
+            'timeseries_type_id': 1,
+            'portal_type_id': 1,
+            'lab_person_id': None,
+            'principal_investigator_id': 3,
+            'metadata_complete': False,
+            'mixs_compliant': True,
+            'study_description': 'desc',
+            'study_alias': 'alias',
+            'study_abstract': 'abstract'}
+        Study.create(User('test@foo.bar'), 'test_study_1', efo=[1], info=info)
+
+        obs = Study.get_info(info_cols=['study_id'],
+                             order_by=[('study_title', 'desc')])
+        self.assertEqual(obs, [[2], [1]])
+
+        # study 1 has private processed data, study 2 is sandboxed
+        obs = Study.get_info([1, 2], ['study_id'],
+                             order_by=[('status', 'asc')])
+        self.assertEqual(obs, [[1], [2]])
+
+        obs = Study.get_info(info_cols=['study_id'], limit=1)
+        self.assertEqual(obs, [[1]])
+        obs = Study.get_info(info_cols=['study_id'], limit=1, offset=1)
+        self.assertEqual(obs, [[2]])
+        obs = Study.get_info(info_cols=['study_id'], offset=2)
+        self.assertEqual(obs, [])
+
+    def test_get_info_search(self):
+        obs = Study.get_info(info_cols=['study_id'], search='CANNABIS')
+        self.assertEqual(obs, [[1]])
+        # principal investigator name and PubMed id
+        obs = Study.get_info(info_cols=['study_id'], search='pidude')
+        self.assertEqual(obs, [[1]])
+        obs = Study.get_info([1], ['study_id'], search='7891011')
+        self.assertEqual(obs, [[1]])
+        obs = Study.get_info(info_cols=['study_id'], search='not there')
+        self.assertEqual(obs, [])
+        # the LIKE wildcards are matched literally
+        obs = Study.get_info(info_cols=['study_id'], search='%')
+        self.assertEqual(obs, [])
+
+    def test_get_info_order_by_error(self):
+        with self.assertRaises(QiitaDBColumnError):
+            Study.get_info(order_by=[('not_a_column', 'asc')])
+        with self.assertRaises(IncompetentQiitaDeveloperError):
+            Study.get_info(order_by=[('study_id', 'up')])
+
     def test_has_access_public(self):
         self._change_processed_data_status('public')
         self.assertTrue(self.study.has_access(User("demo@microbio.me")))
@@ -7,8 +7,8 @@
 # -----------------------------------------------------------------------------
 
 from unittest import TestCase, main
-from tempfile import mkstemp
-from os import close, remove
+from tempfile import mkstemp, mkdtemp
+from os import close, remove, makedirs
 from os.path import join, exists, basename
 from shutil import rmtree
 
@@ -19,9 +19,11 @@ from qiita_db.data import RawData
 from qiita_db.study import Study
 from qiita_db.reference import Reference
 from qiita_db.util import (exists_table, exists_dynamic_table, scrub_data,
-                           compute_checksum, check_table_cols,
+                           compute_checksum, compute_checksums,
+                           check_table_cols,
                            check_required_columns, convert_to_id,
                            get_table_cols, get_table_cols_w_type,
+                           get_cached_table_cols, LazyTableColumns,
                            get_filetypes, get_filepath_types, get_count,
                            check_count, get_processed_params_tables,
                            params_dict_to_json, insert_filepaths,
@@ -120,6 +122,26 @@ class DBUtilTests(TestCase):
                "pass_reset_timestamp"}
         self.assertEqual(set(obs), exp)
 
+    def test_get_cached_table_cols(self):
+        exp = {"email", "user_level_id", "password", "name", "affiliation",
+               "address", "phone", "user_verify_code", "pass_reset_code",
+               "pass_reset_timestamp"}
+        obs = get_cached_table_cols("qiita_user", self.conn_handler)
+        self.assertEqual(set(obs), exp)
+        # the modifications of the returned list don't reach the cache
+        obs.append('not_a_column')
+        obs = get_cached_table_cols("qiita_user")
+        self.assertEqual(set(obs), exp)
+
+    def test_lazy_table_columns(self):
+        class Dummy(object):
+            cols = LazyTableColumns("study_pmid", "portal_type")
+
+        exp = frozenset(["study_id", "pmid", "portal_type_id", "portal",
+                         "portal_description"])
+        self.assertEqual(Dummy.cols, exp)
+        self.assertEqual(Dummy().cols, exp)
+
     def test_get_table_cols_w_type(self):
         obs = get_table_cols_w_type("preprocessed_sequence_illumina_params",
                                     self.conn_handler)
@@ -673,6 +695,41 @@ class UtilTests(TestCase):
         exp = 1719580229
         self.assertEqual(obs, exp)
 
+    def test_compute_checksums(self):
+        """Correctly returns several checksums of several files"""
+        # one file per folder, so the files are walked in a known order
+        folder = mkdtemp()
+        self.addCleanup(rmtree, folder)
+        makedirs(join(folder, 'sub'))
+        newlines_fp = join(folder, 'sub', 'newlines')
+        with open(newlines_fp, 'wb') as f:
+            f.write('a\r\nb\rc\r')
+        with open(self.filepath) as f:
+            text = f.read()
+        with open(join(folder, 'copy'), 'w') as f:
+            f.write(text)
+
+        for n_jobs, block_size in ((1, 4194304), (3, 1), (3, 2)):
+            obs = compute_checksums([self.filepath, newlines_fp],
+                                    ('crc32', 'md5'), n_jobs, block_size)
+            exp = [{'crc32': 1719580229,
+                    'md5': 'd217f00299ab315615dec4b0476c8a72'},
+                   # the crc32 is computed with universal newlines
+                   {'crc32': 174526169,
+                    'md5': '1d17c885b68e7607b33655f762cd6260'}]
+            self.assertEqual(obs, exp)
+
+        # the digests of a folder are computed over all of its files
+        obs = compute_checksums([self.filepath, folder], ('crc32', 'md5'),
+                                n_jobs=2)
+        self.assertEqual(obs[0]['crc32'], 1719580229)
+        self.assertEqual(obs[1], {'crc32': 231671951,
+                                  'md5': 'a6c1bb08cc53ae84f94a572676e35077'})
+
+        self.assertEqual(compute_checksums([]), [])
+        with self.assertRaises(ValueError):
+            compute_checksums([self.filepath], ('crc32', 'unknown'))
+
     def test_scrub_data_nothing(self):
         """Returns the same string without changes"""
         self.assertEqual(scrub_data("nothing_changes"), "nothing_changes")
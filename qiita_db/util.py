@@ -18,11 +18,14 @@ Methods
     exists_dynamic_table
     get_db_files_base_dir
     compute_checksum
+    compute_checksums
     get_files_from_uploads_folders
     get_mountpoint
     insert_filepaths
     check_table_cols
     check_required_columns
+    get_cached_table_cols
+    LazyTableColumns
     convert_from_id
     convert_to_id
     get_lat_longs
@@ -44,8 +47,12 @@ from future.builtins import zip
 from random import choice
 from string import ascii_letters, digits, punctuation
 from binascii import crc32
+from hashlib import new as new_hash
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from bcrypt import hashpw, gensalt
 from functools import partial
+from itertools import chain
 from os.path import join, basename, isdir, relpath, exists
 from os import walk, remove, listdir, makedirs, rename
 from shutil import move, rmtree
@@ -404,6 +411,65 @@ def get_table_cols(table, conn_handler=None):
     return [h[0] for h in headers]
 
 
+# Columns of the static tables of the qiita schema, keyed by table name
+_TABLE_COLS_CACHE = {}
+
+
+def get_cached_table_cols(table, conn_handler=None):
+    """Returns the column headers of table, querying the DB only once
+
+    Parameters
+    ----------
+    table : str
+        The table name
+    conn_handler : SQLConnectionHandler, optional
+        The connection handler object connected to the DB
+
+    Returns
+    -------
+    list of str
+        The column headers of `table`
+
+    Notes
+    -----
+    Only use it with tables whose columns do not change at run time, i.e.
+    not with the dynamic sample_X and prep_X tables
+    """
+    if table not in _TABLE_COLS_CACHE:
+        _TABLE_COLS_CACHE[table] = get_table_cols(table, conn_handler)
+    return list(_TABLE_COLS_CACHE[table])
+
+
+class LazyTableColumns(object):
+    """Class attribute holding the column headers of a set of tables
+
+    The headers are retrieved through the schema cache the first time the
+    attribute is accessed, so defining a class that uses it does not touch
+    the DB
+
+    Parameters
+    ----------
+    tables : str
+        The names of the static tables whose columns are part of the attribute
+
+    Examples
+    --------
+    >>> class Dummy(object): # doctest: +SKIP
+    ...     cols = LazyTableColumns('study', 'study_pmid')
+    >>> 'study_title' in Dummy.cols # doctest: +SKIP
+    True
+    """
+    def __init__(self, *tables):
+        self.tables = tables
+        self._cols = None
+
+    def __get__(self, instance, owner):
+        if self._cols is None:
+            self._cols = frozenset(chain.from_iterable(
+                get_cached_table_cols(t) for t in self.tables))
+        return self._cols
+
+
 def get_table_cols_w_type(table, conn_handler=None):
     """Returns the column headers and its type
 
@@ -488,6 +554,129 @@ def get_work_base_dir(conn_handler=None):
         "SELECT base_work_dir FROM settings")[0]
 
 
+def _checksum_filepaths(path):
+    """The files checksummed for path, all the files under it if a folder"""
+    if not isdir(path):
+        return [path]
+
+    filepaths = []
+    for name, dirs, files in walk(path):
+        join_f = partial(join, name)
+        filepaths.extend(list(map(join_f, files)))
+    return filepaths
+
+
+def _translate_newlines(data):
+    r"""Translates \r\n and \r to \n, as reading in universal newlines mode
+
+    Parameters
+    ----------
+    data : str
+        A block of a file
+
+    Returns
+    -------
+    str
+        The translated block, without a trailing \r
+    str
+        The trailing \r of the block, if any, which must be prepended to the
+        next block as it may be the first half of a \r\n
+    """
+    pending = b''
+    if data.endswith(b'\r'):
+        data, pending = data[:-1], b'\r'
+    return data.replace(b'\r\n', b'\n').replace(b'\r', b'\n'), pending
+
+
+def _compute_checksums(path, algorithms, block_size):
+    """Worker for compute_checksums, computes the digests of a single path"""
+    crc = 0 if 'crc32' in algorithms else None
+    hashes = [(algorithm, new_hash(algorithm)) for algorithm in algorithms
+              if algorithm != 'crc32']
+
+    for fp in _checksum_filepaths(path):
+        pending = b''
+        with open(fp, 'rb') as f:
+            for block in iter(partial(f.read, block_size), b''):
+                for _, h in hashes:
+                    h.update(block)
+                if crc is not None:
+                    data, pending = _translate_newlines(pending + block)
+                    crc = crc32(data, crc)
+        if pending:
+            crc = crc32(b'\n', crc)
+
+    checksums = {algorithm: h.hexdigest() for algorithm, h in hashes}
+    if crc is not None:
+        # We need the & 0xffffffff in order to get the same numeric value
+        # across all python versions and platforms
+        checksums['crc32'] = crc & 0xffffffff
+    return checksums
+
+
+def compute_checksums(paths, algorithms=('crc32',), n_jobs=None,
+                      block_size=4194304):
+    r"""Returns the checksums of the files pointed by paths
+
+    Parameters
+    ----------
+    paths : list of str
+        The paths to compute the checksums. The checksums of a folder are
+        computed over all the files under it.
+    algorithms : iterable of str, optional
+        The digests to compute, 'crc32' or any algorithm known to
+        ``hashlib``, e.g. 'md5'. Defaults to ('crc32',).
+    n_jobs : unsigned int, optional
+        The number of threads hashing the paths. If None, the number of
+        CPUs. Defaults to None.
+    block_size : unsigned int, optional
+        The number of bytes read at once. Defaults to 4 Mb.
+
+    Returns
+    -------
+    list of dict
+        The checksums of each path, in the order of `paths`, as
+        {algorithm: checksum}. The 'crc32' checksum is an int, the others
+        are hex digests.
+
+    Raises
+    ------
+    ValueError
+        If any of the algorithms is unknown
+
+    Notes
+    -----
+    Each file is read once, in blocks, and every digest is updated with each
+    block. ``hashlib`` releases the GIL while hashing large blocks, so the
+    paths are hashed by a pool of threads.
+
+    The 'crc32' checksum is computed as if the files were read in universal
+    newlines mode, which is how the checksums stored in the database were
+    always computed, see `compute_checksum`. The other digests are computed
+    over the bytes of the files.
+    """
+    algorithms = tuple(algorithms)
+    for algorithm in algorithms:
+        if algorithm != 'crc32':
+            new_hash(algorithm)
+
+    worker = partial(_compute_checksums, algorithms=algorithms,
+                     block_size=block_size)
+    if n_jobs is None:
+        n_jobs = cpu_count()
+    n_jobs = max(min(n_jobs, len(paths)), 1)
+
+    if n_jobs == 1:
+        return list(map(worker, paths))
+
+    pool = ThreadPool(processes=n_jobs)
+    try:
+        return pool.map(worker, paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def compute_checksum(path):
     r"""Returns the checksum of the file pointed by path
 
@@ -500,27 +689,12 @@ def compute_checksum(path):
     -------
     int
         The file checksum
-    """
-    crc = 0
-    filepaths = []
-    if isdir(path):
-        for name, dirs, files in walk(path):
-            join_f = partial(join, name)
-            filepaths.extend(list(map(join_f, files)))
-    else:
-        filepaths.append(path)
 
-    for fp in filepaths:
-        with open(fp, "Ub") as f:
-            # Go line by line so we don't need to load the entire file
-            for line in f:
-                if crc is None:
-                    crc = crc32(line)
-                else:
-                    crc = crc32(line, crc)
-    # We need the & 0xffffffff in order to get the same numeric value across
-    # all python versions and platforms
-    return crc & 0xffffffff
+    See Also
+    --------
+    compute_checksums
+    """
+    return compute_checksums([path], n_jobs=1)[0]['crc32']
 
 
 def get_files_from_uploads_folders(study_id):
@@ -701,9 +875,11 @@ def insert_filepaths(filepaths, obj_id, table, filepath_table, conn_handler,
     def str_to_id(x):
         return (x if isinstance(x, (int, long))
                 else convert_to_id(x, "filepath_type", conn_handler))
+    checksums = compute_checksums([path for path, _ in new_filepaths])
     paths_w_checksum = [(relpath(path, base_fp), str_to_id(id),
-                        compute_checksum(path))
-                        for path, id in new_filepaths]
+                        checksum['crc32'])
+                        for (path, id), checksum in zip(new_filepaths,
+                                                        checksums)]
     # Create the list of SQL values to add
     values = ["('%s', %s, '%s', %s, %s)" % (scrub_data(path), pid,
               checksum, 1, dd_id) for path, pid, checksum in
@@ -27,6 +27,7 @@ from qiita_db.util import convert_to_id, get_mountpoint
 from qiita_db.exceptions import (QiitaDBUnknownIDError, QiitaDBColumnError,
                                  QiitaDBExecutionError, QiitaDBDuplicateError,
                                  QiitaDBDuplicateHeaderError, QiitaDBError)
+from qiita_ware.demux import load_summary
 from qiita_pet.handlers.base_handlers import BaseHandler
 from qiita_pet.handlers.util import check_access
 from qiita_pet.handlers.study_handlers.listing_handlers import (
@@ -908,17 +909,28 @@ class PreprocessingSummaryHandler(BaseHandler):
             contents = contents.replace('\n', '<br/>')
             contents = contents.replace('\t', '&nbsp;&nbsp;&nbsp;&nbsp;')
 
+        # The per sample summary and the barcode statistics are read from the
+        # sidecar of the demux file, if it was written. Sidecars written
+        # before the barcode statistics were collected don't have them.
+        demux_summary = None
+        barcodes = None
+        if files['preprocessed_demux_summary']:
+            demux_summary = load_summary(
+                files['preprocessed_demux_summary'][0])
+            barcodes = demux_summary.get('barcodes')
+
         title = 'Preprocessed Data: %d' % preprocessed_data_id
 
-        callback((title, contents, back_button_path))
+        callback((title, contents, back_button_path, demux_summary, barcodes))
 
     @authenticated
     @coroutine
     def get(self, preprocessed_data_id):
         ppd_id = _to_int(preprocessed_data_id)
 
-        title, contents, back_button_path = yield Task(
-            self._get_template_variables, ppd_id)
+        title, contents, back_button_path, demux_summary, barcodes = \
+            yield Task(self._get_template_variables, ppd_id)
 
-        self.render('text_file.html', title=title, contents=contents,
-                    back_button_path=back_button_path)
+        self.render('preprocessing_summary.html', title=title,
+                    contents=contents, back_button_path=back_button_path,
+                    demux_summary=demux_summary, barcodes=barcodes)
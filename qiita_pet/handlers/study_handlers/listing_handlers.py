@@ -42,13 +42,39 @@ def _get_shared_links_for_study(study):
     return ", ".join(shared)
 
 
-def _build_study_info(user, results=None):
-    """builds list of dicts for studies table, with all html formatted"""
-    # get list of studies for table
+# DataTables column name to the study info column used to sort by it. Columns
+# not listed here are built in python and can't be sorted on server side
+_SORT_COLS = {
+    'id': 'study_id',
+    'title': 'study_title',
+    'abstract': 'study_abstract',
+    'meta_complete': 'metadata_complete',
+    'num_samples': 'number_samples_collected',
+    'pmid': 'pmid',
+    'status': 'status'}
+
+# The order of the studies table when the request does not sort it
+_DEFAULT_ORDER = [('status', 'desc'), ('study_title', 'asc')]
+
+
+def _get_study_list(user, results=None):
+    """Returns the ids of the studies the user can see, restricted to results
+    """
     study_list = user.user_studies.union(
         Study.get_by_status('public')).union(user.shared_studies)
     if results is not None:
         study_list = study_list.intersection(results)
+    return study_list
+
+
+def _build_study_info(user, results=None, study_list=None, order_by=None,
+                      limit=None, offset=None):
+    """builds list of dicts for studies table, with all html formatted
+
+    Only the studies in the requested page, if any, are built"""
+    # get list of studies for table
+    if study_list is None:
+        study_list = _get_study_list(user, results)
     if not study_list:
         # No studies left so no need to continue
         return []
@@ -57,7 +83,8 @@ def _build_study_info(user, results=None):
     cols = ['study_id', 'email', 'principal_investigator_id',
             'pmid', 'study_title', 'metadata_complete',
             'number_samples_collected', 'study_abstract']
-    study_info = Study.get_info(study_list, cols)
+    study_info = Study.get_info(study_list, cols, order_by=order_by,
+                                limit=limit, offset=offset)
 
     infolist = []
     for row, info in enumerate(study_info):
@@ -228,14 +255,58 @@ class SearchStudiesAJAX(BaseHandler):
                 return
             if not res:
                 res = {}
-        info = _build_study_info(self.current_user, results=res)
+        study_list = _get_study_list(self.current_user, results=res)
+        total = len(study_list)
+        # narrow the results with the text typed in the table filter box
+        search = self.get_argument('sSearch', '').strip()
+        if search and study_list:
+            study_list = {s['study_id'] for s in Study.get_info(
+                study_list, ['study_id'], search=search)}
+        order_by, limit, offset = self._get_page_args()
+        info = _build_study_info(self.current_user, study_list=study_list,
+                                 order_by=order_by, limit=limit,
+                                 offset=offset)
         # build the table json
         results = {
             "sEcho": echo,
-            "iTotalRecords": len(info),
-            "iTotalDisplayRecords": len(info),
+            "iTotalRecords": total,
+            "iTotalDisplayRecords": len(study_list),
             "aaData": info
         }
 
         # return the json in compact form to save transmit size
         self.write(dumps(results, separators=(',', ':')))
+
+    def _get_page_args(self):
+        """Translates the DataTables server-side processing arguments
+
+        Returns
+        -------
+        order_by : list of (str, str) tuples
+            The study info columns to sort by and their direction. The default
+            order of the table if the request does not sort by any column
+        limit : int or None
+            The number of studies in the page, None if all of them
+        offset : int or None
+            The position of the first study of the page, None if not paging
+        """
+        offset = self.get_argument('iDisplayStart', None)
+        limit = self.get_argument('iDisplayLength', None)
+        offset = int(offset) if offset is not None else None
+        # DataTables requests all the rows with a length of -1
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit < 0:
+            limit = None
+
+        order_by = []
+        for pos in range(int(self.get_argument('iSortingCols', 0))):
+            col_idx = self.get_argument('iSortCol_%d' % pos, None)
+            if col_idx is None:
+                continue
+            col = self.get_argument('mDataProp_%s' % col_idx, None)
+            direction = self.get_argument('sSortDir_%d' % pos, 'asc')
+            if col not in _SORT_COLS or direction not in ('asc', 'desc'):
+                continue
+            order_by.append((_SORT_COLS[col], direction))
+
+        return order_by or _DEFAULT_ORDER, limit, offset
@@ -1,11 +1,17 @@
 from unittest import main
 from json import loads
+from os import close, remove
+from os.path import exists
+from tempfile import mkstemp
+
+import h5py
 
 from qiita_pet.test.tornado_test_base import TestHandlerBase
 from qiita_db.study import StudyPerson, Study
-from qiita_db.data import ProcessedData
-from qiita_db.util import get_count, check_count
+from qiita_db.data import ProcessedData, PreprocessedData
+from qiita_db.util import get_count, check_count, convert_to_id
 from qiita_db.user import User
+from qiita_ware.demux import to_hdf5
 from qiita_pet.handlers.study_handlers.listing_handlers import (
     _get_shared_links_for_study, _build_study_info)
 
@@ -331,6 +337,60 @@ class TestSearchStudiesAJAX(TestHandlerBase):
         # make sure responds properly
         self.assertEqual(loads(response.body), self.empty)
 
+    def test_get_page(self):
+        args = {
+            'user': 'test@foo.bar',
+            'query': '',
+            'sEcho': '1021',
+            'iDisplayStart': '0',
+            'iDisplayLength': '10',
+            'iSortingCols': '2',
+            'iSortCol_0': '10',
+            'sSortDir_0': 'desc',
+            'iSortCol_1': '7',
+            'sSortDir_1': 'asc',
+            'mDataProp_7': 'shared',
+            'mDataProp_10': 'status'}
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body), self.json)
+
+        # the total is still reported when the page is past the results
+        args['iDisplayStart'] = '10'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        exp = self.empty.copy()
+        exp['iTotalRecords'] = 1
+        exp['iTotalDisplayRecords'] = 1
+        self.assertEqual(loads(response.body), exp)
+
+    def test_get_page_missing_sort_column(self):
+        response = self.get('/study/search/', {
+            'user': 'test@foo.bar',
+            'query': '',
+            'sEcho': '1021',
+            'iSortingCols': '1',
+            'sSortDir_0': 'asc'})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body), self.json)
+
+    def test_get_filter(self):
+        args = {
+            'user': 'test@foo.bar',
+            'query': '',
+            'sEcho': '1021',
+            'sSearch': 'pidude'}
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body), self.json)
+
+        args['sSearch'] = 'not in any study'
+        response = self.get('/study/search/', args)
+        self.assertEqual(response.code, 200)
+        exp = self.empty.copy()
+        exp['iTotalRecords'] = 1
+        self.assertEqual(loads(response.body), exp)
+
     def test_get_failure(self):
         response = self.get('/study/search/', {
             'user': 'test@foo.bar',
@@ -377,6 +437,72 @@ class TestMetadataSummaryHandler(TestHandlerBase):
         self.assertEqual(response.code, 500)
 
 
+class TestPreprocessingSummaryHandler(TestHandlerBase):
+    database = True
+
+    def setUp(self):
+        super(TestPreprocessingSummaryHandler, self).setUp()
+        self._files_to_remove = []
+
+    def tearDown(self):
+        super(TestPreprocessingSummaryHandler, self).tearDown()
+        for fp in self._files_to_remove:
+            if exists(fp):
+                remove(fp)
+
+    def test_get(self):
+        fd, log_fp = mkstemp(suffix='_split_library_log.txt')
+        close(fd)
+        with open(log_fp, 'w') as f:
+            f.write("Total number seqs written\t3\n")
+        fd, summary_fp = mkstemp(suffix='_demux_summary.json')
+        close(fd)
+        with open(summary_fp, 'w') as f:
+            f.write(DEMUX_SUMMARY)
+        PreprocessedData(1).add_filepaths(
+            [(log_fp, convert_to_id('log', 'filepath_type')),
+             (summary_fp, convert_to_id('preprocessed_demux_summary',
+                                        'filepath_type'))])
+
+        response = self.get('/preprocessing_summary/1')
+        self.assertEqual(response.code, 200)
+        self.assertIn('Total number seqs written', response.body)
+        self.assertIn('<td>SKB1.640202</td>', response.body)
+        self.assertIn('<td>2, 1</td>', response.body)
+        # the sidecar was written before the barcode statistics were added
+        self.assertIn('Barcode statistics are not available', response.body)
+
+    def test_get_barcodes(self):
+        fd, fastq_fp = mkstemp(suffix='.fastq')
+        close(fd)
+        fd, demux_fp = mkstemp(suffix='.demux')
+        close(fd)
+        fd, summary_fp = mkstemp(suffix='_demux_summary.json')
+        close(fd)
+        self._files_to_remove.extend([fastq_fp, demux_fp])
+        with open(fastq_fp, 'w') as f:
+            f.write(DEMUX_SEQS)
+        with h5py.File(demux_fp, 'w') as f:
+            to_hdf5(fastq_fp, f, summary_fp=summary_fp)
+        # the page is rendered from the sidecar alone
+        remove(demux_fp)
+
+        fd, log_fp = mkstemp(suffix='_split_library_log.txt')
+        close(fd)
+        PreprocessedData(1).add_filepaths(
+            [(log_fp, convert_to_id('log', 'filepath_type')),
+             (summary_fp, convert_to_id('preprocessed_demux_summary',
+                                        'filepath_type'))])
+
+        response = self.get('/preprocessing_summary/1')
+        self.assertEqual(response.code, 200)
+        self.assertNotIn('Barcode statistics are not available',
+                         response.body)
+        self.assertIn('<td>AAA</td>', response.body)
+        self.assertIn('<li>CCC: SKB1.640202 (1), SKB2.640194 (1)</li>',
+                      response.body)
+
+
 class TestEBISubmitHandler(TestHandlerBase):
     # TODO: add proper test for this once figure out how. Issue 567
     pass
@@ -445,5 +571,27 @@ class TestDelete(TestHandlerBase):
         self.assertIn('Illegal operation on non sandboxed processed data',
                       response.body)
 
+
+DEMUX_SEQS = """@SKB1.640202_1 orig_bc=AAA new_bc=AAA bc_diffs=0
+GGGG
++
+AAAA
+@SKB1.640202_2 orig_bc=CCC new_bc=CCC bc_diffs=0
+GGGG
++
+AAAA
+@SKB2.640194_1 orig_bc=CCA new_bc=CCC bc_diffs=1
+GGGG
++
+AAAA
+"""
+
+DEMUX_SUMMARY = (
+    '{"barcode_errors":[2,1],"has-qual":true,"length":{"max":151,"mean":'
+    '150.3,"median":150,"min":150,"q25":150,"q75":150.5},"n":3,"samples":'
+    '{"SKB1.640202":{"barcode_errors":[2,1],"length":{"max":151,"mean":150.3,'
+    '"median":150,"min":150,"q25":150,"q75":150.5},"n":3}}}')
+
+
 if __name__ == "__main__":
     main()
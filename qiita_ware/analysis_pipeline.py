@@ -2,10 +2,16 @@
 from __future__ import division
 from os.path import join
 from sys import stderr
+from random import randint
+from time import sleep, time
 
+from moi import r_client
+
+from qiita_db.analysis import Analysis
 from qiita_db.job import Job
 from qiita_db.logger import LogEntry
 from qiita_db.util import get_db_files_base_dir
+from qiita_ware.exceptions import ComputeError
 from qiita_ware.wrapper import ParallelWrapper, system_call_from_job
 
 
@@ -18,7 +24,107 @@ from qiita_ware.wrapper import ParallelWrapper, system_call_from_job
 # -----------------------------------------------------------------------------
 
 
-def _build_analysis_files(analysis, r_depth=None, **kwargs):
+JOB_CACHE_HITS = 'stats:job_cache:hits'
+JOB_CACHE_CPU_SAVED = 'stats:job_cache:cpu_saved'
+
+
+def job_cache_stats():
+    """Returns the metrics of the jobs whose results have been reused
+
+    Returns
+    -------
+    dict
+        The number of reused jobs under 'hits' and the CPU time, in seconds,
+        saved by not running them again under 'cpu_saved'
+    """
+    hits, cpu_saved = r_client.mget(JOB_CACHE_HITS, JOB_CACHE_CPU_SAVED)
+    return {'hits': int(hits or 0), 'cpu_saved': float(cpu_saved or 0)}
+
+
+def _record_reused_job(job):
+    """Updates the job cache metrics with a reused job
+
+    Parameters
+    ----------
+    job : Job object
+        The job whose results are reused
+    """
+    with r_client.pipeline() as pipe:
+        pipe.incr(JOB_CACHE_HITS)
+        pipe.incrbyfloat(JOB_CACHE_CPU_SAVED, job.cpu_time or 0)
+        pipe.execute()
+
+
+def _in_flight(job, analysis):
+    """Whether a job is being run by another analysis
+
+    Parameters
+    ----------
+    job : Job object
+        The job to check
+    analysis : Analysis object
+        The analysis that is going to run
+
+    Returns
+    -------
+    bool
+        True if the job is running, or if it is queued and attached to another
+        analysis that is queued or running, which will run it
+    """
+    status = job.status
+    if status == 'running':
+        return True
+    if status != 'queued':
+        return False
+    return any(Analysis(analysis_id).status in {'queued', 'running'}
+               for analysis_id in job.analyses if analysis_id != analysis.id)
+
+
+def _wait_for_job(job_id, analysis, poll_interval=5, timeout=86400,
+                  **kwargs):
+    """Waits until a job run by another analysis finishes
+
+    Parameters
+    ----------
+    job_id : int
+        The job object ID
+    analysis : Analysis object
+        The analysis waiting for the job
+    poll_interval : float, optional
+        Seconds between checks of the job status. Default 5
+    timeout : float, optional
+        Seconds to wait for the job before giving up. Default 86400, a day
+    kwargs : ignored
+        Necessary to have in parameters to support execution via moi.
+
+    Raises
+    ------
+    ComputeError
+        If the job is still queued or running after timeout seconds, or if it
+        is queued and no other analysis is going to run it anymore. The
+        analysis is set to error
+    """
+    job = Job(job_id)
+    start = time()
+    while job.status in {'queued', 'running'}:
+        if not _in_flight(job, analysis):
+            # the status is checked again, the job may have just finished
+            if job.status not in {'queued', 'running'}:
+                break
+            msg = ("Job %d is queued but no analysis is going to run it"
+                   % job_id)
+        elif time() - start >= timeout:
+            msg = ("Job %d did not finish after %d seconds"
+                   % (job_id, timeout))
+        else:
+            sleep(poll_interval)
+            continue
+        analysis.status = 'error'
+        raise ComputeError(msg)
+
+
+def _build_analysis_files(analysis, r_depth=None, r_seed=None, job_ids=None,
+                          **kwargs):
     """Creates the biom tables and mapping file, then adds to jobs
 
     Parameters
@@ -27,15 +133,22 @@ def _build_analysis_files(analysis, r_depth=None, **kwargs):
         The analysis to build files for
     r_depth : int, optional
         Rarefaction depth for biom table creation. Default None
+    r_seed : int, optional
+        Seed used to rarefy the biom tables. Default None
+    job_ids : list of int, optional
+        The jobs to add the files to. Default None, all the queued jobs of
+        the analysis
     """
     # create the biom tables and add jobs to the analysis
     analysis.status = "running"
-    analysis.build_files(r_depth)
+    analysis.build_files(r_depth, r_seed)
     mapping_file = analysis.mapping_file
     biom_tables = analysis.biom_tables
 
     # add files to existing jobs
-    for job_id in analysis.jobs:
+    if job_ids is None:
+        job_ids = analysis.jobs
+    for job_id in job_ids:
         job = Job(job_id)
         if job.status == 'queued':
             opts = {
@@ -73,7 +186,7 @@ def _finish_analysis(analysis, **kwargs):
 
 class RunAnalysis(ParallelWrapper):
     def _construct_job_graph(self, analysis, commands, comm_opts=None,
-                             rarefaction_depth=None):
+                             rarefaction_depth=None, rarefaction_seed=None):
         """Builds the job graph for running an analysis
 
         Parameters
@@ -88,6 +201,18 @@ class RunAnalysis(ParallelWrapper):
             Default None (use default options).
         rarefaction_depth : int, optional
             Rarefaction depth for analysis' biom tables. Default None.
+        rarefaction_seed : int, optional
+            Seed used to rarefy the analysis' biom tables. Default None, the
+            seed previously used by the analysis or a random one.
+
+        Notes
+        -----
+        Jobs identical to an already completed one, possibly of another
+        analysis, are not run again: the completed job is attached to the
+        analysis and its results are reused. Only the jobs of other analyses
+        count in the job cache metrics. Jobs that another analysis is
+        running are not run again either, the analysis waits for them to
+        finish.
         """
         self._logger = stderr
         self.analysis = analysis
@@ -96,6 +221,20 @@ class RunAnalysis(ParallelWrapper):
         if comm_opts is None:
             comm_opts = {}
 
+        # The seed is fixed before creating the jobs, as the jobs only produce
+        # the same results if their tables are rarefied the same way
+        # Jobs that the analysis already had were counted when they were
+        # reused or run, re-running the analysis does not save any time
+        previous_jobs = set(analysis.jobs)
+
+        rarefaction = None
+        if rarefaction_depth is not None:
+            if rarefaction_seed is None:
+                rarefaction_seed = analysis.rarefaction_seed
+            if rarefaction_seed is None:
+                rarefaction_seed = randint(0, 2 ** 32 - 1)
+            rarefaction = (rarefaction_depth, rarefaction_seed)
+
         for data_type, command in commands:
             # get opts set by user, else make it empty dict
             opts = comm_opts.get(command, {})
@@ -116,19 +255,47 @@ class RunAnalysis(ParallelWrapper):
                 opts["-n"] = 4
 
             Job.create(data_type, command, opts, analysis,
-                       return_existing=True)
+                       return_existing=True, rarefaction=rarefaction)
+
+        # Only the jobs not completed nor run by another analysis are
+        # submitted, the failure callback only touches these
+        self._submitted_jobs = []
+        job_nodes = []
+        for job_id in analysis.jobs:
+            job = Job(job_id)
+            # completed jobs can't be run again, their results are reused
+            if job.status == 'completed':
+                self._logger.write("Reusing results of job %d\n" % job_id)
+                if job_id not in previous_jobs:
+                    _record_reused_job(job)
+                continue
+            job_name = "%s: %s" % (job.datatype, job.command[0])
+            # jobs in flight in another analysis are waited on, running them
+            # again would write to the same output directory at the same time
+            if _in_flight(job, analysis):
+                self._logger.write("Waiting for shared job %d\n" % job_id)
+                node_name = "%d_WAIT_JOB_%d" % (analysis.id, job.id)
+                job_nodes.append(node_name)
+                self._job_graph.add_node(node_name,
+                                         func=_wait_for_job,
+                                         args=(job_id, analysis),
+                                         job_name="Waiting for %s" % job_name,
+                                         requires_deps=False)
+                continue
+            self._submitted_jobs.append(job_id)
 
         # Create the files for the jobs
         files_node_name = "%d_ANALYSISFILES" % analysis.id
         self._job_graph.add_node(files_node_name,
                                  func=_build_analysis_files,
-                                 args=(analysis, rarefaction_depth),
+                                 args=(analysis, rarefaction_depth,
+                                       rarefaction_seed,
+                                       list(self._submitted_jobs)),
                                  job_name='Build analysis',
                                  requires_deps=False)
 
         # Add the jobs
-        job_nodes = []
-        for job_id in analysis.jobs:
+        for job_id in self._submitted_jobs:
             job = Job(job_id)
             node_name = "%d_JOB_%d" % (analysis.id, job.id)
             job_nodes.append(node_name)
@@ -151,6 +318,7 @@ class RunAnalysis(ParallelWrapper):
                                  requires_deps=False)
 
         # Adding the dependency edges to the graph
+        self._job_graph.add_edge(files_node_name, node_name)
         for job_node_name in job_nodes:
             self._job_graph.add_edge(job_node_name, node_name)
 
@@ -162,8 +330,9 @@ class RunAnalysis(ParallelWrapper):
         if self._update_status is not None:
             self._update_status("Failed")
 
-        # set any jobs to errored if they didn't execute
-        for job_id in self.analysis.jobs:
+        # set any jobs to errored if they didn't execute. Jobs shared with
+        # other analyses that this run didn't submit are left alone
+        for job_id in self._submitted_jobs:
             job = Job(job_id)
             if job.status not in {'error', 'completed'}:
                 job.status = 'error'
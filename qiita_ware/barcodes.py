@@ -0,0 +1,226 @@
+r"""Barcode error-correction statistics of HDF5 demultiplexed files
+
+Aggregates the barcode datasets of the samples of a demux file, see
+`qiita_ware.demux`, into:
+
+    samples    : {sample_id: np.array of int}, the number of sequences of the
+                 sample with 0, 1, ... barcode errors
+    barcodes   : {barcode: np.array of int}, the number of sequences with
+                 0, 1, ... errors per corrected barcode
+    collisions : {barcode: {sample_id: int}}, the corrected barcodes found in
+                 more than one sample, with their number of sequences per
+                 sample
+    ambiguous  : {barcode: {sample_id: int}}, the original barcodes with
+                 errors that were corrected into more than one sample, with
+                 their number of sequences per sample
+
+Only the barcode datasets are read, a block of rows at a time, so neither the
+sequences nor the qual scores are ever loaded. The statistics are also
+collected while a demux file is written, with `barcode_counter`, and stored
+in its summary sidecar, see `qiita_ware.demux.load_summary`.
+"""
+from __future__ import division
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+from collections import namedtuple
+
+import numpy as np
+from future.utils import viewitems
+from future.builtins import zip
+
+from .demux import dset_paths, _count_errors
+
+
+# the barcode statistics of a demux file
+barcode_stat = namedtuple('barcode_stat',
+                          'samples barcodes collisions ambiguous')
+
+
+def _barcode_blocks(demux, samples=None, block_size=10000):
+    """Read the barcode datasets of a demux file in blocks of rows
+
+    Parameters
+    ----------
+    demux : h5py.File
+        The demux file to operate on
+    samples : list, optional
+        Samples to pull out. If None, then all samples will be examined.
+        Defaults to None.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once, rounded up to fit the chunks
+        of the original barcodes. Defaults to 10000.
+
+    Returns
+    -------
+    generator
+        Yields (sample, original_barcodes, corrected_barcodes,
+                barcode_errors), where all but the sample are np.array holding
+        a block of rows of the sample
+    """
+    if samples is None:
+        samples = demux.keys()
+
+    for sample in samples:
+        if sample not in demux:
+            continue
+
+        group = demux[sample]
+        bc_ori = group[dset_paths['barcode_original']]
+        bc_cor = group[dset_paths['barcode_corrected']]
+        bc_err = group[dset_paths['barcode_error']]
+
+        step = block_size
+        if bc_ori.chunks is not None:
+            step = -(-block_size // bc_ori.chunks[0]) * bc_ori.chunks[0]
+
+        n = group.attrs['n']
+        for start in range(0, n, step):
+            end = min(start + step, n)
+            yield (sample, bc_ori[start:end], bc_cor[start:end],
+                   bc_err[start:end])
+
+
+def _add_counts(counts, block):
+    """Add two arrays of counts, the shorter one padded with zeros"""
+    if counts is None:
+        return block.copy()
+    if block.size > counts.size:
+        counts, block = block.copy(), counts
+    counts[:block.size] += block
+    return counts
+
+
+def _error_histograms(barcodes, bc_err):
+    """The barcode error histogram of each barcode of a block
+
+    Parameters
+    ----------
+    barcodes : np.array of str
+        The barcodes of the sequences
+    bc_err : np.array of int
+        The number of barcode errors of the sequences
+
+    Returns
+    -------
+    np.array of str
+        The distinct barcodes, sorted
+    np.array of int
+        The number of sequences with 0, 1, ... errors, one row per barcode
+    """
+    uniq, inverse = np.unique(barcodes, return_inverse=True)
+    width = int(bc_err.max()) + 1
+    hist = np.bincount(inverse * width + bc_err, minlength=uniq.size * width)
+    return uniq, hist.reshape(uniq.size, width)
+
+
+def _tally(tally, sample, barcodes):
+    """Add the number of sequences of a block per barcode of a sample
+
+    Parameters
+    ----------
+    tally : dict
+        {barcode: {sample_id: int}}, updated in place
+    sample : str
+        The sample of the block
+    barcodes : np.array of str
+        The barcodes of the sequences of the block
+    """
+    uniq, counts = np.unique(barcodes, return_counts=True)
+    for barcode, count in zip(uniq.tolist(), counts.tolist()):
+        per_sample = tally.setdefault(barcode, {})
+        per_sample[sample] = per_sample.get(sample, 0) + count
+
+
+class barcode_counter(object):
+    """Collects the barcode statistics of blocks of sequences, see
+    `barcode_stats`"""
+    def __init__(self):
+        self._sample_errors = {}
+        self._barcode_errors = {}
+        self._corrected = {}
+        self._original = {}
+
+    def add(self, sample, bc_ori, bc_cor, bc_err):
+        """Add a block of sequences of a sample
+
+        Parameters
+        ----------
+        sample : str
+            The sample of the block
+        bc_ori : np.array of str
+            The original barcodes of the sequences
+        bc_cor : np.array of str
+            The corrected barcodes of the sequences
+        bc_err : np.array of int
+            The number of barcode errors of the sequences
+        """
+        if not len(bc_err):
+            return
+
+        self._sample_errors[sample] = _count_errors(
+            self._sample_errors.get(sample), bc_err)
+
+        uniq, hist = _error_histograms(bc_cor, bc_err)
+        for barcode, row in zip(uniq.tolist(), hist):
+            self._barcode_errors[barcode] = _add_counts(
+                self._barcode_errors.get(barcode), row)
+
+        _tally(self._corrected, sample, bc_cor)
+        _tally(self._original, sample, bc_ori[bc_err > 0])
+
+    def stats(self):
+        """The statistics of the blocks added so far
+
+        Returns
+        -------
+        barcode_stat
+            The statistics, see the module documentation
+        """
+        collisions = {barcode: per_sample
+                      for barcode, per_sample in viewitems(self._corrected)
+                      if len(per_sample) > 1}
+        ambiguous = {barcode: per_sample
+                     for barcode, per_sample in viewitems(self._original)
+                     if len(per_sample) > 1}
+
+        return barcode_stat(samples=self._sample_errors,
+                            barcodes=self._barcode_errors,
+                            collisions=collisions, ambiguous=ambiguous)
+
+
+def barcode_stats(demux, samples=None, block_size=10000):
+    """Compute the barcode error-correction statistics of a demux file
+
+    Parameters
+    ----------
+    demux : h5py.File
+        The demux file to operate on
+    samples : list, optional
+        Samples to examine. If None, then all samples will be examined.
+        Defaults to None.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once, see `_barcode_blocks`.
+        Defaults to 10000.
+
+    Returns
+    -------
+    barcode_stat
+        The statistics, see the module documentation
+
+    Notes
+    -----
+    The counts of each block are computed with numpy, and only merged per
+    distinct barcode of the block, so the time spent in Python depends on the
+    number of distinct barcodes rather than on the number of sequences.
+    """
+    counter = barcode_counter()
+    for block in _barcode_blocks(demux, samples, block_size):
+        counter.add(*block)
+    return counter.stats()
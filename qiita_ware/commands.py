@@ -9,9 +9,12 @@
 from os.path import join, isdir
 from os import makedirs
 from functools import partial
+from multiprocessing import Pool
 from tempfile import mkdtemp
 from gzip import open as gzopen
 from tarfile import open as taropen
+
+from future.builtins import map
 from moi.job import system_call
 
 from qiita_db.study import Study
@@ -20,7 +23,7 @@ from qiita_db.metadata_template import PrepTemplate, SampleTemplate
 from qiita_core.qiita_settings import qiita_config
 
 from qiita_ware.ebi import EBISubmission
-from qiita_ware.demux import to_per_sample_ascii
+from qiita_ware.demux import write_ascii
 from qiita_ware.exceptions import ComputeError
 from qiita_ware.util import open_file
 from qiita_db.util import convert_to_id
@@ -30,7 +33,64 @@ from qiita_db.ontology import Ontology
 ebi_actions = ['ADD', 'VALIDATE', 'MODIFY']
 
 
-def submit_EBI(preprocessed_data_id, action, send, fastq_dir_fp=None):
+def _write_sample_fastq(args):
+    """Worker for Pool.imap_unordered, writes the gzipped FASTQ of a sample"""
+    demux_fp, sample, fastq_fp = args
+    with open_file(demux_fp, 'r') as demux, gzopen(fastq_fp, 'w') as fh:
+        write_ascii(demux, fh, samples=[sample], mmap=True)
+    return sample
+
+
+def _write_sample_fastqs(demux_fp, samples, out_dir, n_jobs=1,
+                         update_status=None):
+    """Write the gzipped FASTQ file of each sample of a demux file
+
+    Parameters
+    ----------
+    demux_fp : str
+        The filepath of the demux file
+    samples : list of str
+        The samples to write, as <sample>.fastq.gz in out_dir. The files of
+        the samples that are not in the demux file are empty.
+    out_dir : str
+        The directory to write to
+    n_jobs : unsigned int, optional
+        The maximum number of processes writing the files. Defaults to 1.
+    update_status : function, optional
+        Called with a message as the files are written. Defaults to None.
+
+    Notes
+    -----
+    Each process opens the demux file read-only and compresses its own
+    files, so the samples are written in any order. The progress is reported
+    about every percent of the samples.
+    """
+    tasks = [(demux_fp, sample, join(out_dir, "%s.fastq.gz" % sample))
+             for sample in samples]
+    n_jobs = max(min(n_jobs, len(tasks)), 1)
+    step = max(len(tasks) // 100, 1)
+
+    def report(written):
+        for done, _ in enumerate(written, 1):
+            if update_status is not None and (done % step == 0 or
+                                              done == len(tasks)):
+                update_status("Writing the FASTQ files: %d of %d samples"
+                              % (done, len(tasks)))
+
+    if n_jobs > 1:
+        pool = Pool(processes=n_jobs)
+        try:
+            report(pool.imap_unordered(_write_sample_fastq, tasks))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        report(map(_write_sample_fastq, tasks))
+
+
+def submit_EBI(preprocessed_data_id, action, send, fastq_dir_fp=None,
+               n_jobs=None, moi_update_status=None):
     """Submit a preprocessed data to EBI
 
     Parameters
@@ -43,6 +103,13 @@ def submit_EBI(preprocessed_data_id, action, send, fastq_dir_fp=None):
         True to actually send the files
     fastq_dir_fp : str, optional
         The fastq filepath
+    n_jobs : int, optional
+        The maximum number of processes writing the per sample FASTQ files
+        from the demux file, if `fastq_dir_fp` is not given. Defaults to the
+        EBI_N_JOBS configuration value.
+    moi_update_status : function, optional
+        Called with a message to report the progress of the submission.
+        Defaults to None.
     """
     preprocessed_data = PreprocessedData(preprocessed_data_id)
     preprocessed_data_id_str = str(preprocessed_data_id)
@@ -92,16 +159,12 @@ def submit_EBI(preprocessed_data_id, action, send, fastq_dir_fp=None):
 
         # Keep track of which files were actually in the demux file so that we
         # can write those rows to the prep and samples templates
-        demux_samples = set()
-
-        with open_file(demux) as demux_fh:
-            for samp, iterator in to_per_sample_ascii(demux_fh,
-                                                      list(sample_template)):
-                demux_samples.add(samp)
-                sample_fp = join(fastq_dir_fp, "%s.fastq.gz" % samp)
-                with gzopen(sample_fp, 'w') as fh:
-                    for record in iterator:
-                        fh.write(record)
+        demux_samples = set(sample_template)
+
+        if n_jobs is None:
+            n_jobs = qiita_config.ebi_n_jobs
+        _write_sample_fastqs(demux, list(sample_template), fastq_dir_fp,
+                             n_jobs, moi_update_status)
 
     output_dir = fastq_dir_fp + '_submission'
 
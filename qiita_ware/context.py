@@ -1,6 +1,7 @@
 from subprocess import Popen, PIPE
 from uuid import uuid4
 from functools import partial
+from inspect import getargspec
 
 from IPython.parallel import Client
 
@@ -156,6 +157,14 @@ class Dispatch(object):
         return self.demo_lview.wait(handlers)
 
 
+def _has_arg(f, name):
+    """Whether the function f takes an argument called name"""
+    try:
+        return name in getargspec(f).args
+    except TypeError:
+        return False
+
+
 def _redis_wrap(f, redis_deets, *args, **kwargs):
     """Wrap something to compute, and notify about state
 
@@ -174,7 +183,9 @@ def _redis_wrap(f, redis_deets, *args, **kwargs):
     Parameters
     ----------
     f : function
-        A function to execute
+        A function to execute. If it has a ``moi_update_status`` argument, it
+        is given a function that publishes a new status message of the job
+        while it runs, as in moi.
     redis_deets : dict
         Redis details, specifically {'job_id': uuid,
                                      'pubsub': key to publish on,
@@ -214,6 +225,13 @@ def _redis_wrap(f, redis_deets, *args, **kwargs):
     payload = {'job_id': job_id, 'status_msg': 'Running', 'return': None}
 
     _deposit_payload(redis_deets, payload)
+
+    def update_status(status_msg):
+        _deposit_payload(redis_deets, dict(payload, status_msg=status_msg))
+
+    if _has_arg(f, 'moi_update_status'):
+        kwargs['moi_update_status'] = update_status
+
     try:
         payload['return'] = f(*args, **kwargs)
         payload['status_msg'] = 'Success'
@@ -10,6 +10,8 @@ Attributes off of ./ for the full file:
     median    : float, the median sequence length
     hist      : np.array of int, 10 bin histogram of sequence lengths
     hist_edge : np.array of int, left edge of each bin
+    has-qual  : bool, whether the sequences have qual scores
+    version   : int, the layout of the sample groups, 1 if missing
 
 Each sample has its own group with the following structure:
 
@@ -36,6 +38,27 @@ sample group:
     hist      : np.array of int, 10 bin histogram of sequence lengths
     hist_edge : np.array of int, left edge of each bin
 
+The structure above is the version 1 layout, in which every sequence is
+padded to the longest one of its sample. In the compact, version 2, layout
+the sequences and qual scores are stored without padding:
+
+    ./<sample_name>/sequence          : (T,) of uint8 where T is the total \
+length of the sequences in the sample, the sequences one after the other
+    ./<sample_name>/qual              : (T,) of uint8, the qual scores laid \
+out as the sequences, or (0,) if there are no qual scores
+    ./<sample_name>/offsets           : (N + 1,) of int where N is the number \
+of sequences in the sample, the start of each sequence followed by T
+
+and the barcode datasets are the same as in version 1.
+
+Files written with the "hot" storage profile, see `dset_profiles`, have
+contiguous, uncompressed datasets, which `fetch_blocks` can map in memory
+instead of reading them through HDF5.
+
+The summary of a demux file can also be written, when the file is built, to a
+JSON sidecar, see `load_summary`, so it can be shown without opening the HDF5
+file.
+
 """
 from __future__ import division
 
@@ -48,16 +71,20 @@ from __future__ import division
 # -----------------------------------------------------------------------------
 
 import os
+import gzip
+import json
+from io import BytesIO
 from functools import partial
-from itertools import repeat
-from collections import defaultdict, namedtuple
-from re import search
+from itertools import repeat, islice
+from collections import defaultdict, namedtuple, deque
+from multiprocessing import Pool
+from re import compile as re_compile, MULTILINE
 
+import h5py
 import numpy as np
 from future.utils import viewitems, viewvalues
-from future.builtins import zip
+from future.builtins import zip, map
 from skbio.parse.sequences import load
-from skbio.format.sequences import format_fastq_record
 
 from .util import open_file
 
@@ -70,7 +97,43 @@ dset_paths = {'sequence': 'sequence',
               'barcode_original': 'barcode/original',
               'barcode_corrected': 'barcode/corrected',
               'barcode_error': 'barcode/error',
-              'qual': 'qual'}
+              'qual': 'qual',
+              'offsets': 'offsets'}
+
+# the storage options of the demux datasets
+dset_kwargs = {'chunks': True, 'compression': True, 'compression_opts': 1,
+               'track_times': False}
+
+# the storage profiles of the demux datasets, see `_dset_kwargs`. The options
+# of a profile are laid over dset_kwargs, then the ones under the path of a
+# dataset, if any. chunk_rows fixes the number of rows of the chunks, which
+# h5py guesses otherwise.
+dset_profiles = {
+    # gzip level 1, guessed chunks
+    'default': {},
+    # chunks as large as the blocks read when exporting whole samples, and
+    # qual scores fast to decompress
+    'export': {'chunk_rows': 10000,
+               'qual': {'compression': 'lzf', 'compression_opts': None}},
+    # small chunks, fast to decompress, when subsampling reads
+    'sampling': {'chunk_rows': 1000, 'compression': 'lzf',
+                 'compression_opts': None, 'shuffle': True},
+    # smaller files, slower to write
+    'archive': {'chunk_rows': 10000, 'shuffle': True,
+                'qual': {'compression_opts': 6}},
+    # contiguous and uncompressed, so the datasets can be memory mapped when
+    # frequently exported, see `_mapped`
+    'hot': {'chunks': None, 'compression': None, 'compression_opts': None},
+}
+
+# the number of items per chunk of the sequence and qual datasets of the
+# compact layout, 256KiB fit in the default HDF5 chunk cache
+compact_chunk_size = 1 << 18
+
+# the fields that split libraries adds to the sequence IDs
+sl_headers = re_compile(r'^(?P<sample>.+?)_\d+? .*orig_bc=(?P<orig_bc>.+?) '
+                        r'new_bc=(?P<corr_bc>.+?) bc_diffs=(?P<bc_diffs>\d+)',
+                        MULTILINE)
 
 
 class _buffer(object):
@@ -120,9 +183,30 @@ class _buffer(object):
         if self.is_full():
             self.flush()
 
+    def write_block(self, data):
+        """Deposit many items into the buffer, write to dataset if necessary
+
+        Parameters
+        ----------
+        data : np.array
+            The items to deposit, one per row
+        """
+        pos = 0
+        while pos < len(data):
+            n = min(len(data) - pos, self._max_fill - self._n)
+            self._write_block(data[pos:pos + n])
+            self._n += n
+            pos += n
+
+            if self.is_full():
+                self.flush()
+
     def _write(self, data):
         raise NotImplementedError
 
+    def _write_block(self, data):
+        raise NotImplementedError
+
     def _alloc(self):
         raise NotImplementedError
 
@@ -159,6 +243,9 @@ class buffer1d(_buffer):
     def _write(self, data):
         self._buf[self._n] = data
 
+    def _write_block(self, data):
+        self._buf[self._n:self._n + len(data)] = data
+
     def _alloc(self):
         self._buf = np.zeros(self._max_fill, self.dset.dtype)
 
@@ -176,11 +263,262 @@ class buffer2d(_buffer):
     def _write(self, data):
         self._buf[self._n, :data.size] = data
 
+    def _write_block(self, data):
+        self._buf[self._n:self._n + len(data), :data.shape[1]] = data
+
     def _alloc(self):
         shape = (self._max_fill, self.dset.shape[1])
         self._buf = np.zeros(shape, dtype=self.dset.dtype)
 
 
+class _sample_writer(object):
+    """Appends the records of a sample to growable datasets
+
+    Notes
+    -----
+    The datasets are created on the first flush, with as many columns as the
+    longest sequence seen so far, and are grown as more records are flushed.
+    If a longer sequence shows up later on, the sequence dataset is rebuilt
+    with the wider string type, and the qual dataset gains columns. As the
+    read lengths of a run barely change, this rarely happens past the first
+    flush, and the datasets end up with the same shapes and types as the ones
+    built with two passes over the file.
+
+    If the storage profile fixes the rows of the chunks, the records are
+    appended a whole number of chunks at a time until the final flush, so no
+    compressed chunk has to be read back and compressed again. The datasets
+    of a sample smaller than a chunk are only created by the final flush,
+    when its size is known, and their chunks are shrunk to fit it, as the
+    ones of the two pass mode.
+    """
+    def __init__(self, h5grp, max_barcode_length=12, max_fill=10000,
+                 profile='default'):
+        """Construct thy self
+
+        Parameters
+        ----------
+        h5grp : h5py.Group
+            The group of the sample
+        max_barcode_length : unsigned int
+            The maximum length of the barcodes
+        max_fill : unsigned int
+            The number of records to hold before flushing them
+        profile : str
+            The storage profile of the datasets, see `dset_profiles`
+        """
+        self.h5grp = h5grp
+        self.lengths = []
+        self.profile = profile
+
+        self._bc_dtype = '|S%d' % max_barcode_length
+        self._chunk_rows = dset_profiles[profile].get('chunk_rows')
+        self._max_fill = max(max_fill, self._chunk_rows or 0)
+        self._width = 0
+        self._blocks = []
+        self._n = 0
+
+    def write_block(self, seqs, quals, bc_ori, bc_cor, bc_err):
+        """Deposit a block of records, flush the records if necessary
+
+        Parameters
+        ----------
+        seqs : np.array of str
+            The sequences
+        quals : np.array of int or None
+            The qual scores of the sequences, one row per sequence
+        bc_ori : np.array of str
+            The original barcodes
+        bc_cor : np.array of str
+            The corrected barcodes
+        bc_err : np.array of int
+            The number of errors in the barcodes
+        """
+        self._blocks.append((seqs, quals, bc_ori, bc_cor, bc_err))
+        self.lengths.append(np.char.str_len(seqs))
+        self._n += len(seqs)
+
+        if self._n >= self._max_fill:
+            self.flush(whole_chunks=True)
+
+    def _create(self, key, dtype, shape, size=None, **kwargs):
+        """Create a growable dataset with the options of the profile
+
+        If the final size of the dataset is given, its chunks hold at most
+        that many rows
+        """
+        options = _dset_kwargs(key, shape, self.profile, resizable=True)
+        options.update(kwargs)
+        chunks = options.get('chunks')
+        if size is not None and isinstance(chunks, tuple):
+            options['chunks'] = (max(min(chunks[0], size), 1),) + chunks[1:]
+        return self.h5grp.create_dataset(dset_paths[key], dtype=dtype,
+                                         shape=shape,
+                                         maxshape=(None,) * len(shape),
+                                         **options)
+
+    def _create_datasets(self, width, n=None):
+        self._create('sequence', '|S%d' % width, (0,), n)
+        self._create_barcode_datasets(n)
+        self._create('qual', np.uint8, (0, width), n)
+
+    def _create_barcode_datasets(self, n=None):
+        self._create('barcode_original', self._bc_dtype, (0,), n)
+        self._create('barcode_corrected', self._bc_dtype, (0,), n)
+        self._create('barcode_error', int, (0,), n)
+
+    def _widen(self, width):
+        """Rebuild the sequence dataset and grow the qual dataset to width"""
+        path = dset_paths['sequence']
+        old = self.h5grp[path]
+        tmp = path + '.tmp'
+        new = self.h5grp.create_dataset(
+            tmp, dtype='|S%d' % width, shape=old.shape, maxshape=(None,),
+            **_dset_kwargs('sequence', old.shape, self.profile,
+                           resizable=True))
+        step = self._max_fill
+        for start in range(0, old.shape[0], step):
+            new[start:start + step] = old[start:start + step]
+        del self.h5grp[path]
+        self.h5grp.move(tmp, path)
+
+        self.h5grp[dset_paths['qual']].resize(width, axis=1)
+
+    def flush(self, whole_chunks=False):
+        """Append the records held to the datasets
+
+        Parameters
+        ----------
+        whole_chunks : bool, optional
+            If True and the storage profile fixes the rows of the chunks, only
+            whole chunks of records are appended, and the other records are
+            held. Defaults to False.
+        """
+        n = self._n
+        if whole_chunks and self._chunk_rows:
+            n -= n % self._chunk_rows
+        if n == 0:
+            return
+
+        seqs, quals, bc_ori, bc_cor, bc_err = zip(*self._blocks)
+        seqs = np.concatenate(seqs)
+        bc_ori = np.concatenate(bc_ori)
+        bc_cor = np.concatenate(bc_cor)
+        bc_err = np.concatenate(bc_err)
+        width = max(self._width, seqs.dtype.itemsize)
+        if not self._width:
+            # the final flush holds all the records of the sample
+            self._create_datasets(width, None if whole_chunks else n)
+        elif width > self._width:
+            self._widen(width)
+        self._width = width
+
+        start = self.h5grp[dset_paths['sequence']].shape[0]
+        end = start + n
+        for path, data in ((dset_paths['sequence'], seqs),
+                           (dset_paths['barcode_original'], bc_ori),
+                           (dset_paths['barcode_corrected'], bc_cor),
+                           (dset_paths['barcode_error'], bc_err)):
+            dset = self.h5grp[path]
+            dset.resize(end, axis=0)
+            dset[start:end] = data[:n].astype(dset.dtype)
+
+        # the new rows are filled with zeros if there are no quals
+        dset = self.h5grp[dset_paths['qual']]
+        dset.resize(end, axis=0)
+        block = None
+        if quals[0] is not None:
+            block = np.zeros((self._n, width), dtype=np.uint8)
+            pos = 0
+            for qual in quals:
+                block[pos:pos + len(qual), :qual.shape[1]] = qual
+                pos += len(qual)
+            dset[start:end] = block[:n]
+
+        # hold the records past the last whole chunk
+        self._blocks = []
+        if n < self._n:
+            held_quals = None if block is None else block[n:]
+            self._blocks.append((seqs[n:], held_quals, bc_ori[n:],
+                                 bc_cor[n:], bc_err[n:]))
+        self._n -= n
+
+
+class _compact_sample_writer(_sample_writer):
+    """Appends the records of a sample to the datasets of the compact layout
+
+    Notes
+    -----
+    The sequences and qual scores are appended without their padding, and the
+    offsets dataset gets the end of each appended sequence, so nothing has to
+    be rebuilt when a longer sequence shows up.
+    """
+    def _create_datasets(self, n=None, n_bases=None):
+        # the guessed chunks of growable one dimensional datasets are a few
+        # kilobytes, which compress poorly and take many reads
+        self._create('sequence', np.uint8, (0,), n_bases,
+                     chunks=(compact_chunk_size,))
+        self._create('qual', np.uint8, (0,), n_bases,
+                     chunks=(compact_chunk_size,))
+        # the bytes of the increasing offsets shuffle into long runs
+        rows = dset_profiles[self.profile].get('chunk_rows')
+        offsets = self._create('offsets', np.int64, (1,),
+                               None if n is None else n + 1, shuffle=True,
+                               chunks=(rows or compact_chunk_size // 8,))
+        offsets[0] = 0
+        self._create_barcode_datasets(n)
+
+    def flush(self, whole_chunks=False):
+        """Append the records held to the datasets
+
+        Parameters
+        ----------
+        whole_chunks : bool, optional
+            Whether more records may follow. The records are always all
+            appended, as the chunks of the sequences and qual scores do not
+            line up with the records.
+        """
+        if self._n == 0:
+            return
+
+        lengths = self.lengths[-len(self._blocks):]
+        if dset_paths['offsets'] not in self.h5grp:
+            # the final flush holds all the records of the sample
+            if whole_chunks:
+                self._create_datasets()
+            else:
+                self._create_datasets(
+                    self._n, sum(int(lens.sum()) for lens in lengths))
+
+        seqs, quals, bc_ori, bc_cor, bc_err = zip(*self._blocks)
+        flat_seqs, flat_quals = [], []
+        for seq, qual, lens in zip(seqs, quals, lengths):
+            width = seq.dtype.itemsize
+            mask = np.arange(width) < lens[:, np.newaxis]
+            seq = np.ascontiguousarray(seq).view(np.uint8)
+            flat_seqs.append(seq.reshape(len(lens), width)[mask])
+            if qual is not None:
+                flat_quals.append(qual[mask[:, :qual.shape[1]]])
+
+        offsets = self.h5grp[dset_paths['offsets']]
+        ends = offsets[-1] + np.cumsum(np.concatenate(lengths))
+        for path, data in ((dset_paths['sequence'], flat_seqs),
+                           (dset_paths['qual'], flat_quals),
+                           (dset_paths['offsets'], [ends]),
+                           (dset_paths['barcode_original'], bc_ori),
+                           (dset_paths['barcode_corrected'], bc_cor),
+                           (dset_paths['barcode_error'], bc_err)):
+            if not data:
+                continue
+            data = np.concatenate(data)
+            dset = self.h5grp[path]
+            start = dset.shape[0]
+            dset.resize(start + len(data), axis=0)
+            dset[start:] = data.astype(dset.dtype)
+
+        self._blocks = []
+        self._n = 0
+
+
 def _has_qual(fp):
     """Check if it looks like we have qual"""
     iter_ = load(fp)
@@ -202,9 +540,10 @@ def _per_sample_lengths(fp):
         {sample_id: [sequence_length]}
     """
     lengths = defaultdict(list)
-    for record in load(fp):
-        sample_id = record['SequenceID'].split(' ')[0].rsplit('_', 1)[0]
-        lengths[sample_id].append(len(record['Sequence']))
+    for ids, seqs, _ in _read_blocks(fp):
+        for seq_id, seq in zip(ids, seqs):
+            sample_id = seq_id.split(' ')[0].rsplit('_', 1)[0]
+            lengths[sample_id].append(len(seq))
 
     return lengths
 
@@ -268,7 +607,162 @@ def _set_attr_stats(h5grp, stats):
     h5grp.attrs['hist_edge'] = stats.hist_edge
 
 
-def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
+def _dset_kwargs(key, shape, profile='default', resizable=False):
+    """The storage options of a demux dataset
+
+    Parameters
+    ----------
+    key : str
+        The key of the dataset in `dset_paths`
+    shape : tuple of int
+        The shape of the dataset
+    profile : str, optional
+        The storage profile, see `dset_profiles`. Defaults to 'default'.
+    resizable : bool, optional
+        Whether the dataset can grow. Defaults to False.
+
+    Returns
+    -------
+    dict
+        The keyword arguments of h5py.Group.create_dataset
+
+    Raises
+    ------
+    ValueError
+        If the profile does not exist
+    """
+    if profile not in dset_profiles:
+        raise ValueError("Unknown demux storage profile: %s" % profile)
+
+    options = dset_profiles[profile]
+    kwargs = dict(dset_kwargs)
+    kwargs.update((k, v) for k, v in viewitems(options)
+                  if k not in dset_paths and k != 'chunk_rows')
+    kwargs.update(options.get(key, {}))
+
+    rows = options.get('chunk_rows')
+    if rows is not None:
+        # the chunks of fixed size datasets can't be larger than them
+        if not resizable:
+            rows = max(min(rows, shape[0]), 1)
+        kwargs['chunks'] = (rows,) + tuple(max(c, 1) for c in shape[1:])
+
+    return {k: v for k, v in viewitems(kwargs) if v is not None}
+
+
+def _is_contiguous(profile):
+    """Whether the datasets of a storage profile are stored contiguously"""
+    return dset_profiles[profile].get('chunks', True) is None
+
+
+def _count_errors(counts, bc_err):
+    """Add the barcode errors of a block to the counts of a sample
+
+    Parameters
+    ----------
+    counts : np.array of int or None
+        The number of sequences with 0, 1, ... barcode errors so far
+    bc_err : np.array of int
+        The barcode errors of the sequences of the block
+
+    Returns
+    -------
+    np.array of int
+        The updated counts
+    """
+    block = np.bincount(bc_err)
+    if counts is None:
+        return block
+    if block.size > counts.size:
+        counts, block = block, counts
+    counts[:block.size] += block
+    return counts
+
+
+def _summarize_sample(lengths, errors):
+    """Summarize the sequences of a sample, or of a file, for the sidecar"""
+    quantiles = np.percentile(lengths, [0, 25, 50, 75, 100]).tolist()
+    return {'n': int(lengths.size),
+            'length': dict(zip(['min', 'q25', 'median', 'q75', 'max'],
+                               quantiles), mean=float(lengths.mean())),
+            'barcode_errors': errors.tolist()}
+
+
+def _barcode_counter():
+    """A new `qiita_ware.barcodes.barcode_counter`"""
+    # barcodes reads demux files, so it can't be imported at the module level
+    from .barcodes import barcode_counter
+    return barcode_counter()
+
+
+def _write_summary(fp, lengths, barcodes, has_qual):
+    """Write the summary sidecar of a demux file
+
+    Parameters
+    ----------
+    fp : str
+        The filepath to write to
+    lengths : dict
+        {sample_id: sequence lengths}
+    barcodes : qiita_ware.barcodes.barcode_stat
+        The barcode statistics of the file
+    has_qual : bool
+        Whether the sequences have qual scores
+    """
+    errors = barcodes.samples
+    samples = {}
+    for sample, lens in viewitems(lengths):
+        samples[sample] = _summarize_sample(np.asarray(lens), errors[sample])
+
+    all_lengths = np.concatenate([np.asarray(lens)
+                                  for lens in viewvalues(lengths)])
+    all_errors = np.zeros(max(c.size for c in viewvalues(errors)), int)
+    for counts in viewvalues(errors):
+        all_errors[:counts.size] += counts
+
+    summary = _summarize_sample(all_lengths, all_errors)
+    summary.update({'has-qual': bool(has_qual), 'samples': samples})
+    summary['barcodes'] = {
+        'barcodes': {barcode: counts.tolist()
+                     for barcode, counts in viewitems(barcodes.barcodes)},
+        'collisions': barcodes.collisions,
+        'ambiguous': barcodes.ambiguous}
+
+    with open(fp, 'w') as f:
+        json.dump(summary, f, sort_keys=True, separators=(',', ':'))
+
+
+def load_summary(fp):
+    """Load the summary sidecar of a demux file
+
+    Parameters
+    ----------
+    fp : str
+        The filepath of the summary, written by `to_hdf5`
+
+    Returns
+    -------
+    dict
+        The summary of the file, with the keys:
+        n : int, the number of sequences
+        length : dict, the min, q25, median, q75, max and mean sequence
+            lengths
+        barcode_errors : list of int, the number of sequences with 0, 1, ...
+            barcode errors
+        has-qual : bool, whether the sequences have qual scores
+        samples : dict, {sample_id: dict} with the n, length and
+            barcode_errors of each sample
+        barcodes : dict, the barcodes, collisions and ambiguous barcode
+            statistics, see `qiita_ware.barcodes`, with the counts as lists.
+            Summaries written before these statistics were added don't have
+            this key.
+    """
+    with open(fp, 'U') as f:
+        return json.load(f)
+
+
+def _construct_datasets(sample_stats, h5file, max_barcode_length=12,
+                        profile='default'):
     """Construct the datasets within the h5file
 
     Parameters
@@ -277,6 +771,11 @@ def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
         {sample_id: stat}
     h5file : h5py.File
         The file to store the demux data
+    max_barcode_length : unsigned int, optional
+        The maximum length of the barcodes. Defaults to 12.
+    profile : str, optional
+        The storage profile of the datasets, see `dset_profiles`. Defaults to
+        'default'.
 
     Returns
     -------
@@ -284,7 +783,7 @@ def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
         {str : _buffer} where str is the dataset path and the `_buffer` is
         either `buffer1d` or `buffer2d`.
     """
-    def create_dataset(path, dtype, rows, cols):
+    def create_dataset(path, key, dtype, rows, cols):
         if cols == 1:
             shape = (rows,)
             buftype = buffer1d
@@ -292,16 +791,13 @@ def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
             shape = (rows, cols)
             buftype = buffer2d
 
-        kwargs = {'chunks': True, 'compression': True, 'compression_opts': 1}
-        dset = h5file.create_dataset(path, dtype=dtype, shape=shape, **kwargs)
+        dset = h5file.create_dataset(path, dtype=dtype, shape=shape,
+                                     **_dset_kwargs(key, shape, profile))
         return buftype(dset)
 
     buffers = {}
 
     for sid, stats in viewitems(sample_stats):
-        # determine group
-        pjoin = partial(os.path.join, sid)
-
         # setup dataset sizes and types
         rows = stats.n
         cols = stats.max
@@ -309,16 +805,13 @@ def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
         bc_dtype = '|S%d' % max_barcode_length
 
         # construct datasets
-        path = pjoin(dset_paths['sequence'])
-        buffers[path] = create_dataset(path, seq_dtype, rows, 1)
-        path = pjoin(dset_paths['barcode_original'])
-        buffers[path] = create_dataset(path, bc_dtype, rows, 1)
-        path = pjoin(dset_paths['barcode_corrected'])
-        buffers[path] = create_dataset(path, bc_dtype, rows, 1)
-        path = pjoin(dset_paths['barcode_error'])
-        buffers[path] = create_dataset(path, int, rows, 1)
-        path = pjoin(dset_paths['qual'])
-        buffers[path] = create_dataset(path, np.uint8, rows, cols)
+        for key, dtype, dset_cols in (('sequence', seq_dtype, 1),
+                                      ('barcode_original', bc_dtype, 1),
+                                      ('barcode_corrected', bc_dtype, 1),
+                                      ('barcode_error', int, 1),
+                                      ('qual', np.uint8, cols)):
+            path = os.path.join(sid, dset_paths[key])
+            buffers[path] = create_dataset(path, key, dtype, rows, dset_cols)
 
         # set stats
         _set_attr_stats(h5file[sid], stats)
@@ -326,7 +819,379 @@ def _construct_datasets(sample_stats, h5file, max_barcode_length=12):
     return buffers
 
 
-def to_hdf5(fp, h5file, max_barcode_length=12):
+def _read_blocks(fp, block_size=10000):
+    """Read the records of a sequence file in blocks
+
+    Parameters
+    ----------
+    fp : filepath
+        The filepath containing either FASTA or FASTQ data.
+    block_size : unsigned int, optional
+        The number of records per block. Defaults to 10000.
+
+    Returns
+    -------
+    generator
+        Yields (ids, sequences, quals), the lists of the sequence IDs, the
+        sequences and the ASCII encoded qual scores of a block of records.
+        quals is None if the file is FASTA.
+
+    Raises
+    ------
+    ValueError
+        If a FASTQ record is not made of 4 lines
+
+    Notes
+    -----
+    FASTQ records are read straight from the file, 4 lines at a time, as it is
+    done by the FASTQ parser of scikit-bio. The qual scores are decoded when
+    the whole block is parsed.
+    """
+    if not _has_qual(fp):
+        # the parser reuses the same record object
+        iter_ = iter(load(fp))
+        while True:
+            recs = [(rec['SequenceID'], rec['Sequence'])
+                    for rec in islice(iter_, block_size)]
+            if not recs:
+                break
+            ids, seqs = zip(*recs)
+            yield list(ids), list(seqs), None
+        return
+
+    opener = gzip.open if fp.endswith('.gz') else open
+    with opener(fp) as fh:
+        for block in _read_fastq_blocks(fh, fp, block_size):
+            yield block
+
+
+def _read_fastq_blocks(fh, fp, block_size=10000):
+    """Read the records of an open FASTQ file in blocks
+
+    Parameters
+    ----------
+    fh : file-like object
+        The FASTQ data
+    fp : filepath
+        The filepath of the data, used for reporting errors
+    block_size : unsigned int, optional
+        The number of records per block. Defaults to 10000.
+
+    Returns
+    -------
+    generator
+        Yields (ids, sequences, quals) as `_read_blocks`
+
+    Raises
+    ------
+    ValueError
+        If a FASTQ record is not made of 4 lines
+
+    Notes
+    -----
+    Empty lines after the last record, such as a blank line at the end of
+    the file, are ignored.
+    """
+    while True:
+        lines = [line.rstrip() for line in islice(fh, 4 * block_size)]
+        while lines and not lines[-1]:
+            lines.pop()
+        if not lines:
+            break
+        if (len(lines) % 4 or
+                not all(line.startswith('@') for line in lines[::4]) or
+                not all(line.startswith('+') for line in lines[2::4])):
+            raise ValueError("%s doesn't appear to be a FASTQ file!" % fp)
+        yield [line[1:] for line in lines[::4]], lines[1::4], lines[3::4]
+
+
+def _fastq_shards(fp, shard_size):
+    """Split a FASTQ file in byte ranges at record boundaries
+
+    Parameters
+    ----------
+    fp : filepath
+        The FASTQ file, uncompressed
+    shard_size : unsigned int
+        The number of records per range. The last range may hold less.
+
+    Returns
+    -------
+    list of (int, int)
+        The start and end offsets of the ranges
+
+    Notes
+    -----
+    The records are expected to span 4 lines each, as `_read_fastq_blocks`
+    does, so the boundaries are found by counting the lines of the file,
+    which only requires a scan of its bytes.
+    """
+    lines_per_shard = 4 * shard_size
+    offsets = [0]
+    lines = 0
+    pos = 0
+    with open(fp, 'rb') as fh:
+        while True:
+            buf = fh.read(2 ** 24)
+            if not buf:
+                break
+            n = buf.count(b'\n')
+            newlines = None
+            while lines + n >= len(offsets) * lines_per_shard:
+                if newlines is None:
+                    newlines = np.flatnonzero(
+                        np.frombuffer(buf, dtype=np.uint8) == ord('\n'))
+                idx = len(offsets) * lines_per_shard - lines - 1
+                offsets.append(pos + newlines[idx] + 1)
+            lines += n
+            pos += len(buf)
+
+    if pos > offsets[-1]:
+        offsets.append(pos)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def _parse_shard(args):
+    """Worker for Pool.apply_async, parses a byte range of a FASTQ file
+
+    Parameters
+    ----------
+    args : tuple of (filepath, int, int, unsigned int)
+        The FASTQ file, the start and end offsets of the range and the number
+        of records parsed at once
+
+    Returns
+    -------
+    list of tuple
+        The per sample blocks of the range, as `_split_libraries_blocks`
+    """
+    fp, start, end, block_size = args
+    with open(fp, 'rb') as fh:
+        fh.seek(start)
+        data = BytesIO(fh.read(end - start))
+
+    return [sample_block
+            for block in _read_fastq_blocks(data, fp, block_size)
+            for sample_block in _sample_blocks(fp, *block)]
+
+
+def _parallel_split_libraries_blocks(fp, n_jobs, block_size=10000,
+                                     shard_size=100000):
+    """Parse the records of a split libraries FASTQ in parallel
+
+    Parameters
+    ----------
+    fp : filepath
+        The FASTQ file, uncompressed
+    n_jobs : unsigned int
+        The number of processes parsing the file
+    block_size : unsigned int, optional
+        The number of records parsed at once. Defaults to 10000.
+    shard_size : unsigned int, optional
+        The number of records parsed by each task, a multiple of
+        `block_size`. Defaults to 100000.
+
+    Returns
+    -------
+    generator
+        Yields the same blocks, in the same order, as
+        `_split_libraries_blocks`
+
+    Notes
+    -----
+    As the shards hold a whole number of blocks, the blocks are the same
+    ones parsed serially, so the files written from them are identical. At
+    most 2 * n_jobs shards are held at any time.
+    """
+    tasks = [(fp, start, end, block_size)
+             for start, end in _fastq_shards(fp, shard_size)]
+
+    pool = Pool(processes=n_jobs)
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_parse_shard, (task, )))
+            if len(pending) >= 2 * n_jobs:
+                for sample_block in pending.popleft().get():
+                    yield sample_block
+        while pending:
+            for sample_block in pending.popleft().get():
+                yield sample_block
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _parse_block(fp, ids, seqs, quals):
+    """Parse a block of split libraries records
+
+    Parameters
+    ----------
+    fp : filepath
+        The filepath the block comes from, used for reporting errors
+    ids : list of str
+        The sequence IDs
+    seqs : list of str
+        The sequences
+    quals : list of str or None
+        The ASCII encoded qual scores, Phred+33
+
+    Returns
+    -------
+    tuple of np.array
+        The samples, the sequences, their lengths, the qual scores (one row
+        per sequence, or None), the original barcodes, the corrected barcodes
+        and the barcode errors of the records
+
+    Raises
+    ------
+    ValueError
+        If a sequence ID does not contain the split libraries fields, or the
+        qual scores do not match the sequences
+    """
+    # a single search over the whole block, each line matches at most once
+    headers = sl_headers.findall('\n'.join(ids))
+    if len(headers) != len(ids):
+        raise ValueError("%s doesn't appear to be split libraries "
+                         "output!" % fp)
+    samples, bc_ori, bc_cor, bc_err = (np.array(f) for f in zip(*headers))
+
+    seqs = np.array(seqs)
+    lengths = np.char.str_len(seqs)
+
+    if quals is not None:
+        qual_lengths = np.fromiter(map(len, quals), dtype=int,
+                                   count=len(quals))
+        if (qual_lengths != lengths).any():
+            raise ValueError("%s has qual scores that don't match their "
+                             "sequences!" % fp)
+        flat = np.frombuffer(b''.join(quals), dtype=np.uint8)
+        if flat.size and (flat.min() < 33 or flat.max() > 95):
+            raise ValueError("%s has qual scores out of range!" % fp)
+        quals = np.zeros((len(seqs), lengths.max()), dtype=np.uint8)
+        quals[np.arange(quals.shape[1]) < lengths[:, np.newaxis]] = flat - 33
+
+    return samples, seqs, lengths, quals, bc_ori, bc_cor, bc_err.astype(int)
+
+
+def _split_libraries_blocks(fp, block_size=10000):
+    """Parse the records of a split libraries output, per sample, in blocks
+
+    Parameters
+    ----------
+    fp : filepath
+        The filepath containing either FASTA or FASTQ data.
+    block_size : unsigned int, optional
+        The number of records parsed at once. Defaults to 10000.
+
+    Returns
+    -------
+    generator
+        Yields (sample, sequences, quals, original_barcodes,
+                corrected_barcodes, barcode_errors) where all but the sample
+        are np.array holding the records of the sample in a block, in file
+        order. quals is None if the file has no qual scores.
+    """
+    for ids, seqs, quals in _read_blocks(fp, block_size):
+        for sample_block in _sample_blocks(fp, ids, seqs, quals):
+            yield sample_block
+
+
+def _sample_blocks(fp, ids, seqs, quals):
+    """Parse a block of split libraries records and split it per sample
+
+    Parameters
+    ----------
+    fp : filepath
+        The filepath the block comes from, used for reporting errors
+    ids : list of str
+        The sequence IDs
+    seqs : list of str
+        The sequences
+    quals : list of str or None
+        The ASCII encoded qual scores, Phred+33
+
+    Returns
+    -------
+    generator
+        Yields the per sample blocks as `_split_libraries_blocks`, with the
+        samples sorted
+    """
+    samples, seqs, lengths, quals, bc_ori, bc_cor, bc_err = \
+        _parse_block(fp, ids, seqs, quals)
+
+    # a stable sort keeps the records of each sample in file order
+    order = np.argsort(samples, kind='mergesort')
+    uniq, starts = np.unique(samples[order], return_index=True)
+    for sample, idx in zip(uniq, np.split(order, starts[1:])):
+        # size the block for the sample, not for the whole block
+        width = lengths[idx].max()
+        yield (str(sample), seqs[idx].astype('|S%d' % width),
+               None if quals is None else quals[idx, :width],
+               bc_ori[idx], bc_cor[idx], bc_err[idx])
+
+
+def _to_hdf5_single_pass(fp, h5file, max_barcode_length=12, n_jobs=1,
+                         compact=False, profile='default', summary_fp=None):
+    """Represent demux data in an h5file with a single pass over fp
+
+    Parameters
+    ----------
+    fp : filepath
+        The filepath containing either FASTA or FASTQ data.
+    h5file : h5py.File
+        The file to write into.
+    max_barcode_length : unsigned int, optional
+        The maximum length of the barcodes. Defaults to 12.
+    n_jobs : unsigned int, optional
+        The number of processes parsing an uncompressed FASTQ file. Defaults
+        to 1.
+    compact : bool, optional
+        If True, the file is written with the compact layout. Defaults to
+        False.
+    profile : str, optional
+        The storage profile of the datasets, see `dset_profiles`. Defaults to
+        'default'.
+    summary_fp : str, optional
+        Where to write the JSON summary of the file. Defaults to None, no
+        summary is written.
+    """
+    if n_jobs > 1 and _has_qual(fp) and not fp.endswith('.gz'):
+        blocks = _parallel_split_libraries_blocks(fp, n_jobs)
+    else:
+        blocks = _split_libraries_blocks(fp)
+
+    writer_cls = _compact_sample_writer if compact else _sample_writer
+    writers = {}
+    counter = _barcode_counter() if summary_fp is not None else None
+    for sample, seqs, quals, bc_ori, bc_cor, bc_err in blocks:
+        if sample not in writers:
+            writers[sample] = writer_cls(h5file.create_group(sample),
+                                         max_barcode_length, profile=profile)
+        writers[sample].write_block(seqs, quals, bc_ori, bc_cor, bc_err)
+        if counter is not None:
+            counter.add(sample, bc_ori, bc_cor, bc_err)
+
+    lengths = {}
+    for sample, writer in viewitems(writers):
+        writer.flush()
+        lengths[sample] = np.concatenate(writer.lengths)
+
+    sample_stats, full_stats = _summarize_lengths(lengths)
+    for sample, stats in viewitems(sample_stats):
+        _set_attr_stats(h5file[sample], stats)
+    _set_attr_stats(h5file, full_stats)
+    h5file.attrs['has-qual'] = _has_qual(fp)
+    h5file.attrs['version'] = 2 if compact else 1
+
+    if summary_fp is not None:
+        _write_summary(summary_fp, lengths, counter.stats(),
+                       h5file.attrs['has-qual'])
+
+
+def to_hdf5(fp, h5file, max_barcode_length=12, single_pass=False, n_jobs=1,
+            compact=False, profile='default', summary_fp=None):
     """Represent demux data in an h5file
 
     Parameters
@@ -335,6 +1200,35 @@ def to_hdf5(fp, h5file, max_barcode_length=12):
         The filepath containing either FASTA or FASTQ data.
     h5file : h5py.File
         The file to write into.
+    max_barcode_length : unsigned int, optional
+        The maximum length of the barcodes. Defaults to 12.
+    single_pass : bool, optional
+        If True, the file is read once and the datasets are grown as the
+        records are parsed, instead of being sized with a first pass over the
+        file. Defaults to False.
+    n_jobs : unsigned int, optional
+        The number of processes parsing the file, which implies
+        `single_pass`. Only uncompressed FASTQ files are parsed in parallel,
+        and the resulting file is identical to the one written with a single
+        process. Defaults to 1.
+    compact : bool, optional
+        If True, the sequences and qual scores are stored without padding, in
+        the version 2 layout, which implies `single_pass`. Defaults to False.
+    profile : str, optional
+        The storage profile of the datasets, one of `dset_profiles`, which
+        sets their compression filters and chunks. As contiguous datasets
+        can't grow, the two pass mode is used for the "hot" profile, whatever
+        `single_pass` and `n_jobs` are. Defaults to 'default'.
+    summary_fp : str, optional
+        Where to write the JSON summary of the file, see `load_summary`. The
+        summary, including the barcode statistics, is collected while the
+        file is written. Defaults to None, no summary is written.
+
+    Raises
+    ------
+    ValueError
+        If the storage profile does not exist, or is the "hot" profile and
+        `compact` is set
 
     Notes
     -----
@@ -342,7 +1236,8 @@ def to_hdf5(fp, h5file, max_barcode_length=12):
     be constructed that correspond to sequence, original_barcode,
     corrected_barcode, barcode_errors, and qual.
 
-    The filepath is required as two passes over the file are essential.
+    Unless `single_pass` is set, the filepath is required as two passes over
+    the file are essential.
 
     The expectation is that the filepath being operated on is the result of
     split_libraries.py or split_libraries_fastq.py from QIIME. This code makes
@@ -351,39 +1246,47 @@ def to_hdf5(fp, h5file, max_barcode_length=12):
     "bc_diffs" field, and additionally assumes the sample ID is encoded in the
     ID.
     """
+    if profile not in dset_profiles:
+        raise ValueError("Unknown demux storage profile: %s" % profile)
+
+    if _is_contiguous(profile):
+        if compact:
+            raise ValueError("The compact layout can't be written with the "
+                             "contiguous datasets of the %s profile"
+                             % profile)
+    elif single_pass or n_jobs > 1 or compact:
+        _to_hdf5_single_pass(fp, h5file, max_barcode_length, n_jobs, compact,
+                             profile, summary_fp)
+        return
+
     # walk over the file and collect summary stats
-    sample_stats, full_stats = _summarize_lengths(_per_sample_lengths(fp))
+    lengths = _per_sample_lengths(fp)
+    sample_stats, full_stats = _summarize_lengths(lengths)
 
     # construct the datasets, storing per sample stats and full file stats
-    buffers = _construct_datasets(sample_stats, h5file)
+    buffers = _construct_datasets(sample_stats, h5file, max_barcode_length,
+                                  profile)
     _set_attr_stats(h5file, full_stats)
     h5file.attrs['has-qual'] = _has_qual(fp)
+    h5file.attrs['version'] = 1
 
-    for rec in load(fp):
-        result = search((r'^(?P<sample>.+?)_\d+? .*orig_bc=(?P<orig_bc>.+?) '
-                         'new_bc=(?P<corr_bc>.+?) bc_diffs=(?P<bc_diffs>\d+)'),
-                        rec['SequenceID'])
-
-        if result is None:
-            raise ValueError("%s doesn't appear to be split libraries "
-                             "output!" % fp)
-
-        sample = result.group('sample')
-        bc_diffs = result.group('bc_diffs')
-        corr_bc = result.group('corr_bc')
-        orig_bc = result.group('orig_bc')
-
-        sequence = rec['Sequence']
-        qual = rec['Qual']
-
+    counter = _barcode_counter() if summary_fp is not None else None
+    for sample, seqs, quals, bc_ori, bc_cor, bc_err in \
+            _split_libraries_blocks(fp):
+        if counter is not None:
+            counter.add(sample, bc_ori, bc_cor, bc_err)
         pjoin = partial(os.path.join, sample)
-        buffers[pjoin(dset_paths['sequence'])].write(sequence)
-        buffers[pjoin(dset_paths['barcode_original'])].write(orig_bc)
-        buffers[pjoin(dset_paths['barcode_corrected'])].write(corr_bc)
-        buffers[pjoin(dset_paths['barcode_error'])].write(bc_diffs)
+        buffers[pjoin(dset_paths['sequence'])].write_block(seqs)
+        buffers[pjoin(dset_paths['barcode_original'])].write_block(bc_ori)
+        buffers[pjoin(dset_paths['barcode_corrected'])].write_block(bc_cor)
+        buffers[pjoin(dset_paths['barcode_error'])].write_block(bc_err)
 
-        if qual is not None:
-            buffers[pjoin(dset_paths['qual'])].write(qual)
+        if quals is not None:
+            buffers[pjoin(dset_paths['qual'])].write_block(quals)
+
+    if summary_fp is not None:
+        _write_summary(summary_fp, lengths, counter.stats(),
+                       h5file.attrs['has-qual'])
 
 
 def format_fasta_record(seqid, seq, qual):
@@ -406,7 +1309,60 @@ def format_fasta_record(seqid, seq, qual):
     return b'\n'.join([b'>' + seqid, seq, b''])
 
 
-def to_ascii(demux, samples=None):
+def format_block(sample, indices, seqs, quals, bc_ori, bc_cor, bc_err):
+    """Format a block of records of a sample
+
+    Parameters
+    ----------
+    sample : str
+        The sample name
+    indices : np.array of int
+        The indices of the records in the sample
+    seqs : np.array of str
+        The sequences
+    quals : np.array of int or None
+        The qual scores, one row per sequence, padded with zeros. If None, the
+        records are formatted as fasta.
+    bc_ori : np.array of str
+        The original barcodes
+    bc_cor : np.array of str
+        The corrected barcodes
+    bc_err : np.array of int
+        The number of errors in the barcodes
+
+    Returns
+    -------
+    np.array of str
+        The pieces of the fastq or fasta records, one row per record. Joining
+        the pieces of a row gives the formatted record.
+
+    Notes
+    -----
+    The pieces are laid out column by column with NumPy, so no Python code
+    runs per record. The qual scores of the whole block are converted to
+    Phred+33 at once, and the padding is dropped as the trailing NULs of the
+    resulting strings.
+    """
+    n = len(seqs)
+    pieces = [b'>', str(sample) + '_', indices.astype(bytes), b' orig_bc=',
+              bc_ori, b' new_bc=', bc_cor, b' bc_diffs=', bc_err.astype(bytes),
+              b'\n', seqs, b'\n']
+
+    if quals is not None:
+        pieces[0] = b'@'
+        ascii = quals.astype(np.uint8) + 33
+        lengths = np.char.str_len(seqs)
+        ascii[np.arange(ascii.shape[1]) >= lengths[:, np.newaxis]] = 0
+        ascii = np.ascontiguousarray(ascii).view('|S%d' % ascii.shape[1])
+        pieces.extend([b'+\n', ascii[:, 0], b'\n'])
+
+    block = np.empty((n, len(pieces)), dtype=object)
+    for i, piece in enumerate(pieces):
+        block[:, i] = piece
+    return block
+
+
+def to_ascii(demux, samples=None, block_size=10000, mmap=False):
     """Consume a demuxed HDF5 file and yield sequence records
 
     Parameters
@@ -416,6 +1372,12 @@ def to_ascii(demux, samples=None):
     samples : list, optional
         Samples to pull out. If None, then all samples will be examined.
         Defaults to None.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once, see `fetch`. Defaults to
+        10000.
+    mmap : bool, optional
+        Whether to map the datasets in memory, see `fetch_blocks`. Defaults to
+        False.
 
     Returns
     -------
@@ -424,24 +1386,42 @@ def to_ascii(demux, samples=None):
         the presence/absence of qual scores. If qual scores exist, then fastq
         is returned, otherwise fasta is returned.
     """
-    if demux.attrs['has-qual']:
-        formatter = format_fastq_record
-    else:
-        formatter = format_fasta_record
+    for block in fetch_blocks(demux, samples, block_size=block_size,
+                              mmap=mmap):
+        for record in format_block(*block).tolist():
+            yield b''.join(record)
 
-    id_fmt = ("%(sample)s_%(idx)d orig_bc=%(bc_ori)s new_bc=%(bc_cor)s "
-              "bc_diffs=%(bc_diff)d")
 
-    if samples is None:
-        samples = demux.keys()
+def write_ascii(demux, fh, samples=None, block_size=10000, mmap=False):
+    """Write the sequence records of a demuxed HDF5 file to a file
+
+    Parameters
+    ----------
+    demux : h5py.File
+        The demux file to operate on
+    fh : file-like object
+        The file to write to, such as a gzip.GzipFile
+    samples : list, optional
+        Samples to pull out. If None, then all samples will be examined.
+        Defaults to None.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once, see `fetch`. Defaults to
+        10000.
+    mmap : bool, optional
+        Whether to map the datasets in memory, see `fetch_blocks`. Defaults to
+        False.
 
-    for samp, idx, seq, qual, bc_ori, bc_cor, bc_err in fetch(demux, samples):
-        seq_id = id_fmt % {'sample': samp, 'idx': idx, 'bc_ori': bc_ori,
-                           'bc_cor': bc_cor, 'bc_diff': bc_err}
-        yield formatter(seq_id, seq, qual.astype(np.uint8))
+    Notes
+    -----
+    The records are written as `to_ascii` yields them, a whole block of
+    records at a time.
+    """
+    for block in fetch_blocks(demux, samples, block_size=block_size,
+                              mmap=mmap):
+        fh.write(b''.join(format_block(*block).ravel().tolist()))
 
 
-def to_per_sample_ascii(demux, samples=None):
+def to_per_sample_ascii(demux, samples=None, block_size=10000, mmap=False):
     """Consume a demuxxed HDF5 file and yield sequence records per sample
 
     Parameters
@@ -451,6 +1431,12 @@ def to_per_sample_ascii(demux, samples=None):
     samples : list, optional
         Samples to pull out. If None, then all samples will be examined.
         Defaults to None.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once, see `fetch`. Defaults to
+        10000.
+    mmap : bool, optional
+        Whether to map the datasets in memory, see `fetch_blocks`. Defaults to
+        False.
 
     Returns
     -------
@@ -465,11 +1451,209 @@ def to_per_sample_ascii(demux, samples=None):
         samples = demux.keys()
 
     for samp in samples:
-        yield samp, to_ascii(demux, samples=[samp])
+        yield samp, to_ascii(demux, samples=[samp], block_size=block_size,
+                             mmap=mmap)
 
 
-def fetch(demux, samples=None, k=None):
-    """Fetch sequences from a HDF5 demux file
+def _sample_indices(n, k):
+    """Randomly select (without replacement) k indices out of n
+
+    Parameters
+    ----------
+    n : int
+        The number of indices to select from
+    k : int
+        The number of indices to select, k <= n
+
+    Returns
+    -------
+    np.array of int
+        The selected indices, sorted
+
+    Notes
+    -----
+    If k is small compared to n, random indices are drawn until k distinct
+    ones are found, which takes O(k) memory and time instead of shuffling the
+    n indices. As any index is as likely to be drawn as any other, all the
+    subsets of k indices are equally likely.
+    """
+    if 2 * k > n:
+        return np.sort(np.random.choice(n, k, replace=False))
+
+    indices = np.unique(np.random.randint(n, size=k))
+    while indices.size < k:
+        indices = np.unique(np.concatenate(
+            [indices, np.random.randint(n, size=k - indices.size)]))
+    return indices
+
+
+def _row_blocks(group, block_size):
+    """Split the rows of a sample in blocks aligned to the HDF5 chunks
+
+    Parameters
+    ----------
+    group : h5py.Group
+        The group of the sample
+    block_size : unsigned int
+        The minimum number of rows per block
+
+    Returns
+    -------
+    list of (int, int)
+        The start and end rows of the blocks
+
+    Notes
+    -----
+    The block size is rounded up to a multiple of the number of rows of the
+    qual chunks, which are the largest ones, so no qual chunk is read twice.
+    In the compact layout, the offsets chunks are used instead.
+    """
+    n = group.attrs['n']
+    if dset_paths['offsets'] in group:
+        chunks = group[dset_paths['offsets']].chunks
+    else:
+        chunks = group[dset_paths['qual']].chunks
+    if chunks is not None:
+        block_size = -(-block_size // chunks[0]) * chunks[0]
+    return [(start, min(start + block_size, n))
+            for start in range(0, n, block_size)]
+
+
+def _mapped(dset):
+    """Map a dataset of a demux file in memory
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        The dataset to map
+
+    Returns
+    -------
+    np.memmap or None
+        The read-only map of the dataset, or None if the dataset can't be
+        mapped
+
+    Notes
+    -----
+    Only the contiguous datasets without filters, such as the ones written
+    with the "hot" storage profile, of files opened read-only from disk are
+    mapped, as their data are laid out in the file as in memory, at the
+    offset given by HDF5. Datasets that were never written have no storage,
+    and are not mapped either.
+    """
+    f = dset.file
+    if f.driver != 'sec2' or f.mode != 'r':
+        return None
+
+    plist = dset.id.get_create_plist()
+    if (plist.get_layout() != h5py.h5d.CONTIGUOUS or plist.get_nfilters() or
+            plist.get_external_count()):
+        return None
+
+    offset = dset.id.get_offset()
+    if offset is None:
+        return None
+
+    return np.memmap(f.filename, dtype=dset.dtype, mode='r', offset=offset,
+                     shape=dset.shape)
+
+
+def _read_rows(dset, rows, plan_reads=True):
+    """Read some of the rows of a dataset
+
+    Parameters
+    ----------
+    dset : h5py.Dataset or np.array
+        The dataset to read, or its map, see `_mapped`
+    rows : slice or np.array of int
+        The rows to read. If an array, they must be sorted and without
+        duplicates.
+    plan_reads : bool, optional
+        If True, the rows are read one chunk at a time, only reading the
+        chunks holding any of the rows. Otherwise, the rows are read with a
+        single coordinate list selection. Defaults to True.
+
+    Returns
+    -------
+    np.array
+        The rows read. If `dset` is mapped and `rows` is a slice, no data are
+        copied.
+    """
+    if isinstance(rows, slice) or isinstance(dset, np.ndarray):
+        return dset[rows]
+    if not plan_reads or dset.chunks is None:
+        return dset[rows.tolist()]
+
+    indices = rows
+    chunk_rows = dset.chunks[0]
+    rows = np.empty((indices.size, ) + dset.shape[1:], dtype=dset.dtype)
+    chunks, starts = np.unique(indices // chunk_rows, return_index=True)
+    ends = np.append(starts[1:], indices.size)
+    for chunk, start, end in zip(chunks, starts, ends):
+        offset = chunk * chunk_rows
+        block = dset[offset:offset + chunk_rows]
+        rows[start:end] = block[indices[start:end] - offset]
+    return rows
+
+
+def _read_compact_rows(group, rows, has_qual=True):
+    """Read some of the sequences of a sample in the compact layout
+
+    Parameters
+    ----------
+    group : h5py.Group
+        The group of the sample
+    rows : np.array of int
+        The rows to read, sorted and without duplicates
+    has_qual : bool, optional
+        Whether to read the qual scores. Defaults to True.
+
+    Returns
+    -------
+    np.array of str
+        The sequences
+    np.array of int or None
+        The qual scores, one row per sequence padded with zeros to the longest
+        sequence of the sample as in the version 1 layout, or None if
+        `has_qual` is False
+
+    Notes
+    -----
+    The sequences and qual scores between the first and the last row are read
+    at once, and the ones of the rows not selected are dropped.
+    """
+    lo, hi = rows[0], rows[-1] + 1
+    bounds = group[dset_paths['offsets']][lo:hi + 1]
+    starts = bounds[rows - lo]
+    lengths = bounds[rows - lo + 1] - starts
+    first, last = bounds[0], bounds[-1]
+    total = lengths.sum()
+
+    # where each position of the selected rows is in the span read
+    positions = None
+    if total != last - first:
+        positions = np.arange(total) + np.repeat(
+            starts - first - (np.cumsum(lengths) - lengths), lengths)
+
+    width = int(group.attrs['max'])
+    mask = np.arange(width) < lengths[:, np.newaxis]
+
+    def unpack(dset):
+        flat = dset[first:last]
+        if positions is not None:
+            flat = flat[positions]
+        padded = np.zeros((rows.size, width), dtype=np.uint8)
+        padded[mask] = flat
+        return padded
+
+    seqs = unpack(group[dset_paths['sequence']]).view('|S%d' % width)[:, 0]
+    quals = unpack(group[dset_paths['qual']]) if has_qual else None
+    return seqs, quals
+
+
+def fetch_blocks(demux, samples=None, k=None, plan_reads=True,
+                 block_size=10000, mmap=False, sequences_only=False):
+    """Fetch blocks of sequences from a HDF5 demux file
 
     Parameters
     ----------
@@ -482,51 +1666,135 @@ def fetch(demux, samples=None, k=None):
         Randomly select (without replacement) k sequences from a sample. Only
         samples in which the number of sequences are >= k are considered. If
         None, all sequences for a sample are returned. Defaults to None.
+    plan_reads : bool, optional
+        If True, the selected sequences are read one HDF5 chunk at a time,
+        only touching the chunks holding them. Otherwise, they are read with
+        a coordinate list selection. Only used if `k` is set. Defaults to
+        True.
+    block_size : unsigned int, optional
+        The minimum number of rows read at once from each dataset, rounded up
+        to fit the HDF5 chunks. Defaults to 10000.
+    mmap : bool, optional
+        If True, the datasets that can be are mapped in memory and sliced,
+        see `_mapped`, and the other ones are read as usual. Defaults to
+        False.
+    sequences_only : bool, optional
+        If True, only the sequences are read, and the qual scores and
+        barcodes are yielded as None. Defaults to False.
 
     Returns
     -------
     generator
-        Yields (sample, index, sequence, qual, original_barcode,
-                corrected_barcode, barcode_error)
+        Yields (sample, indices, sequences, quals, original_barcodes,
+                corrected_barcodes, barcode_errors), where all but the sample
+        are np.array holding the records of a block of rows of the sample.
+        quals is None if the file has no qual scores.
+
+    Notes
+    -----
+    The samples are read in blocks of rows, so the memory used does not
+    depend on the number of sequences of the samples. Both layouts are
+    read, and the sequences and qual scores are padded as in the version 1
+    layout. `plan_reads` does not apply to the compact layout, see
+    `_read_compact_rows`.
+
+    The blocks yielded from mapped datasets are views of the file, which
+    stay valid after it is closed.
     """
     if samples is None:
         samples = demux.keys()
 
+    compact = demux.attrs.get('version', 1) == 2
+    has_qual = demux.attrs['has-qual'] and not sequences_only
+    keys = ['sequence']
+    if not sequences_only:
+        keys.extend(['qual', 'barcode_original', 'barcode_corrected',
+                     'barcode_error'])
+
     for sample in samples:
         if sample not in demux:
             continue
 
-        pjoin = partial(os.path.join, sample)
+        group = demux[sample]
+        n = group.attrs['n']
 
-        # h5py only has partial fancy indexing support and it is limited to a
-        # boolean vector.
-        indices = np.ones(demux[sample].attrs['n'], dtype=bool)
+        dsets = {}
+        for key in keys:
+            dset = group[dset_paths[key]]
+            dsets[key] = _mapped(dset) if mmap else None
+            if dsets[key] is None:
+                dsets[key] = dset
+
+        indices = None
         if k is not None:
-            if demux[sample].attrs['n'] < k:
+            if n < k:
                 continue
+            indices = _sample_indices(n, k)
 
-            to_keep = np.arange(demux[sample].attrs['n'])
-            np.random.shuffle(to_keep)
-            indices = np.logical_not(indices)
-            indices[to_keep[:k]] = True
+        for start, end in _row_blocks(group, block_size):
+            if indices is None:
+                rows = slice(start, end)
+                rows_idx = np.arange(start, end)
+            else:
+                lo, hi = np.searchsorted(indices, [start, end])
+                if lo == hi:
+                    continue
+                rows = rows_idx = indices[lo:hi]
+
+            read = partial(_read_rows, rows=rows, plan_reads=plan_reads)
+            if compact:
+                seqs, quals = _read_compact_rows(group, rows_idx, has_qual)
+            else:
+                seqs = read(dsets['sequence'])
 
-        seqs = demux[pjoin(dset_paths['sequence'])][indices]
+                # only yield qual if we have it
+                quals = None
+                if has_qual:
+                    quals = read(dsets['qual'])
 
-        # only yield qual if we have it
-        quals = repeat(None)
-        if demux.attrs['has-qual']:
-            if len(indices) == 1:
-                if indices[0]:
-                    quals = demux[pjoin(dset_paths['qual'])][:]
-            else:
-                quals = demux[pjoin(dset_paths['qual'])][indices, :]
+            bc_original = bc_corrected = bc_error = None
+            if not sequences_only:
+                bc_original = read(dsets['barcode_original'])
+                bc_corrected = read(dsets['barcode_corrected'])
+                bc_error = read(dsets['barcode_error'])
+
+            yield (sample, rows_idx, seqs, quals, bc_original, bc_corrected,
+                   bc_error)
 
-        bc_original = demux[pjoin(dset_paths['barcode_original'])][indices]
-        bc_corrected = demux[pjoin(dset_paths['barcode_corrected'])][indices]
-        bc_error = demux[pjoin(dset_paths['barcode_error'])][indices]
 
-        iter_ = zip(repeat(sample), np.arange(indices.size)[indices], seqs,
-                    quals, bc_original, bc_corrected, bc_error)
+def fetch(demux, samples=None, k=None, plan_reads=True, block_size=10000,
+          mmap=False):
+    """Fetch sequences from a HDF5 demux file
+
+    Parameters
+    ----------
+    demux : h5py.File
+        The demux file to operate on.
+    samples : list, optional
+        Samples to pull out. If None, then all samples will be examined.
+        Defaults to None.
+    k : int, optional
+        Randomly select (without replacement) k sequences from a sample. Only
+        samples in which the number of sequences are >= k are considered. If
+        None, all sequences for a sample are returned. Defaults to None.
+    plan_reads : bool, optional
+        See `fetch_blocks`. Defaults to True.
+    block_size : unsigned int, optional
+        See `fetch_blocks`. Defaults to 10000.
+    mmap : bool, optional
+        See `fetch_blocks`. Defaults to False.
+
+    Returns
+    -------
+    generator
+        Yields (sample, index, sequence, qual, original_barcode,
+                corrected_barcode, barcode_error)
+    """
+    for sample, indices, seqs, quals, bc_original, bc_corrected, bc_error in \
+            fetch_blocks(demux, samples, k, plan_reads, block_size, mmap):
+        iter_ = zip(repeat(sample), indices, seqs,
+                    repeat(None) if quals is None else quals, bc_original,
+                    bc_corrected, bc_error)
 
         for item in iter_:
             yield item
@@ -50,11 +50,12 @@ def preprocessor(study_id, prep_template_id, param_id, param_constructor):
     return preprocess_out
 
 
-def submit_to_ebi(preprocessed_data_id, submission_type):
+def submit_to_ebi(preprocessed_data_id, submission_type,
+                  moi_update_status=None):
     """Submit a study to EBI"""
-    study_acc, submission_acc = submit_EBI(preprocessed_data_id,
-                                           submission_type,
-                                           True)
+    study_acc, submission_acc = submit_EBI(
+        preprocessed_data_id, submission_type, True,
+        moi_update_status=moi_update_status)
 
     return study_acc, submission_acc
 
@@ -7,17 +7,15 @@ from os.path import basename, exists, join, split
 from os import environ, close
 from datetime import date, timedelta, datetime
 from xml.etree import ElementTree as ET
-from xml.dom import minidom
 from xml.sax.saxutils import escape
 
 from future.utils import viewitems
-from skbio.util import safe_md5
 
 from qiita_core.qiita_settings import qiita_config
 
 from qiita_db.logger import LogEntry
 from qiita_db.ontology import Ontology
-from qiita_db.util import convert_to_id
+from qiita_db.util import convert_to_id, compute_checksums
 
 
 class InvalidMetadataError(Exception):
@@ -44,6 +42,52 @@ def clean_whitespace(s):
     return ' '.join(s.split())
 
 
+def _xml_escape(data):
+    """Escapes data as minidom does when writing text and attribute values"""
+    if not isinstance(data, bytes):
+        data = data.encode('UTF-8')
+    return escape(data, {'"': '&quot;'})
+
+
+def _write_xml_element(fh, element, subelements=None):
+    """Writes an element and its subelements to fh
+
+    Parameters
+    ----------
+    fh : file
+        The file to write to
+    element : xml.etree.Element
+        The element to write. The tail of the element is not written.
+    subelements : iterable of xml.etree.Element, optional
+        Defaults to None. If given, these elements are written after the
+        subelements of `element`, as they are consumed, as if they were
+        subelements of `element` too
+
+    Notes
+    -----
+    The element is written as ``minidom`` would write it, with the attributes
+    sorted and without whitespace between the elements, without building a
+    DOM or a string of the whole element.
+    """
+    fh.write('<%s' % element.tag)
+    for name, value in sorted(element.items()):
+        fh.write(' %s="%s"' % (name, _xml_escape(value)))
+
+    if not element.text and not len(element) and subelements is None:
+        fh.write('/>')
+        return
+
+    fh.write('>')
+    if element.text:
+        fh.write(_xml_escape(element.text))
+    for child in element:
+        _write_xml_element(fh, child)
+    if subelements is not None:
+        for child in subelements:
+            _write_xml_element(fh, child)
+    fh.write('</%s>' % element.tag)
+
+
 def iter_file_via_list_of_dicts(input_file):
     """Iterates over a TSV file, yielding dicts keyed by the column headers
 
@@ -219,6 +263,13 @@ class EBISubmission(object):
             value = ET.SubElement(attribute_element, 'VALUE')
             value.text = clean_whitespace(val)
 
+    def _generate_set_element(self, tag, schema):
+        """The root element of an XML file, validated by SRA.<schema>.xsd"""
+        return ET.Element(tag, {
+            'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
+            'xsi:noNamespaceSchemaLocation': "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
+                                             "/sra_1_3/SRA.%s.xsd" % schema})
+
     def _get_pmid_element(self, study_links, pmid):
         study_link = ET.SubElement(study_links, 'STUDY_LINK')
         xref_link = ET.SubElement(study_link,  'XREF_LINK')
@@ -237,10 +288,7 @@ class EBISubmission(object):
         xml.etree.Element
             The root elelement of the generated ``ElementTree``
         """
-        study_set = ET.Element('STUDY_SET', {
-            'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
-            'xsi:noNamespaceSchemaLocation': "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
-                                             "/sra_1_3/SRA.study.xsd"})
+        study_set = self._generate_set_element('STUDY_SET', 'study')
 
         study = ET.SubElement(study_set, 'STUDY', {
             'alias': self._get_study_alias(),
@@ -331,13 +379,14 @@ class EBISubmission(object):
         xml.etree.Element
             The root elelement of the generated ``ElementTree``
         """
-        sample_set = ET.Element('SAMPLE_SET', {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
-                                             "/sra_1_3/SRA.sample.xsd"})
+        sample_set = self._generate_set_element('SAMPLE_SET', 'sample')
+        sample_set.extend(self._iter_sample_elements())
+        return sample_set
 
+    def _iter_sample_elements(self):
+        """Yields the SAMPLE element of each sample, sorted by sample name"""
         for sample_name, sample_info in sorted(viewitems(self.samples)):
-            sample = ET.SubElement(sample_set, 'SAMPLE', {
+            sample = ET.Element('SAMPLE', {
                 'alias': self._get_sample_alias(sample_name),
                 'center_name': qiita_config.ebi_center_name}
             )
@@ -359,7 +408,7 @@ class EBISubmission(object):
                                                   'SAMPLE_ATTRIBUTE',
                                                   sample_info['attributes'])
 
-        return sample_set
+            yield sample
 
     def add_sample_prep(self, sample_name, platform, file_type, file_path,
                         experiment_design_description,
@@ -478,18 +527,22 @@ class EBISubmission(object):
         xml.etree.Element
             The root elelement of the generated ``ElementTree``
         """
+        experiment_set = self._generate_set_element('EXPERIMENT_SET',
+                                                    'experiment')
+        experiment_set.extend(self._iter_experiment_elements())
+        return experiment_set
+
+    def _iter_experiment_elements(self):
+        """Yields the EXPERIMENT element of each sample, sorted by sample
+        name"""
         study_alias = self._get_study_alias()
-        experiment_set = ET.Element('EXPERIMENT_SET', {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
-                                             "/sra_1_3/SRA.experiment.xsd"})
         for sample_name, sample_info in sorted(self.samples.items()):
             sample_alias = self._get_sample_alias(sample_name)
 
             experiment_alias = self._get_experiment_alias(sample_name)
 
             platform = sample_info['prep']['platform']
-            experiment = ET.SubElement(experiment_set, 'EXPERIMENT', {
+            experiment = ET.Element('EXPERIMENT', {
                 'alias': experiment_alias,
                 'center_name': qiita_config.ebi_center_name}
             )
@@ -529,7 +582,7 @@ class EBISubmission(object):
                                                   'EXPERIMENT_ATTRIBUTE',
                                                   sample_info['prep'])
 
-        return experiment_set
+            yield experiment
 
     def generate_run_xml(self):
         """Generates the run XML file
@@ -539,21 +592,26 @@ class EBISubmission(object):
         xml.etree.Element
             The root elelement of the generated ``ElementTree``
         """
-        run_set = ET.Element('RUN_SET', {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
-                                             "/sra_1_3/SRA.run.xsd"})
-        for sample_name, sample_info in sorted(viewitems(self.samples)):
+        run_set = self._generate_set_element('RUN_SET', 'run')
+        run_set.extend(self._iter_run_elements())
+        return run_set
+
+    def _iter_run_elements(self):
+        """Yields the RUN element of each sample, sorted by sample name"""
+        samples = sorted(viewitems(self.samples))
+        checksums = compute_checksums(
+            [sample_info['prep']['file_path'] for _, sample_info in samples],
+            ('md5',))
+
+        for (sample_name, sample_info), checksum in zip(samples, checksums):
 
             experiment_alias = self._get_experiment_alias(sample_name)
 
             file_type = sample_info['prep']['file_type']
             file_path = sample_info['prep']['file_path']
+            md5 = checksum['md5']
 
-            with open(file_path) as fp:
-                md5 = safe_md5(fp).hexdigest()
-
-            run = ET.SubElement(run_set, 'RUN', {
+            run = ET.Element('RUN', {
                 'alias': self._get_run_alias(basename(file_path)),
                 'center_name': qiita_config.ebi_center_name}
             )
@@ -570,7 +628,7 @@ class EBISubmission(object):
                 'checksum': md5}
             )
 
-        return run_set
+            yield run
 
     def generate_submission_xml(self, action):
         """Generates the submission XML file
@@ -599,10 +657,8 @@ class EBISubmission(object):
                              "XML files before attempting to write the "
                              "submission XML file.")
 
-        submission_set = ET.Element('SUBMISSION_SET', {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "ftp://ftp.sra.ebi.ac.uk/meta/xsd"
-                                             "/sra_1_3/SRA.submission.xsd"})
+        submission_set = self._generate_set_element('SUBMISSION_SET',
+                                                    'submission')
         submission = ET.SubElement(submission_set, 'SUBMISSION', {
             'alias': self._get_submission_alias(),
             'center_name': qiita_config.ebi_center_name}
@@ -642,7 +698,7 @@ class EBISubmission(object):
         return submission_set
 
     def _write_xml_file(self, xml_gen_fn, attribute_name, fp,
-                        xml_gen_fn_arg=None):
+                        xml_gen_fn_arg=None, iter_elements_fn=None):
         """Writes an XML file after calling one of the XML generation
         functions
 
@@ -655,24 +711,35 @@ class EBISubmission(object):
             The name of the attribute in which to store the output filepath
         fp : str
             The filepath to which the XML will be written
-        xml_gen_fn_arg : str, optional
+        xml_gen_fn_arg : str or tuple, optional
             Defaults to None. If None, no arguments will be passed to
-            xml_gen_fn. Otherwise, this will be passed as the only argument to
-            xml_gen_fn
+            xml_gen_fn. If a tuple, its items will be passed as the arguments
+            to xml_gen_fn. Otherwise, this will be passed as the only argument
+            to xml_gen_fn
+        iter_elements_fn : function, optional
+            Defaults to None. If given, it is called to yield more subelements
+            of the root element, which are written one at a time as they are
+            yielded
 
         Notes
         -----
         xml_gen_fn_arg is needed for generating the submission XML
+
+        The file is written as the elements are generated, so only one of the
+        elements yielded by `iter_elements_fn` is held in memory at a time.
         """
         if xml_gen_fn_arg is None:
             xml_element = xml_gen_fn()
+        elif isinstance(xml_gen_fn_arg, tuple):
+            xml_element = xml_gen_fn(*xml_gen_fn_arg)
         else:
             xml_element = xml_gen_fn(xml_gen_fn_arg)
 
-        xml = minidom.parseString(ET.tostring(xml_element))
-
         with open(fp, 'w') as outfile:
-            outfile.write(xml.toxml(encoding='UTF-8'))
+            outfile.write('<?xml version="1.0" encoding="UTF-8"?>')
+            _write_xml_element(outfile, xml_element,
+                               None if iter_elements_fn is None
+                               else iter_elements_fn())
 
         setattr(self, attribute_name, fp)
 
@@ -702,7 +769,9 @@ class EBISubmission(object):
         -----
         If `fp` points to an existing file, it will be overwritten
         """
-        self._write_xml_file(self.generate_sample_xml, 'sample_xml_fp', fp)
+        self._write_xml_file(self._generate_set_element, 'sample_xml_fp', fp,
+                             ('SAMPLE_SET', 'sample'),
+                             self._iter_sample_elements)
 
     def write_experiment_xml(self, fp):
         """Write the experiment XML file using the current data
@@ -716,8 +785,9 @@ class EBISubmission(object):
         -----
         If `fp` points to an existing file, it will be overwritten
         """
-        self._write_xml_file(self.generate_experiment_xml,
-                             'experiment_xml_fp', fp)
+        self._write_xml_file(self._generate_set_element, 'experiment_xml_fp',
+                             fp, ('EXPERIMENT_SET', 'experiment'),
+                             self._iter_experiment_elements)
 
     def write_run_xml(self, fp):
         """Write the run XML file using the current data
@@ -731,7 +801,8 @@ class EBISubmission(object):
         -----
         If `fp` points to an existing file, it will be overwritten
         """
-        self._write_xml_file(self.generate_run_xml, 'run_xml_fp', fp)
+        self._write_xml_file(self._generate_set_element, 'run_xml_fp', fp,
+                             ('RUN_SET', 'run'), self._iter_run_elements)
 
     def write_submission_xml(self, fp, action):
         """Write the submission XML file using the current data
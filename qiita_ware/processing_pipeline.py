@@ -331,13 +331,19 @@ def _get_preprocess_fasta_cmd(raw_data, prep_template, params):
     return (cmd, output_dir)
 
 
-def generate_demux_file(sl_out, **kwargs):
+def generate_demux_file(sl_out, n_jobs=None, profile=None, **kwargs):
     """Creates the HDF5 demultiplexed file
 
     Parameters
     ----------
     sl_out : str
         Path to the output directory of split libraries
+    n_jobs : int, optional
+        The number of processes parsing the demultiplexed fastq file. Defaults
+        to the DEMUX_N_JOBS configuration value.
+    profile : str, optional
+        The storage profile of the demultiplexed file. Defaults to the
+        DEMUX_PROFILE configuration value.
     kwargs: ignored
         Necessary to include to support execution via moi.
 
@@ -349,6 +355,7 @@ def generate_demux_file(sl_out, **kwargs):
     """
     from os.path import join, exists
     from h5py import File
+    from qiita_core.qiita_settings import qiita_config
     from qiita_ware.demux import to_hdf5
 
     fastq_fp = join(sl_out, 'seqs.fastq')
@@ -356,9 +363,16 @@ def generate_demux_file(sl_out, **kwargs):
         raise ValueError("The split libraries output directory does not "
                          "contain the demultiplexed fastq file.")
 
+    if n_jobs is None:
+        n_jobs = qiita_config.demux_n_jobs
+    if profile is None:
+        profile = qiita_config.demux_profile
+
     demux_fp = join(sl_out, 'seqs.demux')
     with File(demux_fp, "w") as f:
-        to_hdf5(fastq_fp, f)
+        to_hdf5(fastq_fp, f, single_pass=True, n_jobs=n_jobs,
+                profile=profile,
+                summary_fp=join(sl_out, 'demux_summary.json'))
 
     return demux_fp
 
@@ -394,11 +408,13 @@ def _insert_preprocessed_data(study, params, prep_template, slq_out,
     #   1) seqs.fna -> demultiplexed fasta file
     #   2) seqs.fastq -> demultiplexed fastq file
     #   3) seqs.demux -> demultiplexed HDF5 file
+    #   4) demux_summary.json -> summary of the demultiplexed HDF5 file
 
     path_builder = partial(join, slq_out)
     fasta_fp = path_builder('seqs.fna')
     fastq_fp = path_builder('seqs.fastq')
     demux_fp = path_builder('seqs.demux')
+    summary_fp = path_builder('demux_summary.json')
     log_fp = path_builder('split_library_log.txt')
 
     # Check that all the files exist
@@ -413,6 +429,9 @@ def _insert_preprocessed_data(study, params, prep_template, slq_out,
     if exists(fastq_fp):
         filepaths.append((fastq_fp, "preprocessed_fastq"))
 
+    if exists(summary_fp):
+        filepaths.append((summary_fp, "preprocessed_demux_summary"))
+
     PreprocessedData.create(study, params._table, params.id, filepaths,
                             prep_template)
 
@@ -9,7 +9,9 @@ from qiita_core.util import qiita_test_checker
 from qiita_db.analysis import Analysis
 from qiita_db.job import Job
 from qiita_db.util import get_db_files_base_dir
-from qiita_ware.analysis_pipeline import RunAnalysis
+from qiita_ware.analysis_pipeline import (RunAnalysis, job_cache_stats,
+                                          _in_flight, _wait_for_job)
+from qiita_ware.exceptions import ComputeError
 
 
 # -----------------------------------------------------------------------------
@@ -68,5 +70,111 @@ class TestRun(TestCase):
             'opt1': 5}
         self.assertEqual(job.options, expopts)
 
+    def test_construct_job_graphs_reuse_results(self):
+        # job 2 is completed, so it is not run again
+        self.conn_handler.execute(
+            "UPDATE qiita.job SET cpu_time = 2.5 WHERE job_id = 2")
+
+        before = job_cache_stats()
+        app = RunAnalysis()
+        app._construct_job_graph(Analysis(1), [])
+        self.assertItemsEqual(app._job_graph.nodes(),
+                              ['1_ANALYSISFILES', '1_JOB_1',
+                               'FINISH_ANALYSIS_1'])
+        self.assertTrue(app._job_graph.has_edge('1_ANALYSISFILES',
+                                                'FINISH_ANALYSIS_1'))
+        # job 2 already belonged to analysis 1, so nothing is saved
+        self.assertEqual(job_cache_stats(), before)
+
+    def test_construct_job_graphs_reuse_results_other_analysis(self):
+        # job 2 of analysis 1 is identical to the job requested by analysis 2
+        fingerprint = Job._job_info('18S', 'Summarize Taxa', {}, 2,
+                                    self.conn_handler)[3]
+        self.conn_handler.execute(
+            "UPDATE qiita.job SET cpu_time = 2.5, fingerprint = %s "
+            "WHERE job_id = 2", [fingerprint])
+
+        before = job_cache_stats()
+        app = RunAnalysis()
+        app._construct_job_graph(Analysis(2), [('18S', 'Summarize Taxa')])
+        self.assertItemsEqual(Analysis(2).jobs, [2, 3])
+        self.assertItemsEqual(app._job_graph.nodes(),
+                              ['2_ANALYSISFILES', '2_JOB_3',
+                               'FINISH_ANALYSIS_2'])
+        after = job_cache_stats()
+        self.assertEqual(after['hits'], before['hits'] + 1)
+        self.assertAlmostEqual(after['cpu_saved'], before['cpu_saved'] + 2.5)
+
+    def test_in_flight(self):
+        job = Job(1)
+        # job 1 is queued and only attached to analysis 1
+        self.assertFalse(_in_flight(job, Analysis(1)))
+        self.conn_handler.execute(
+            "INSERT INTO qiita.analysis_job (analysis_id, job_id) "
+            "VALUES (2, 1)")
+        # analysis 1 is in construction, so it is not going to run it
+        self.assertFalse(_in_flight(job, Analysis(2)))
+        self.conn_handler.execute(
+            "UPDATE qiita.analysis SET analysis_status_id = 3 "
+            "WHERE analysis_id = 1")
+        self.assertTrue(_in_flight(job, Analysis(2)))
+        self.assertFalse(_in_flight(job, Analysis(1)))
+        job.status = 'running'
+        self.assertTrue(_in_flight(job, Analysis(1)))
+        # completed jobs are reused, not waited on
+        self.assertFalse(_in_flight(Job(2), Analysis(2)))
+
+    def test_wait_for_job(self):
+        # returns once the job is not queued nor running
+        _wait_for_job(2, Analysis(2))
+        job = Job(3)
+        job.status = 'error'
+        _wait_for_job(3, Analysis(1), poll_interval=0)
+
+    def test_wait_for_job_timeout(self):
+        Job(1).status = 'running'
+        analysis = Analysis(2)
+        with self.assertRaises(ComputeError):
+            _wait_for_job(1, analysis, poll_interval=0, timeout=0)
+        self.assertEqual(analysis.status, 'error')
+
+    def test_wait_for_job_stale(self):
+        # job 1 is queued, but analysis 1 is in construction so it is never
+        # going to run it
+        analysis = Analysis(2)
+        with self.assertRaises(ComputeError):
+            _wait_for_job(1, analysis, poll_interval=0)
+        self.assertEqual(analysis.status, 'error')
+
+    def test_construct_job_graphs_shared_running_job(self):
+        # analyses 1 and 2 share job 1, which analysis 1 is running
+        self.conn_handler.execute(
+            "INSERT INTO qiita.analysis_job (analysis_id, job_id) "
+            "VALUES (2, 1)")
+        self.conn_handler.execute(
+            "UPDATE qiita.analysis SET analysis_status_id = 3 "
+            "WHERE analysis_id = 1")
+        Job(1).status = 'running'
+
+        analysis = Analysis(2)
+        app = RunAnalysis()
+        app._construct_job_graph(analysis, [])
+        self.assertItemsEqual(app._job_graph.nodes(),
+                              ['2_ANALYSISFILES', '2_JOB_3', '2_WAIT_JOB_1',
+                               'FINISH_ANALYSIS_2'])
+        self.assertTrue(app._job_graph.has_edge('2_WAIT_JOB_1',
+                                                'FINISH_ANALYSIS_2'))
+        self.assertFalse(app._job_graph.has_edge('2_ANALYSISFILES',
+                                                 '2_WAIT_JOB_1'))
+        # only the job of this run is given the analysis files
+        self.assertEqual(
+            app._job_graph.node['2_ANALYSISFILES']['args'][3], [3])
+
+        # a failure doesn't touch the job analysis 1 is running
+        app._failure_callback(msg='Failed')
+        self.assertEqual(analysis.status, 'error')
+        self.assertEqual(Job(3).status, 'error')
+        self.assertEqual(Job(1).status, 'running')
+
 if __name__ == "__main__":
     main()
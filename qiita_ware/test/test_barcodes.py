@@ -0,0 +1,122 @@
+from __future__ import division
+
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+import tempfile
+from unittest import TestCase, main
+
+import h5py
+import numpy as np
+import numpy.testing as npt
+
+from qiita_ware.demux import to_hdf5
+from qiita_ware.barcodes import (barcode_stats, _barcode_blocks, _add_counts,
+                                 _error_histograms, _tally)
+
+
+class BarcodesTests(TestCase):
+    def setUp(self):
+        self.demux = h5py.File('demux', driver='core', backing_store=False)
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+            to_hdf5(f.name, self.demux)
+
+    def tearDown(self):
+        self.demux.close()
+
+    def test_barcode_blocks(self):
+        obs = list(_barcode_blocks(self.demux, samples=['a', 'b', 'x']))
+        self.assertEqual([o[0] for o in obs], ['a', 'b'])
+        npt.assert_equal(obs[0][1], np.array(['AAA', 'AAT', 'AAA']))
+        npt.assert_equal(obs[0][2], np.array(['AAA', 'AAA', 'AAA']))
+        npt.assert_equal(obs[0][3], np.array([0, 1, 0]))
+
+        # the blocks are rounded up to the chunks, which hold whole samples
+        obs = list(_barcode_blocks(self.demux, block_size=1))
+        self.assertEqual(len(obs), 3)
+
+    def test_add_counts(self):
+        counts = _add_counts(None, np.array([1, 2]))
+        npt.assert_equal(counts, np.array([1, 2]))
+        counts = _add_counts(counts, np.array([1, 0, 3]))
+        npt.assert_equal(counts, np.array([2, 2, 3]))
+        counts = _add_counts(counts, np.array([1]))
+        npt.assert_equal(counts, np.array([3, 2, 3]))
+
+    def test_error_histograms(self):
+        uniq, hist = _error_histograms(np.array(['CC', 'AA', 'CC', 'AA']),
+                                       np.array([2, 0, 0, 0]))
+        npt.assert_equal(uniq, np.array(['AA', 'CC']))
+        npt.assert_equal(hist, np.array([[2, 0, 0], [1, 0, 1]]))
+
+    def test_tally(self):
+        tally = {}
+        _tally(tally, 'a', np.array(['AA', 'CC', 'AA']))
+        _tally(tally, 'b', np.array(['AA']))
+        _tally(tally, 'a', np.array(['CC']))
+        self.assertEqual(tally, {'AA': {'a': 2, 'b': 1}, 'CC': {'a': 2}})
+
+    def test_barcode_stats(self):
+        for block_size in (10000, 1):
+            obs = barcode_stats(self.demux, block_size=block_size)
+
+            self.assertEqual(sorted(obs.samples), ['a', 'b', 'c'])
+            npt.assert_equal(obs.samples['a'], np.array([2, 1]))
+            npt.assert_equal(obs.samples['b'], np.array([1, 0, 1]))
+            npt.assert_equal(obs.samples['c'], np.array([1, 1]))
+
+            self.assertEqual(sorted(obs.barcodes), ['AAA', 'CCC', 'GGG'])
+            npt.assert_equal(obs.barcodes['AAA'], np.array([2, 1]))
+            npt.assert_equal(obs.barcodes['CCC'], np.array([2, 0, 1]))
+            npt.assert_equal(obs.barcodes['GGG'], np.array([0, 1]))
+
+            self.assertEqual(obs.collisions, {'CCC': {'b': 2, 'c': 1}})
+            self.assertEqual(obs.ambiguous, {'AAT': {'a': 1, 'b': 1}})
+
+    def test_barcode_stats_samples(self):
+        obs = barcode_stats(self.demux, samples=['a', 'c'])
+        self.assertEqual(sorted(obs.samples), ['a', 'c'])
+        self.assertEqual(obs.collisions, {})
+        self.assertEqual(obs.ambiguous, {})
+
+
+fqdata = """@a_1 orig_bc=AAA new_bc=AAA bc_diffs=0
+xyz
++
+ABC
+@a_2 orig_bc=AAT new_bc=AAA bc_diffs=1
+xyz
++
+ABC
+@a_3 orig_bc=AAA new_bc=AAA bc_diffs=0
+xyz
++
+ABC
+@b_1 orig_bc=CCC new_bc=CCC bc_diffs=0
+xyz
++
+ABC
+@b_2 orig_bc=AAT new_bc=CCC bc_diffs=2
+xyz
++
+ABC
+@c_1 orig_bc=CCC new_bc=CCC bc_diffs=0
+xyz
++
+ABC
+@c_2 orig_bc=GGC new_bc=GGG bc_diffs=1
+xyz
++
+ABC
+"""
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -----------------------------------------------------------------------------
+# Copyright (c) 2014--, The Qiita Development Team.
+#
+# Distributed under the terms of the BSD 3-clause License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# -----------------------------------------------------------------------------
+
+from os import close, remove
+from os.path import join
+from shutil import rmtree
+from tempfile import mkstemp, mkdtemp
+from gzip import open as gzopen
+from unittest import TestCase, main
+
+import h5py
+
+from qiita_ware.demux import to_hdf5, to_ascii
+from qiita_ware.commands import _write_sample_fastqs
+
+
+class CommandsTests(TestCase):
+    def setUp(self):
+        fd, self.fastq_fp = mkstemp(suffix='.fastq')
+        close(fd)
+        with open(self.fastq_fp, 'w') as f:
+            f.write(FASTQ)
+
+        fd, self.demux_fp = mkstemp(suffix='.demux')
+        close(fd)
+        with h5py.File(self.demux_fp, 'w') as f:
+            to_hdf5(self.fastq_fp, f)
+
+        self.out_dir = mkdtemp()
+
+    def tearDown(self):
+        remove(self.fastq_fp)
+        remove(self.demux_fp)
+        rmtree(self.out_dir)
+
+    def test_write_sample_fastqs(self):
+        with h5py.File(self.demux_fp, 'r') as f:
+            exp = {sample: ''.join(to_ascii(f, samples=[sample]))
+                   for sample in ('a', 'b')}
+        exp['c'] = ''
+
+        for n_jobs in (1, 2, 4):
+            msgs = []
+            _write_sample_fastqs(self.demux_fp, ['a', 'b', 'c'], self.out_dir,
+                                 n_jobs, msgs.append)
+
+            for sample, exp_contents in exp.items():
+                with gzopen(join(self.out_dir, '%s.fastq.gz' % sample)) as f:
+                    self.assertEqual(f.read(), exp_contents)
+            self.assertEqual(msgs, ['Writing the FASTQ files: %d of 3 samples'
+                                    % i for i in (1, 2, 3)])
+
+    def test_write_sample_fastqs_no_status(self):
+        _write_sample_fastqs(self.demux_fp, ['b'], self.out_dir)
+        with gzopen(join(self.out_dir, 'b.fastq.gz')) as f:
+            self.assertEqual(f.read(), '@b_0 orig_bc=abx new_bc=xbc '
+                                       'bc_diffs=1\nxyz\n+\nABC\n')
+
+
+FASTQ = """@a_1 orig_bc=abc new_bc=abc bc_diffs=0
+xyz
++
+ABC
+@b_1 orig_bc=abx new_bc=xbc bc_diffs=1
+xyz
++
+ABC
+@a_2 orig_bc=abw new_bc=wbc bc_diffs=4
+abcd
++
+AAAA
+"""
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ from __future__ import division
 # -----------------------------------------------------------------------------
 
 import os
+import gzip
 import tempfile
 from unittest import TestCase, main
 
@@ -20,7 +21,17 @@ from qiita_ware.demux import (buffer1d, buffer2d, _has_qual,
                               _per_sample_lengths, _summarize_lengths,
                               _set_attr_stats, _construct_datasets, to_hdf5,
                               format_fasta_record, to_ascii, stat,
-                              to_per_sample_ascii)
+                              to_per_sample_ascii, _sample_writer,
+                              _read_blocks, _parse_block,
+                              _split_libraries_blocks, _fastq_shards,
+                              _parallel_split_libraries_blocks, fetch,
+                              _sample_indices, _read_rows, _row_blocks,
+                              format_block, write_ascii,
+                              _compact_sample_writer, _read_compact_rows,
+                              _dset_kwargs, dset_profiles, _count_errors,
+                              load_summary, _mapped, fetch_blocks,
+                              dset_paths)
+from qiita_ware.barcodes import barcode_stats
 
 
 class BufferTests(TestCase):
@@ -119,6 +130,126 @@ class BufferTests(TestCase):
         npt.assert_equal(self.dset_2d, exp2d)
 
 
+class SampleWriterTests(TestCase):
+    def setUp(self):
+        self.hdf5_file = h5py.File('test', driver='core', backing_store=False)
+
+    def tearDown(self):
+        self.hdf5_file.close()
+
+    def test_write(self):
+        writer = _sample_writer(self.hdf5_file.create_group('a'), max_fill=3)
+        writer.write_block(np.array(['xy']), np.array([[1, 2]]),
+                           np.array(['abc']), np.array(['abc']), np.array([0]))
+        self.assertFalse('a/sequence' in self.hdf5_file)
+        writer.write_block(np.array(['x']), np.array([[3]]),
+                           np.array(['aby']), np.array(['ybc']), np.array([1]))
+        writer.flush()
+        npt.assert_equal(self.hdf5_file['a/sequence'][:],
+                         np.array(['xy', 'x']))
+        self.assertEqual(self.hdf5_file['a/sequence'].dtype, '|S2')
+
+        # a longer sequence widens the datasets
+        writer.write_block(np.array(['xyz']), np.array([[4, 5, 6]]),
+                           np.array(['abz']), np.array(['zbc']), np.array([2]))
+        writer.flush()
+        self.assertEqual(self.hdf5_file['a/sequence'].dtype, '|S3')
+        npt.assert_equal(self.hdf5_file['a/sequence'][:],
+                         np.array(['xy', 'x', 'xyz']))
+        npt.assert_equal(self.hdf5_file['a/qual'][:],
+                         np.array([[1, 2, 0], [3, 0, 0], [4, 5, 6]]))
+        npt.assert_equal(self.hdf5_file['a/barcode/original'][:],
+                         np.array(['abc', 'aby', 'abz']))
+        npt.assert_equal(self.hdf5_file['a/barcode/corrected'][:],
+                         np.array(['abc', 'ybc', 'zbc']))
+        npt.assert_equal(self.hdf5_file['a/barcode/error'][:],
+                         np.array([0, 1, 2]))
+        npt.assert_equal(np.concatenate(writer.lengths), np.array([2, 1, 3]))
+
+    def test_write_no_qual(self):
+        writer = _sample_writer(self.hdf5_file.create_group('a'))
+        writer.write_block(np.array(['xy', 'x']), None,
+                           np.array(['abc', 'aby']), np.array(['abc', 'ybc']),
+                           np.array([0, 1]))
+        writer.flush()
+        npt.assert_equal(self.hdf5_file['a/qual'][:],
+                         np.array([[0, 0], [0, 0]]))
+
+    def test_write_whole_chunks(self):
+        writer = _sample_writer(self.hdf5_file.create_group('a'),
+                                max_fill=1000, profile='sampling')
+        seqs = np.array(['xy', 'x', 'xyz'] * 500)
+        quals = np.tile(np.array([[1, 2, 0], [3, 0, 0], [4, 5, 6]]), (500, 1))
+        writer.write_block(seqs, quals, np.array(['abc'] * 1500),
+                           np.array(['abc'] * 1500), np.zeros(1500, int))
+        # the records past the first chunk are held
+        self.assertEqual(self.hdf5_file['a/sequence'].shape, (1000,))
+        self.assertEqual(self.hdf5_file['a/qual'].chunks, (1000, 3))
+        writer.flush()
+        npt.assert_equal(self.hdf5_file['a/sequence'][:], seqs)
+        npt.assert_equal(self.hdf5_file['a/qual'][:], quals)
+
+    def test_write_small_sample_chunks(self):
+        writer = _sample_writer(self.hdf5_file.create_group('a'),
+                                profile='export')
+        writer.write_block(np.array(['xy', 'x', 'xyz']),
+                           np.array([[1, 2, 0], [3, 0, 0], [4, 5, 6]]),
+                           np.array(['abc'] * 3), np.array(['abc'] * 3),
+                           np.zeros(3, int))
+        writer.flush()
+        # the chunks fit the sample instead of holding 10000 rows
+        self.assertEqual(self.hdf5_file['a/sequence'].chunks, (3,))
+        self.assertEqual(self.hdf5_file['a/qual'].chunks, (3, 3))
+        self.assertEqual(self.hdf5_file['a/barcode/error'].chunks, (3,))
+
+        writer = _compact_sample_writer(self.hdf5_file.create_group('b'),
+                                        profile='export')
+        writer.write_block(np.array(['xy', 'x', 'xyz']),
+                           np.array([[1, 2, 0], [3, 0, 0], [4, 5, 6]]),
+                           np.array(['abc'] * 3), np.array(['abc'] * 3),
+                           np.zeros(3, int))
+        writer.flush()
+        self.assertEqual(self.hdf5_file['b/sequence'].chunks, (6,))
+        self.assertEqual(self.hdf5_file['b/qual'].chunks, (6,))
+        self.assertEqual(self.hdf5_file['b/offsets'].chunks, (4,))
+        self.assertEqual(self.hdf5_file['b/barcode/error'].chunks, (3,))
+
+    def test_write_compact(self):
+        writer = _compact_sample_writer(self.hdf5_file.create_group('a'),
+                                        max_fill=3)
+        writer.write_block(np.array(['xy']), np.array([[1, 2]]),
+                           np.array(['abc']), np.array(['abc']), np.array([0]))
+        writer.write_block(np.array(['x']), np.array([[3]]),
+                           np.array(['aby']), np.array(['ybc']), np.array([1]))
+        writer.flush()
+        writer.write_block(np.array(['xyz', 'xy']),
+                           np.array([[4, 5, 6], [7, 8, 0]]),
+                           np.array(['abz', 'abw']), np.array(['zbc', 'wbc']),
+                           np.array([2, 3]))
+        writer.flush()
+        self.assertEqual(self.hdf5_file['a/sequence'][:].tostring(),
+                         'xyxxyzxy')
+        npt.assert_equal(self.hdf5_file['a/qual'][:],
+                         np.array([1, 2, 3, 4, 5, 6, 7, 8]))
+        npt.assert_equal(self.hdf5_file['a/offsets'][:],
+                         np.array([0, 2, 3, 6, 8]))
+        npt.assert_equal(self.hdf5_file['a/barcode/original'][:],
+                         np.array(['abc', 'aby', 'abz', 'abw']))
+        npt.assert_equal(self.hdf5_file['a/barcode/error'][:],
+                         np.array([0, 1, 2, 3]))
+        npt.assert_equal(np.concatenate(writer.lengths),
+                         np.array([2, 1, 3, 2]))
+
+    def test_write_compact_no_qual(self):
+        writer = _compact_sample_writer(self.hdf5_file.create_group('a'))
+        writer.write_block(np.array(['xy', 'x']), None,
+                           np.array(['abc', 'aby']), np.array(['abc', 'ybc']),
+                           np.array([0, 1]))
+        writer.flush()
+        self.assertEqual(self.hdf5_file['a/qual'].shape, (0,))
+        npt.assert_equal(self.hdf5_file['a/offsets'][:], np.array([0, 2, 3]))
+
+
 class DemuxTests(TestCase):
     def setUp(self):
         self.hdf5_file = h5py.File('test', driver='core', backing_store=False)
@@ -199,6 +330,99 @@ class DemuxTests(TestCase):
         npt.assert_equal(obs.hist, exp.hist)
         npt.assert_almost_equal(obs.hist_edge, exp.hist_edge)
 
+    def test_read_blocks(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+
+            obs = list(_read_blocks(f.name, block_size=2))
+
+        exp = [(['a_1 orig_bc=abc new_bc=abc bc_diffs=0',
+                 'b_1 orig_bc=abw new_bc=wbc bc_diffs=4'],
+                ['xyz', 'qwe'], ['ABC', 'DFG']),
+               (['b_2 orig_bc=abw new_bc=wbc bc_diffs=4'], ['qwe'], ['DEF'])]
+        self.assertEqual(obs, exp)
+
+        with tempfile.NamedTemporaryFile('r+', suffix='.fna') as f:
+            f.write(seqdata)
+            f.flush()
+
+            obs = list(_read_blocks(f.name, block_size=4))
+
+        self.assertEqual(len(obs), 2)
+        self.assertEqual(obs[1], (['b_2 orig_bc=abw new_bc=wbc bc_diffs=4'],
+                                  ['abcd'], None))
+
+    def test_read_blocks_trailing_blank_line(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+            exp = list(_read_blocks(f.name, block_size=2))
+
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata + '\n')
+            f.flush()
+
+            self.assertEqual(list(_read_blocks(f.name, block_size=2)), exp)
+            # the blank line is alone in the last block
+            obs = list(_read_blocks(f.name, block_size=3))
+            self.assertEqual(len(obs), 1)
+
+            for kwargs in ({}, {'single_pass': True}, {'n_jobs': 2}):
+                h5file = h5py.File('obs', driver='core', backing_store=False)
+                to_hdf5(f.name, h5file, **kwargs)
+                self.assertEqual(sorted(h5file.keys()), ['a', 'b'])
+                self.assertEqual(h5file['b'].attrs['n'], 2)
+                h5file.close()
+
+    def test_read_blocks_truncated(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata + '@c_1 orig_bc=abw new_bc=wbc bc_diffs=4\n')
+            f.flush()
+
+            with self.assertRaises(ValueError):
+                list(_read_blocks(f.name))
+
+    def test_parse_block(self):
+        ids = ['a_x_1 orig_bc=abc new_bc=abc bc_diffs=0',
+               'b_1 orig_bc=abw new_bc=wbc bc_diffs=4']
+        obs = _parse_block('fp', ids, ['xyz', 'q'], ['ABC', 'D'])
+        exp = (np.array(['a_x', 'b']), np.array(['xyz', 'q']),
+               np.array([3, 1]), np.array([[32, 33, 34], [35, 0, 0]]),
+               np.array(['abc', 'abw']), np.array(['abc', 'wbc']),
+               np.array([0, 4]))
+        self.assertEqual(len(obs), len(exp))
+        for o, e in zip(obs, exp):
+            npt.assert_equal(o, e)
+
+        obs = _parse_block('fp', ids, ['xyz', 'q'], None)
+        self.assertEqual(obs[3], None)
+
+    def test_parse_block_errors(self):
+        with self.assertRaises(ValueError):
+            _parse_block('fp', ['a_1 orig_bc=abc new_bc=abc bc_diffs=0',
+                                'not split libraries'], ['x', 'y'], None)
+        with self.assertRaises(ValueError):
+            _parse_block('fp', ['a_1 orig_bc=abc new_bc=abc bc_diffs=0'],
+                         ['xy'], ['A'])
+        with self.assertRaises(ValueError):
+            _parse_block('fp', ['a_1 orig_bc=abc new_bc=abc bc_diffs=0'],
+                         ['x'], [' '])
+
+    def test_split_libraries_blocks(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fna') as f:
+            f.write(seqdata)
+            f.flush()
+
+            obs = list(_split_libraries_blocks(f.name, block_size=4))
+
+        # samples come sorted within a block, records in file order
+        self.assertEqual([(o[0], list(o[1])) for o in obs],
+                         [('a', ['x', 'xy', 'xyz']), ('b', ['xyz']),
+                          ('b', ['abcd'])])
+        self.assertEqual(obs[0][1].dtype, '|S3')
+        npt.assert_equal(obs[0][5], np.array([0, 2, 3]))
+
     def test_set_attr_stats(self):
         s = stat(min=1, max=4, mean=2.6, median=3.0, std=1.019803902718557,
                  hist=np.array([1, 0, 0, 1, 0, 0, 2, 0, 0, 1]), n=5,
@@ -274,6 +498,343 @@ class DemuxTests(TestCase):
         npt.assert_equal(self.hdf5_file['b/barcode/error'][:],
                          np.array([1, 4]))
 
+    def test_to_hdf5_single_pass(self):
+        for data, suffix in ((seqdata, '.fna'), (fqdata, '.fq')):
+            with tempfile.NamedTemporaryFile('r+', suffix=suffix) as f:
+                f.write(data)
+                f.flush()
+
+                exp = h5py.File('exp', driver='core', backing_store=False)
+                obs = h5py.File('obs', driver='core', backing_store=False)
+                to_hdf5(f.name, exp)
+                to_hdf5(f.name, obs, single_pass=True)
+
+            self._h5_equal(obs, exp)
+            exp.close()
+            obs.close()
+
+    def test_fastq_shards(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+
+            self.assertEqual(_fastq_shards(f.name, 1),
+                             [(0, 49), (49, 98), (98, 147)])
+            self.assertEqual(_fastq_shards(f.name, 2), [(0, 98), (98, 147)])
+            self.assertEqual(_fastq_shards(f.name, 3), [(0, 147)])
+            self.assertEqual(_fastq_shards(f.name, 4), [(0, 147)])
+
+    def test_parallel_split_libraries_blocks(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+
+            exp = list(_split_libraries_blocks(f.name, block_size=1))
+            obs = list(_parallel_split_libraries_blocks(
+                f.name, 2, block_size=1, shard_size=2))
+
+        self.assertEqual(len(obs), len(exp))
+        for o, e in zip(obs, exp):
+            self.assertEqual(o[0], e[0])
+            for o_arr, e_arr in zip(o[1:], e[1:]):
+                npt.assert_equal(o_arr, e_arr)
+
+    def test_to_hdf5_parallel(self):
+        # the files are identical to the ones written by a single process
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+
+            files = []
+            for kwargs in ({'single_pass': True}, {'n_jobs': 2}):
+                fd, h5_fp = tempfile.mkstemp(suffix='.demux')
+                os.close(fd)
+                self.to_remove.append(h5_fp)
+                with h5py.File(h5_fp, 'w') as h5file:
+                    to_hdf5(f.name, h5file, **kwargs)
+                with open(h5_fp, 'rb') as h5file:
+                    files.append(h5file.read())
+
+        self.assertEqual(files[0], files[1])
+
+    def _h5_equal(self, obs, exp):
+        self._attr_stat_equal(obs.attrs, stat(*[exp.attrs[a]
+                                                for a in stat._fields]))
+        self.assertEqual(obs.attrs['has-qual'], exp.attrs['has-qual'])
+        self.assertEqual(sorted(obs), sorted(exp))
+        for sample in exp:
+            self._attr_stat_equal(obs[sample].attrs,
+                                  stat(*[exp[sample].attrs[a]
+                                         for a in stat._fields]))
+            for path in ('sequence', 'qual', 'barcode/original',
+                         'barcode/corrected', 'barcode/error'):
+                path = os.path.join(sample, path)
+                self.assertEqual(obs[path].dtype, exp[path].dtype)
+                npt.assert_equal(obs[path][:], exp[path][:])
+
+    def test_to_hdf5_compact(self):
+        for data, suffix in ((seqdata, '.fna'), (fqdata_lengths, '.fq')):
+            with tempfile.NamedTemporaryFile('r+', suffix=suffix) as f:
+                f.write(data)
+                f.flush()
+
+                exp = h5py.File('exp', driver='core', backing_store=False)
+                obs = h5py.File('obs', driver='core', backing_store=False)
+                to_hdf5(f.name, exp)
+                to_hdf5(f.name, obs, compact=True)
+
+            self.assertEqual(exp.attrs['version'], 1)
+            self.assertEqual(obs.attrs['version'], 2)
+            self._attr_stat_equal(obs.attrs, stat(*[exp.attrs[a]
+                                                    for a in stat._fields]))
+
+            # the readers do not tell the layouts apart
+            self.assertEqual(list(to_ascii(obs)), list(to_ascii(exp)))
+            for o, e in zip(fetch(obs, block_size=1), fetch(exp)):
+                self.assertEqual(o[:3], e[:3])
+                npt.assert_equal(o[3], e[3])
+                self.assertEqual(o[4:], e[4:])
+            exp.close()
+            obs.close()
+
+    def test_to_hdf5_compact_size(self):
+        # one read out of 50 is five times longer than the rest, which pads
+        # the other reads of the version 1 layout
+        rand = np.random.RandomState(0)
+        nucl = np.array(list('ACGT'))
+        records = []
+        for i in range(1000):
+            n = 500 if i % 50 == 0 else 100
+            seq = ''.join(nucl[rand.randint(4, size=n)])
+            qual = ''.join(chr(q) for q in rand.randint(35, 74, size=n))
+            records.append('@a_%d orig_bc=abc new_bc=abc bc_diffs=0\n'
+                           '%s\n+\n%s\n' % (i, seq, qual))
+
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(''.join(records))
+            f.flush()
+            for profile in ('default', 'export', 'sampling', 'archive'):
+                sizes = []
+                for kwargs in ({'single_pass': True}, {'compact': True}):
+                    with tempfile.NamedTemporaryFile(suffix='.demux') as h5:
+                        with h5py.File(h5.name, 'w') as demux:
+                            to_hdf5(f.name, demux, profile=profile,
+                                    **kwargs)
+                        sizes.append(os.path.getsize(h5.name))
+                padded, compact = sizes
+                self.assertLess(compact, 0.95 * padded)
+
+    def test_read_compact_rows(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata_lengths)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file, compact=True)
+
+        grp = self.hdf5_file['a']
+        seqs, quals = _read_compact_rows(grp, np.array([0, 2]))
+        npt.assert_equal(seqs, np.array(['xyz', 'x']))
+        npt.assert_equal(quals, np.array([[32, 33, 34], [35, 0, 0]]))
+
+        seqs, quals = _read_compact_rows(grp, np.array([1]), has_qual=False)
+        npt.assert_equal(seqs, np.array(['xy']))
+        self.assertIsNone(quals)
+
+    def test_fetch_k_compact(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata_lengths)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file, compact=True)
+
+        full = list(fetch(self.hdf5_file))
+        np.random.seed(0)
+        obs = list(fetch(self.hdf5_file, k=2))
+        self.assertEqual(len(obs), 2)
+        for rec in obs:
+            exp = [r for r in full if r[:2] == rec[:2]][0]
+            self.assertEqual(rec[2], exp[2])
+            npt.assert_equal(rec[3], exp[3])
+            self.assertEqual(rec[4:], exp[4:])
+
+    def test_dset_kwargs(self):
+        self.assertEqual(_dset_kwargs('qual', (10, 5)),
+                         {'chunks': True, 'compression': True,
+                          'compression_opts': 1, 'track_times': False})
+        self.assertEqual(_dset_kwargs('qual', (20000, 5), 'sampling'),
+                         {'chunks': (1000, 5), 'compression': 'lzf',
+                          'shuffle': True, 'track_times': False})
+        # the chunks of fixed size datasets fit in them
+        self.assertEqual(_dset_kwargs('sequence', (10,), 'export')['chunks'],
+                         (10,))
+        self.assertEqual(_dset_kwargs('sequence', (0,), 'export',
+                                      resizable=True)['chunks'], (10000,))
+
+        with self.assertRaises(ValueError):
+            _dset_kwargs('qual', (10, 5), 'foo')
+
+    def test_to_hdf5_profiles(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata_lengths)
+            f.flush()
+
+            exp = h5py.File('exp', driver='core', backing_store=False)
+            to_hdf5(f.name, exp)
+            for profile in dset_profiles:
+                for kwargs in ({}, {'single_pass': True}, {'compact': True}):
+                    if profile == 'hot' and kwargs.get('compact'):
+                        continue
+                    obs = h5py.File('obs', driver='core', backing_store=False)
+                    to_hdf5(f.name, obs, profile=profile, **kwargs)
+                    self.assertEqual(list(to_ascii(obs)),
+                                     list(to_ascii(exp)))
+                    exp_compression = 'gzip'
+                    if profile in ('export', 'sampling'):
+                        exp_compression = 'lzf'
+                    elif profile == 'hot':
+                        exp_compression = None
+                    self.assertEqual(obs['a/qual'].compression,
+                                     exp_compression)
+                    obs.close()
+
+            with self.assertRaises(ValueError):
+                to_hdf5(f.name, self.hdf5_file, profile='foo')
+            exp.close()
+
+    def test_to_hdf5_hot(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata_lengths)
+            f.flush()
+
+            exp = h5py.File('exp', driver='core', backing_store=False)
+            to_hdf5(f.name, exp)
+            for kwargs in ({}, {'single_pass': True}, {'n_jobs': 2}):
+                obs = h5py.File('obs', driver='core', backing_store=False)
+                to_hdf5(f.name, obs, profile='hot', **kwargs)
+                self._h5_equal(obs, exp)
+                for key in ('sequence', 'qual', 'barcode_error'):
+                    dset = obs['a'][dset_paths[key]]
+                    self.assertIsNone(dset.chunks)
+                    self.assertIsNone(dset.compression)
+                obs.close()
+            exp.close()
+
+            with self.assertRaises(ValueError):
+                to_hdf5(f.name, self.hdf5_file, profile='hot', compact=True)
+
+    def test_mapped(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+
+            fd, demux_fp = tempfile.mkstemp(suffix='.demux')
+            os.close(fd)
+            self.to_remove.append(demux_fp)
+            for profile, exp_mapped in (('default', False), ('hot', True)):
+                with h5py.File(demux_fp, 'w') as demux:
+                    to_hdf5(f.name, demux, profile=profile)
+                    # files being written are never mapped
+                    self.assertIsNone(_mapped(demux['a/sequence']))
+
+                with h5py.File(demux_fp, 'r') as demux:
+                    for path in ('a/sequence', 'a/qual', 'b/barcode/error'):
+                        obs = _mapped(demux[path])
+                        if exp_mapped:
+                            self.assertIsInstance(obs, np.memmap)
+                            npt.assert_equal(obs, demux[path][:])
+                        else:
+                            self.assertIsNone(obs)
+
+            # nor are in-memory files
+            to_hdf5(f.name, self.hdf5_file, profile='hot')
+            self.assertIsNone(_mapped(self.hdf5_file['a/sequence']))
+
+    def test_fetch_mmap(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata_lengths)
+            f.flush()
+
+            fd, demux_fp = tempfile.mkstemp(suffix='.demux')
+            os.close(fd)
+            self.to_remove.append(demux_fp)
+            with h5py.File(demux_fp, 'w') as demux:
+                to_hdf5(f.name, demux, profile='hot')
+
+        with h5py.File(demux_fp, 'r') as demux:
+            exp = list(fetch(demux))
+            obs = list(fetch(demux, mmap=True))
+            self.assertEqual(len(obs), len(exp))
+            for o, e in zip(obs, exp):
+                self.assertEqual(o[:3], e[:3])
+                npt.assert_equal(o[3], e[3])
+                self.assertEqual(o[4:], e[4:])
+
+            blocks = list(fetch_blocks(demux, mmap=True))
+            self.assertIsInstance(blocks[0][2], np.memmap)
+            exp_seqs = demux['a/sequence'][:]
+
+            np.random.seed(0)
+            exp = list(fetch(demux, k=2))
+            np.random.seed(0)
+            obs = list(fetch(demux, k=2, mmap=True))
+            self.assertEqual([o[:3] for o in obs], [e[:3] for e in exp])
+
+            self.assertEqual(list(to_ascii(demux, mmap=True)),
+                             list(to_ascii(demux)))
+
+        # the blocks stay valid after the file is closed
+        npt.assert_equal(blocks[0][2], exp_seqs)
+
+    def test_count_errors(self):
+        counts = _count_errors(None, np.array([0, 2, 0]))
+        npt.assert_equal(counts, np.array([2, 0, 1]))
+        counts = _count_errors(counts, np.array([1]))
+        npt.assert_equal(counts, np.array([2, 1, 1]))
+        counts = _count_errors(counts, np.array([4, 0]))
+        npt.assert_equal(counts, np.array([3, 1, 1, 0, 1]))
+
+    def test_to_hdf5_summary(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fna') as f:
+            f.write(seqdata)
+            f.flush()
+
+            for kwargs in ({}, {'single_pass': True}):
+                fd, summary_fp = tempfile.mkstemp(suffix='.json')
+                os.close(fd)
+                self.to_remove.append(summary_fp)
+
+                h5file = h5py.File('obs', driver='core', backing_store=False)
+                to_hdf5(f.name, h5file, summary_fp=summary_fp, **kwargs)
+                exp_barcodes = barcode_stats(h5file)
+                h5file.close()
+
+                obs = load_summary(summary_fp)
+                self.assertEqual(obs['n'], 5)
+                self.assertFalse(obs['has-qual'])
+                self.assertEqual(obs['barcode_errors'], [1, 1, 1, 1, 1])
+                self.assertEqual(obs['length'],
+                                 {'min': 1, 'q25': 2, 'median': 3, 'q75': 3,
+                                  'max': 4, 'mean': 2.6})
+                self.assertEqual(sorted(obs['samples']), ['a', 'b'])
+                self.assertEqual(obs['samples']['a']['n'], 3)
+                self.assertEqual(obs['samples']['a']['barcode_errors'],
+                                 [1, 0, 1, 1])
+                self.assertEqual(obs['samples']['b']['barcode_errors'],
+                                 [0, 1, 0, 0, 1])
+                self.assertEqual(obs['samples']['b']['length']['median'],
+                                 3.5)
+
+                # the barcode statistics are collected while writing
+                self.assertEqual(
+                    obs['barcodes']['barcodes'],
+                    {bc: counts.tolist() for bc, counts in
+                     exp_barcodes.barcodes.items()})
+                self.assertEqual(obs['barcodes']['collisions'],
+                                 exp_barcodes.collisions)
+                self.assertEqual(obs['barcodes']['ambiguous'],
+                                 exp_barcodes.ambiguous)
+                self.assertEqual(obs['barcodes']['barcodes']['wbc'],
+                                 [0, 0, 0, 0, 1])
+                self.assertEqual(obs['barcodes']['collisions'], {})
+
     def test_format_fasta_record(self):
         exp = ">a\nxyz\n"
         obs = format_fasta_record("a", "xyz", 'ignored')
@@ -295,6 +856,41 @@ class DemuxTests(TestCase):
         obs = list(to_ascii(self.hdf5_file, samples=['a', 'b']))
         self.assertEqual(obs, exp)
 
+    def test_format_block(self):
+        obs = format_block('a', np.array([0, 5]), np.array(['xyz', 'x']),
+                           np.array([[32, 33, 34], [35, 0, 0]]),
+                           np.array(['abc', 'abw']), np.array(['abc', 'wbc']),
+                           np.array([0, 4]))
+        # the padding of the qual scores is dropped
+        self.assertEqual([''.join(r) for r in obs],
+                         ["@a_0 orig_bc=abc new_bc=abc bc_diffs=0\nxyz\n+\n"
+                          "ABC\n",
+                          "@a_5 orig_bc=abw new_bc=wbc bc_diffs=4\nx\n+\nD\n"])
+
+        obs = format_block('a', np.array([0]), np.array(['xyz']), None,
+                           np.array(['abc']), np.array(['abc']),
+                           np.array([0]))
+        self.assertEqual([''.join(r) for r in obs],
+                         [">a_0 orig_bc=abc new_bc=abc bc_diffs=0\nxyz\n"])
+
+    def test_write_ascii(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file)
+
+        fd, fp = tempfile.mkstemp(suffix='.fastq.gz')
+        os.close(fd)
+        self.to_remove.append(fp)
+        with gzip.open(fp, 'w') as fh:
+            write_ascii(self.hdf5_file, fh, samples=['b', 'a'])
+        with gzip.open(fp) as fh:
+            obs = fh.read()
+
+        exp = ''.join(to_ascii(self.hdf5_file, samples=['b', 'a']))
+        self.assertEqual(obs, exp)
+        self.assertTrue(obs.startswith('@b_0 orig_bc=abw'))
+
     def test_to_per_sample_ascii(self):
         with tempfile.NamedTemporaryFile('r+', suffix='.fq',
                                          delete=False) as f:
@@ -315,8 +911,95 @@ class DemuxTests(TestCase):
         self.assertEqual(obs, exp)
 
     def test_fetch(self):
-        # implicitly tested with test_to_ascii
-        pass
+        with tempfile.NamedTemporaryFile('r+', suffix='.fna') as f:
+            f.write(seqdata)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file)
+
+        obs = list(fetch(self.hdf5_file, samples=['b', 'c']))
+        self.assertEqual(obs, [('b', 0, 'xyz', None, 'abx', 'xbc', 1),
+                               ('b', 1, 'abcd', None, 'abw', 'wbc', 4)])
+
+    def test_fetch_k(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file)
+
+        full = list(fetch(self.hdf5_file))
+        for plan_reads in (True, False):
+            np.random.seed(0)
+            obs = list(fetch(self.hdf5_file, k=1, plan_reads=plan_reads))
+            # sample a only has a sequence
+            self.assertEqual(len(obs), 2)
+            for rec in obs:
+                exp = [r for r in full if r[:2] == rec[:2]][0]
+                self.assertEqual(rec[2], exp[2])
+                npt.assert_equal(rec[3], exp[3])
+                self.assertEqual(rec[4:], exp[4:])
+
+        self.assertEqual(list(fetch(self.hdf5_file, k=3)), [])
+
+    def test_sample_indices(self):
+        np.random.seed(0)
+        for n, k in ((10, 10), (10, 8), (1000, 10), (5, 0)):
+            obs = _sample_indices(n, k)
+            self.assertEqual(obs.size, k)
+            self.assertEqual(np.unique(obs).size, k)
+            npt.assert_equal(obs, np.sort(obs))
+            self.assertTrue(((obs >= 0) & (obs < n)).all())
+
+    def test_read_rows(self):
+        data = np.arange(40).reshape(20, 2)
+        dset = self.hdf5_file.create_dataset('data', data=data, chunks=(3, 2))
+        indices = np.array([0, 2, 3, 10, 19])
+        npt.assert_equal(_read_rows(dset, indices), data[indices])
+        npt.assert_equal(_read_rows(dset, indices, plan_reads=False),
+                         data[indices])
+        npt.assert_equal(_read_rows(dset, slice(2, 5)), data[2:5])
+
+    def test_row_blocks(self):
+        grp = self.hdf5_file.create_group('a')
+        grp.attrs['n'] = 10
+        grp.create_dataset('qual', shape=(10, 5), dtype=np.uint8,
+                           chunks=(3, 5))
+        self.assertEqual(_row_blocks(grp, 3), [(0, 3), (3, 6), (6, 9),
+                                               (9, 10)])
+        self.assertEqual(_row_blocks(grp, 4), [(0, 6), (6, 10)])
+        self.assertEqual(_row_blocks(grp, 20), [(0, 10)])
+
+    def test_fetch_blocks(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(fqdata)
+            f.flush()
+            to_hdf5(f.name, self.hdf5_file)
+
+        exp = list(fetch(self.hdf5_file))
+        obs = list(fetch(self.hdf5_file, block_size=1))
+        self.assertEqual(len(obs), len(exp))
+        for o, e in zip(obs, exp):
+            self.assertEqual(o[:3], e[:3])
+            npt.assert_equal(o[3], e[3])
+            self.assertEqual(o[4:], e[4:])
+
+    def test_fetch_blocks_sequences_only(self):
+        for compact in (False, True):
+            demux = h5py.File('test_%s' % compact, driver='core',
+                              backing_store=False)
+            with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+                f.write(fqdata_lengths)
+                f.flush()
+                to_hdf5(f.name, demux, compact=compact)
+            exp = list(fetch_blocks(demux))
+            obs = list(fetch_blocks(demux, sequences_only=True))
+            demux.close()
+
+            self.assertEqual(len(obs), len(exp))
+            for o, e in zip(obs, exp):
+                self.assertEqual(o[0], e[0])
+                npt.assert_equal(o[1], e[1])
+                npt.assert_equal(o[2], e[2])
+                self.assertEqual(o[3:], (None, None, None, None))
 
 
 seqdata = """>a_1 orig_bc=abc new_bc=abc bc_diffs=0
@@ -357,5 +1040,23 @@ qwe
 DEF
 """
 
+fqdata_lengths = """@a_1 orig_bc=abc new_bc=abc bc_diffs=0
+xyz
++
+ABC
+@a_2 orig_bc=abw new_bc=wbc bc_diffs=4
+xy
++
+DF
+@b_1 orig_bc=abw new_bc=wbc bc_diffs=4
+qwe
++
+DEF
+@a_3 orig_bc=abx new_bc=xbc bc_diffs=1
+x
++
+D
+"""
+
 if __name__ == '__main__':
     main()
@@ -20,7 +20,7 @@ from xml.dom import minidom
 from xml.etree import ElementTree as ET
 
 from qiita_ware.ebi import (SampleAlreadyExistsError, NoXMLError,
-                            EBISubmission)
+                            EBISubmission, _write_xml_element)
 from qiita_core.qiita_settings import qiita_config
 
 
@@ -310,6 +310,17 @@ class TestEBISubmission(TestCase):
         self.assertEqual(obs, exp)
         remove('testfile')
 
+        def iter_elements():
+            for i in range(2):
+                yield ET.Element('CHILD', {'n': str(i)})
+        e._write_xml_file(lambda: elm, 'thing', 'testfile',
+                          iter_elements_fn=iter_elements)
+        obs = open('testfile').read()
+        exp = ('<?xml version="1.0" encoding="UTF-8"?><TESTING foo="bar">'
+               '<CHILD n="0"/><CHILD n="1"/></TESTING>')
+        self.assertEqual(obs, exp)
+        remove('testfile')
+
     def test_write_study_xml(self):
         submission = EBISubmission('001', 'teststudy', 'test asbstract',
                                    investigation_type='Other',
@@ -452,6 +463,33 @@ class TestEBISubmission(TestCase):
         self.assertEqual(obs, exp_with_cert)
 
 
+class TestWriteXMLElement(TestCase):
+    def write(self, element, subelements=None):
+        fh = StringIO()
+        _write_xml_element(fh, element, subelements)
+        return fh.getvalue()
+
+    def test_write_xml_element(self):
+        root = ET.Element('ROOT', {'b': 'x "y" <z>', 'a': '&'})
+        ET.SubElement(root, 'EMPTY')
+        ET.SubElement(root, 'TEXT').text = u'caf\xe9 & <b>'
+        obs = self.write(root)
+        exp = ('<ROOT a="&amp;" b="x &quot;y&quot; &lt;z&gt;"><EMPTY/>'
+               '<TEXT>caf\xc3\xa9 &amp; &lt;b&gt;</TEXT></ROOT>')
+        self.assertEqual(obs, exp)
+        self.assertEqual(obs, minidom.parseString(
+            ET.tostring(root)).documentElement.toxml(encoding='UTF-8'))
+
+    def test_write_xml_element_subelements(self):
+        root = ET.Element('ROOT')
+        ET.SubElement(root, 'FIRST')
+        obs = self.write(root, iter([ET.Element('SECOND')]))
+        self.assertEqual(obs, '<ROOT><FIRST/><SECOND/></ROOT>')
+
+        obs = self.write(ET.Element('ROOT'), iter([]))
+        self.assertEqual(obs, '<ROOT></ROOT>')
+
+
 SAMPLEXML = """<?xml version="1.0" encoding="UTF-8"?>
 <SAMPLE_SET xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noName\
 spaceSchemaLocation="ftp://ftp.sra.ebi.ac.uk/meta/xsd/sra_1_3/SRA.sample.xsd">
@@ -343,7 +343,7 @@ class ProcessingPipelineTests(TestCase):
         db_path_builder = partial(join, join(self.db_dir, "preprocessed_data"))
 
         file_suffixes = ['seqs.fna', 'seqs.fastq', 'seqs.demux',
-                         'split_library_log.txt']
+                         'split_library_log.txt', 'demux_summary.json']
         db_files = []
         for f_suff in file_suffixes:
             fp = path_builder(f_suff)
@@ -375,6 +375,7 @@ class ProcessingPipelineTests(TestCase):
         exp_fp = join(prep_out_dir, 'seqs.demux')
         self.assertEqual(obs_fp, exp_fp)
         self.assertTrue(exists(exp_fp))
+        self.assertTrue(exists(join(prep_out_dir, 'demux_summary.json')))
 
     def test_get_process_target_gene_cmd(self):
         preprocessed_data = PreprocessedData(1)
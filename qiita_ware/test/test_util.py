@@ -16,11 +16,13 @@ import tempfile
 
 import h5py
 import numpy as np
+import numpy.testing as npt
 from future.utils.six import StringIO, BytesIO
 
 from qiita_db.metadata_template import SampleTemplate, PrepTemplate
+from qiita_ware.demux import to_hdf5
 from qiita_ware.util import (per_sample_sequences, stats_from_df, open_file,
-                             _is_string_or_bytes)
+                             _is_string_or_bytes, _reservoir)
 
 
 def mock_sequence_iter(items):
@@ -33,8 +35,7 @@ class UtilTests(TestCase):
 
     def test_per_sample_sequences_simple(self):
         max_seqs = 10
-        # note, the result here is sorted by sequence_id but is in heap order
-        # by the random values associated to each sequence
+        # all the sequences fit in the reservoirs
         exp = sorted([('b_2', 'AATTGGCC-b2'),
                       ('a_5', 'AATTGGCC-a5'),
                       ('a_1', 'AATTGGCC-a1'),
@@ -52,8 +53,7 @@ class UtilTests(TestCase):
         max_seqs = 10
         min_seqs = 3
 
-        # note, the result here is sorted by sequence_id but is in heap order
-        # by the random values associated to each sequence
+        # b only has 2 sequences
         exp = sorted([('a_5', 'AATTGGCC-a5'),
                       ('a_1', 'AATTGGCC-a1'),
                       ('a_4', 'AATTGGCC-a4'),
@@ -70,13 +70,73 @@ class UtilTests(TestCase):
         max_seqs = 2
         exp = sorted([('b_2', 'AATTGGCC-b2'),
                       ('b_1', 'AATTGGCC-b1'),
-                      ('a_2', 'AATTGGCC-a2'),
-                      ('a_3', 'AATTGGCC-a3'),
+                      ('a_1', 'AATTGGCC-a1'),
+                      ('a_4', 'AATTGGCC-a4'),
                       ('c_1', 'AATTGGCC-c1'),
-                      ('c_2', 'AATTGGCC-c2')])
+                      ('c_3', 'AATTGGCC-c3')])
         obs = per_sample_sequences(mock_sequence_iter(sequences), max_seqs)
         self.assertEqual(sorted(obs), exp)
 
+    def test_per_sample_sequences_demux(self):
+        with tempfile.NamedTemporaryFile('r+', suffix='.fq') as f:
+            f.write(demux_seqs)
+            f.flush()
+            demux = h5py.File('demux', driver='core', backing_store=False)
+            to_hdf5(f.name, demux)
+
+        obs = sorted(per_sample_sequences(demux, 2))
+        demux.close()
+        self.assertEqual([sid.rsplit('_', 1)[0] for sid, _ in obs],
+                         ['a', 'a', 'b', 'b'])
+        for sid, seq in obs:
+            sample, idx = sid.rsplit('_', 1)
+            self.assertEqual(seq, seqs_by_sample[sample][int(idx)])
+
+    def test_reservoir(self):
+        # each record is as likely to be kept as any other
+        counts = np.zeros(20)
+        for _ in range(2000):
+            reservoir = _reservoir(5)
+            for i in range(20):
+                reservoir.add(i)
+            kept = reservoir.sample()
+            self.assertEqual(len(set(kept)), 5)
+            counts[list(kept)] += 1
+        npt.assert_allclose(counts / 2000, 0.25, atol=0.05)
+
+    def test_reservoir_random(self):
+        # draws of 0.0 are discarded so the value is never 1.0
+        draws = iter([0.0, 0.0, 0.25, 0.0, 0.5, 0.0, 0.5])
+        random_sample = np.random.random_sample
+        np.random.random_sample = lambda: next(draws)
+        try:
+            reservoir = _reservoir(1)
+            self.assertEqual(reservoir._random(), 0.75)
+            reservoir.add(1)
+            self.assertEqual(reservoir._w, 0.5)
+            self.assertEqual(reservoir._next, 2)
+        finally:
+            np.random.random_sample = random_sample
+
+    def test_reservoir_blocks(self):
+        # the blocks keep the same records as the records one at a time
+        np.random.seed(0)
+        exp = _reservoir(10)
+        for i in range(1000):
+            exp.add((i, str(i)))
+
+        np.random.seed(0)
+        obs = _reservoir(10)
+        for start in range(0, 1000, 7):
+            block = np.arange(start, min(start + 7, 1000))
+            obs.add_block(block, block.astype(str))
+        self.assertEqual(obs.n, 1000)
+        self.assertEqual(list(obs.sample()), list(exp.sample()))
+
+        reservoir = _reservoir(10)
+        reservoir.add_block(np.arange(3))
+        self.assertEqual(list(reservoir.sample()), [(0,), (1,), (2,)])
+
     def test_stats_from_df(self):
         obs = stats_from_df(SampleTemplate(1).to_dataframe())
         for k in obs:
@@ -187,20 +247,43 @@ class TestFilePathOpening(TestCase):
 
         os.remove(name)
 
-# comment indicates the expected random value
 sequences = [
-    ('a_1', 'AATTGGCC-a1'),  # 2, 3624216819017203053
-    ('a_2', 'AATTGGCC-a2'),  # 5, 5278339153051796802
-    ('b_1', 'AATTGGCC-b1'),  # 4, 4184670734919783522
-    ('b_2', 'AATTGGCC-b2'),  # 0, 946590342492863505
-    ('a_4', 'AATTGGCC-a4'),  # 3, 4048487933969823850
-    ('a_3', 'AATTGGCC-a3'),  # 7, 7804936597957240377
-    ('c_1', 'AATTGGCC-c1'),  # 8, 8868534167180302049
-    ('a_5', 'AATTGGCC-a5'),  # 1, 3409506807702804593
-    ('c_2', 'AATTGGCC-c2'),  # 9, 8871627813779918895
-    ('c_3', 'AATTGGCC-c3')   # 6, 7233291490207274528
+    ('a_1', 'AATTGGCC-a1'),
+    ('a_2', 'AATTGGCC-a2'),
+    ('b_1', 'AATTGGCC-b1'),
+    ('b_2', 'AATTGGCC-b2'),
+    ('a_4', 'AATTGGCC-a4'),
+    ('a_3', 'AATTGGCC-a3'),
+    ('c_1', 'AATTGGCC-c1'),
+    ('a_5', 'AATTGGCC-a5'),
+    ('c_2', 'AATTGGCC-c2'),
+    ('c_3', 'AATTGGCC-c3')
 ]
 
+demux_seqs = """@a_1 orig_bc=abc new_bc=abc bc_diffs=0
+AAT
++
+ABC
+@b_1 orig_bc=abw new_bc=wbc bc_diffs=4
+CCGG
++
+DFGH
+@a_2 orig_bc=abc new_bc=abc bc_diffs=0
+GGT
++
+ABC
+@a_3 orig_bc=abc new_bc=abc bc_diffs=0
+TTTA
++
+ABCD
+@b_2 orig_bc=abw new_bc=wbc bc_diffs=4
+CA
++
+DF
+"""
+
+seqs_by_sample = {'a': ['AAT', 'GGT', 'TTTA'], 'b': ['CCGG', 'CA']}
+
 SUMMARY_STATS = {
     'altitude': [('0.0', 27)],
     'anonymized_name': [('SKB1', 1),
@@ -8,9 +8,7 @@ from __future__ import division
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
-import sys
-from collections import defaultdict
-from heapq import heappush, heappop
+from math import exp, floor, log
 from contextlib import contextmanager
 
 import h5py
@@ -20,19 +18,132 @@ from future.utils import viewitems
 from natsort import natsorted
 
 
-def per_sample_sequences(iter_, max_seqs, min_seqs=1, random_buf_size=100000):
+class _reservoir(object):
+    """Keeps a uniform random sample of the records offered to it
+
+    Notes
+    -----
+    This is Algorithm L [1]_: once the reservoir is full, the number of
+    records to skip until the next one is kept is drawn at once, so no random
+    value is drawn and nothing is done for the records skipped. Keeping k out
+    of N records takes O(k(1 + log(N/k))) random draws.
+
+    References
+    ----------
+    .. [1] Li, K.-H. Reservoir-sampling algorithms of time complexity
+       O(n(1 + log(N/n))). ACM Transactions on Mathematical Software 20, 4
+       (1994), 481-493.
+    """
+    def __init__(self, k):
+        """Construct thy self
+
+        Parameters
+        ----------
+        k : unsigned int
+            The number of records to keep
+        """
+        self.k = k
+        self.n = 0
+        self.items = np.empty(k, dtype=object)
+
+        # the index of the next record kept
+        self._next = 0
+        self._filled = 0
+        self._w = 1.0
+
+    def _random(self):
+        """A random value in (0, 1)"""
+        # random_sample draws from [0, 1), and 1.0 would make the weight 1
+        # so that log(1 - w) isn't defined
+        u = np.random.random_sample()
+        while u == 0.0:
+            u = np.random.random_sample()
+        return 1.0 - u
+
+    def _keep(self, item):
+        """Keep a record and pick the next one"""
+        if self._filled < self.k:
+            self.items[self._filled] = item
+            self._filled += 1
+            if self._filled < self.k:
+                self._next += 1
+                return
+            self._w = exp(log(self._random()) / self.k)
+        else:
+            self.items[np.random.randint(self.k)] = item
+            self._w *= exp(log(self._random()) / self.k)
+
+        self._next += int(floor(log(self._random()) / log(1 - self._w))) + 1
+
+    def add(self, item):
+        """Offer a record
+
+        Parameters
+        ----------
+        item : object
+            The record
+        """
+        if self.n == self._next:
+            self._keep(item)
+        self.n += 1
+
+    def add_block(self, *columns):
+        """Offer a block of records
+
+        Parameters
+        ----------
+        columns : sequences
+            The fields of the records, one sequence per field, all of the same
+            length. Only the kept records are read from them, as a tuple of
+            their fields.
+        """
+        size = len(columns[0])
+        while self._next < self.n + size:
+            pos = self._next - self.n
+            self._keep(tuple(column[pos] for column in columns))
+        self.n += size
+
+    def sample(self):
+        """The records kept, in no particular order"""
+        return self.items[:self._filled]
+
+
+def _demux_reservoirs(demux, max_seqs):
+    """Fill the reservoirs of the samples of a demux file
+
+    Returns
+    -------
+    dict
+        {sample_id: _reservoir} where the reservoirs hold (sequence_id,
+        sequence) records
+    """
+    from qiita_ware.demux import fetch_blocks
+
+    reservoirs = {}
+    for sample, indices, seqs, _, _, _, _ in fetch_blocks(
+            demux, sequences_only=True):
+        if sample not in reservoirs:
+            reservoirs[sample] = _reservoir(max_seqs)
+        reservoirs[sample].add_block(indices, seqs)
+
+    # only the IDs of the sequences kept are formatted
+    for sample, reservoir in viewitems(reservoirs):
+        for i, (idx, seq) in enumerate(reservoir.sample()):
+            reservoir.items[i] = ('%s_%d' % (sample, idx), seq)
+    return reservoirs
+
+
+def per_sample_sequences(iter_, max_seqs, min_seqs=1):
     """Get a max random subset of per sample sequences
 
     Parameters
     ----------
-    iter_ : skbio.parse.sequences.SequenceIterator
-        The sequences to walk over
+    iter_ : skbio.parse.sequences.SequenceIterator or h5py.File
+        The sequences to walk over, or a demux file
     max_seqs : unsigned int
         The maximum number of sequences per sample.
     min_seqs : unsigned int, optional
         The minimum number of sequences that must exist in a sample.
-    random_buf_size : unsigned int, optional
-        The size of the random value buffer.
 
     Notes
     -----
@@ -43,7 +154,9 @@ def per_sample_sequences(iter_, max_seqs, min_seqs=1, random_buf_size=100000):
     of samples.
 
     All sequences associated to a sample have an equal probability of being
-    retained.
+    retained. The sequences are kept with a reservoir per sample, see
+    `_reservoir`, and a demux file is read in blocks of rows with
+    `qiita_ware.demux.fetch_blocks`.
 
     Raises
     ------
@@ -63,37 +176,23 @@ def per_sample_sequences(iter_, max_seqs, min_seqs=1, random_buf_size=100000):
     if min_seqs < 1 or max_seqs < 1:
         raise ValueError("min_seqs and max_seqs must be > 0!")
 
-    # buffer some random values
-    random_values = np.random.randint(0, sys.maxint, random_buf_size)
-    random_idx = 0
-
-    result = defaultdict(list)
-    for record in iter_:
-        # get sequence ID, sample_id, sequence and heap
-        sequence_id = record['SequenceID']
-        sample_id = sequence_id.rsplit('_', 1)[0]
-        sequence = record['Sequence']
-        heap = result[sample_id]
-
-        # pull a random value, and recompute random values if we've consumed
-        # our buffer
-        random_value = random_values[random_idx]
-        random_idx += 1
-        if random_idx >= random_buf_size:
-            random_values = np.random.randint(0, sys.maxint, random_buf_size)
-            random_idx = 0
-
-        # push our sequence on to the heap and drop the smallest if necessary
-        heappush(heap, (random_value, sequence_id, sequence))
-        if len(heap) > max_seqs:
-            heappop(heap)
+    if isinstance(iter_, h5py.Group):
+        reservoirs = _demux_reservoirs(iter_, max_seqs)
+    else:
+        reservoirs = {}
+        for record in iter_:
+            sequence_id = record['SequenceID']
+            sample_id = sequence_id.rsplit('_', 1)[0]
+            if sample_id not in reservoirs:
+                reservoirs[sample_id] = _reservoir(max_seqs)
+            reservoirs[sample_id].add((sequence_id, record['Sequence']))
 
     # yield the sequences
-    for sid, heap in viewitems(result):
-        if len(heap) < min_seqs:
+    for sid, reservoir in viewitems(reservoirs):
+        if reservoir.n < min_seqs:
             continue
 
-        for _, sequence_id, sequence in heap:
+        for sequence_id, sequence in reservoir.sample():
             yield (sequence_id, sequence)
 
 
@@ -3,6 +3,7 @@ from __future__ import division
 from shutil import rmtree
 from os import remove
 from sys import stderr
+from resource import getrusage, RUSAGE_CHILDREN
 
 from skbio.util import flatten
 import networkx as nx
@@ -11,6 +12,12 @@ from moi.job import system_call, submit, ctxs, ctx_default
 from qiita_db.job import Job
 
 
+def _children_cpu_time():
+    """Returns the CPU time, in seconds, used by the terminated children"""
+    usage = getrusage(RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
 def system_call_from_job(job_id, **kwargs):
     """Executes a system call described by a Job
 
@@ -18,6 +25,11 @@ def system_call_from_job(job_id, **kwargs):
     ----------
     job_id : int
         The job object ID
+
+    Notes
+    -----
+    The CPU time spent by the system call is stored in the job, so it is known
+    how much time is saved when its results are reused
     """
     job = Job(job_id)
     name, command = job.command
@@ -27,6 +39,8 @@ def system_call_from_job(job_id, **kwargs):
     cmd.extend(flatten(options.items()))
     cmd_fmt = ' '.join((str(i) for i in cmd))
 
+    job.status = 'running'
+    start = _children_cpu_time()
     try:
         so, se, status = system_call(cmd_fmt)
     except Exception as e:
@@ -35,6 +49,8 @@ def system_call_from_job(job_id, **kwargs):
 
     # FIX THIS add_results should not be hard coded  Issue #269
     job.add_results([(job.options["--output_dir"], "directory")])
+    job.cpu_time = _children_cpu_time() - start
+    job.status = 'completed'
 
 
 class ParallelWrapper(object):